@@ -45,6 +45,60 @@ class Config:
     # SendGrid API key (alternative to SMTP - for future use)
     SENDGRID_API_KEY = os.environ.get('SENDGRID_API_KEY', os.environ.get('MAIL_PASSWORD', ''))
     
+    # Server-sent event streams: bell notifications and live seat maps (see maua/streams.py)
+    # Off by default: clients poll the bell delta endpoint and seats.json instead. Each open
+    # stream holds a gunicorn thread for its whole lifetime and only sees events from its own
+    # worker, so only turn streams on after sizing threads for them (see gunicorn.conf.py).
+    # The cap is shared by every stream in a worker process.
+    EVENT_STREAMS_ENABLED = os.environ.get('EVENT_STREAMS_ENABLED', 'false').lower() == 'true'
+    EVENT_STREAM_MAX_SUBSCRIBERS = int(os.environ.get('EVENT_STREAM_MAX_SUBSCRIBERS', 2))
+    EVENT_STREAM_LIFETIME = 300  # Seconds before a stream is recycled (client reconnects)
+    EVENT_STREAM_KEEPALIVE = 20  # Seconds between keepalive comments
+    
+    # Notification retention (see maua/notifications/retention.py)
+    NOTIFICATION_RETENTION_READ_DAYS = int(os.environ.get('NOTIFICATION_RETENTION_READ_DAYS', 30))
+    NOTIFICATION_RETENTION_UNREAD_DAYS = int(os.environ.get('NOTIFICATION_RETENTION_UNREAD_DAYS', 90))
+    NOTIFICATION_ARCHIVE_BATCH_SIZE = 1000
+    
+    # Trip reminders (see maua/notifications/reminders.py)
+    TRIP_REMINDER_LEAD_HOURS = int(os.environ.get('TRIP_REMINDER_LEAD_HOURS', 24))
+    TRIP_REMINDER_BUCKET_MINUTES = 60
+    TRIP_REMINDER_BATCH_SIZE = 100
+    
+    # SMS deduplication / coalescing (see maua/notifications/coalesce.py)
+    SMS_DEDUP_WINDOW = int(os.environ.get('SMS_DEDUP_WINDOW', 300))  # seconds
+    SMS_COALESCE_WINDOW = int(os.environ.get('SMS_COALESCE_WINDOW', 5))  # seconds, 0 disables
+    SMS_COALESCE_MAX_CHARS = 459  # three concatenated SMS segments
+    
+    # Parcel photos (see maua/parcels/photos.py)
+    PARCEL_PHOTO_THUMB_SIZE = 240  # px, longest edge
+    PARCEL_PHOTO_WEB_SIZE = 1280
+    PARCEL_REF_BLOCK_SIZE = 100  # reference numbers each worker reserves at a time
+    PARCEL_BULK_MAX_ROWS = 500  # parcels per bulk intake batch
+    PARCEL_DEFAULT_WEIGHT_KG = 1.0  # assumed for dispatch packing when no weight was recorded
+    # Parcel tariff: base + per_km * distance * band multiplier, rounded up (see parcels.pricing)
+    PARCEL_TARIFF_BASE = 100  # KES
+    PARCEL_TARIFF_PER_KM = 0.5  # KES per km for the lightest band
+    PARCEL_WEIGHT_BANDS = ((2, 1.0), (5, 1.5), (10, 2.0), (25, 3.0), (50, 4.5))  # (up to kg, multiplier)
+    PARCEL_TARIFF_EXTRA_PER_KG = 20  # KES per kg above the top band
+    PARCEL_TARIFF_ROUNDING = 10
+    PARCEL_TARIFF_TTL = 300  # seconds before a worker rebuilds the table anyway
+    # Public tracking pages (see parcels.tracking)
+    PUBLIC_TRACKING_CACHE_TTL = 30  # seconds a rendered page is reused for anonymous visitors
+    PUBLIC_TRACKING_CACHE_SIZE = 1000
+    PUBLIC_TRACKING_RATE_LIMIT = True
+    PUBLIC_TRACKING_RATE = 1.0  # lookups per second per IP, sustained
+    PUBLIC_TRACKING_BURST = 20
+    RATE_LIMIT_PROXY_HOPS = int(os.environ.get('RATE_LIMIT_PROXY_HOPS', 0))  # trusted proxies in X-Forwarded-For
+    TRACKING_ETAG_SALT = os.environ.get('RENDER_GIT_COMMIT', '')  # new deploys invalidate old ETags
+    
+    # Completed-trip export (see maua/catalog/archive.py)
+    TRIP_ARCHIVE_BATCH_SIZE = 500  # trips moved to the archive per transaction
+    
+    # Recurring timetables (see maua/catalog/timetable.py)
+    TIMETABLE_HORIZON_DAYS = int(os.environ.get('TIMETABLE_HORIZON_DAYS', 14))  # days of trips kept on the board
+    ALLOCATION_DEFAULT_TRIP_HOURS = 4  # how long a trip holds its vehicle/driver when no ETA or route duration is known
+    
     # M-Pesa settings
     BASE_URL = os.environ.get('BASE_URL') or 'http://localhost:5000'
     
@@ -90,10 +144,15 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    SMS_COALESCE_WINDOW = 0
+    PUBLIC_TRACKING_RATE_LIMIT = False
+    # SQLite does not accept the pool sizing options used for Postgres
+    SQLALCHEMY_ENGINE_OPTIONS = {}
 
 
 class ProductionConfig(Config):
     DEBUG = False
+    RATE_LIMIT_PROXY_HOPS = int(os.environ.get('RATE_LIMIT_PROXY_HOPS', 1))  # Render's load balancer
     SESSION_COOKIE_SECURE = True
     REMEMBER_COOKIE_SECURE = True
     SESSION_COOKIE_HTTPONLY = True
@@ -8,6 +8,12 @@ bind = '0.0.0.0:10000'  # Use the PORT environment variable if set, otherwise de
 workers = 2  # Increased to 2 workers for better concurrency
 worker_class = 'gthread'  # Use threads for I/O-bound applications
 threads = 3  # Increased to 3 threads per worker
+# Live updates (EVENT_STREAMS_ENABLED) hold one thread per open stream for up to
+# EVENT_STREAM_LIFETIME seconds, and browsers reconnect as soon as a stream ends.
+# With streams on, size threads as EVENT_STREAM_MAX_SUBSCRIBERS plus the threads
+# normal traffic needs (at least 3), e.g. threads = 7 with a cap of 4. A staff
+# seat map alone opens two streams (bell + seats). Leave streams off otherwise:
+# pages then poll the delta and seats.json endpoints.
 worker_connections = 1000
 max_requests = 1000  # Increased to reduce restart frequency
 max_requests_jitter = 100  # Add jitter to prevent all workers from restarting simultaneously
@@ -33,3 +39,11 @@ proc_name = 'maua-sacco'
 
 # Debugging
 reload = False  # Don't use in production, only for development
+
+
+# Server hooks
+def worker_exit(server, worker):
+    """Send SMS still held for coalescing before a recycled or redeployed worker goes away"""
+    from maua.notifications.coalesce import SmsCoalescer
+
+    SmsCoalescer.flush_all()
@@ -2,7 +2,7 @@ from flask_migrate import Migrate
 from maua import create_app, db
 from maua.auth.models import User
 from maua.booking.models import Booking, Ticket
-from maua.catalog.models import Depot, Route, Vehicle, Trip, Parcel
+from maua.catalog.models import Depot, Route, Vehicle, Trip
 from maua.payment.models import Payment
 import click
 
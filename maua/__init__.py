@@ -38,6 +38,7 @@ def create_app(config_class='config.DevelopmentConfig'):
     from maua.catalog.routes import bp as catalog_bp
     from maua.staff import staff_bp
     from maua.notifications.routes import notifications_bp
+    from maua.stats import stats_bp
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(main_bp)
@@ -49,6 +50,7 @@ def create_app(config_class='config.DevelopmentConfig'):
     app.register_blueprint(catalog_bp, url_prefix='/catalog')
     app.register_blueprint(staff_bp, url_prefix='/staff')
     app.register_blueprint(notifications_bp)
+    app.register_blueprint(stats_bp)
     
     # Create upload folder if it doesn't exist
     os.makedirs(os.path.join(app.instance_path, 'uploads'), exist_ok=True)
@@ -60,5 +62,6 @@ def create_app(config_class='config.DevelopmentConfig'):
         from maua.booking import models as booking_models
         from maua.payment import models as payment_models
         from maua.notifications import models as notification_models
+        from maua.stats import models as stats_models  # noqa: F401 - registers stat_counters for create_all/migrations
     
     return app
\ No newline at end of file
@@ -24,19 +24,15 @@ def admin_required(f):
 @login_required
 @admin_required
 def dashboard():
-    # Get counts for dashboard
-    staff_count = User.query.filter(
-        (User.is_staff == True) | (User.is_admin == True)
-    ).count()
-    routes_count = Route.query.filter_by(active=True).count()
-    vehicles_count = Vehicle.query.filter_by(active=True).count()
-    depots_count = Depot.query.count()
+    # Counts come from the materialized counters (one query, see stats.counters)
+    from maua.stats.counters import snapshot
+    counts = snapshot('staff_users', 'routes_active', 'vehicles_active', 'depots_total')
     
     return render_template('admin/dashboard.html',
-                         staff_count=staff_count,
-                         routes_count=routes_count,
-                         vehicles_count=vehicles_count,
-                         depots_count=depots_count)
+                         staff_count=counts['staff_users'],
+                         routes_count=counts['routes_active'],
+                         vehicles_count=counts['vehicles_active'],
+                         depots_count=counts['depots_total'])
 
 
  
@@ -50,6 +46,7 @@ def routes_manage():
         code = request.form.get('code')
         origin = request.form.get('origin', '').strip()
         destination = request.form.get('destination', '').strip()
+        distance_km = request.form.get('distance_km', type=float)
         
         if not all([code, origin, destination]):
             flash('All fields are required.', 'danger')
@@ -80,6 +77,7 @@ def routes_manage():
                     code=code,
                     origin_depot_id=origin_depot.id,
                     destination_depot_id=destination_depot.id,
+                    distance_km=distance_km,
                     active=True
                 )
                 db.session.add(route)
@@ -120,6 +118,7 @@ def routes_edit(route_id: int):
         r.code = request.form.get('code')
         r.origin_depot_id = request.form.get('origin_id', type=int)
         r.destination_depot_id = request.form.get('destination_id', type=int)
+        r.distance_km = request.form.get('distance_km', type=float)
         try:
             db.session.commit()
             flash('Route updated.', 'success')
@@ -182,6 +181,9 @@ def vehicles_edit(vehicle_id: int):
         layout = [{'seat': t} for t in seats_text.split()] if seats_text else []
         v.seat_layout = layout
         v.seat_count = len(layout)
+        cargo_capacity_kg = request.form.get('cargo_capacity_kg', type=float)
+        if cargo_capacity_kg is not None and cargo_capacity_kg >= 0:
+            v.cargo_capacity_kg = cargo_capacity_kg
         try:
             db.session.commit()
             flash('Vehicle updated.', 'success')
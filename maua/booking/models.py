@@ -1,7 +1,16 @@
+from collections import namedtuple
 from datetime import datetime, time
+from sqlalchemy import and_, case, func, insert, literal, or_, select, tuple_, update
+from sqlalchemy.orm import validates
 from maua.extensions import db
+from maua.notifications.sms import normalize_phone
 from maua.catalog.models import Trip
 
+# Booking statuses that take a seat (a reservation stops counting once its hold expires)
+SEAT_HOLDING_STATUSES = ('confirmed', 'reserved', 'checked_in', 'completed', 'pending_payment')
+
+TripOccupancy = namedtuple('TripOccupancy', 'total booked checked_in free')
+
 class Booking(db.Model):
     __tablename__ = "bookings"
     
@@ -20,10 +29,13 @@ class Booking(db.Model):
     passenger_sex = db.Column(db.String(10), nullable=False, default='other')  # 'male', 'female', 'other'
     passenger_age = db.Column(db.Integer, nullable=False, default=18)
     passenger_phone = db.Column(db.String(20), nullable=False, default='N/A')
+    passenger_phone_normalized = db.Column(db.String(30), index=True)  # normalize_phone(passenger_phone); same width as parcels
     # National ID Number
     passenger_id_number = db.Column(db.String(30), nullable=False, default='N/A')
     # Optional pickup location (if passenger will be fetched on the way)
     pickup_location = db.Column(db.String(255))
+    # Set when the pre-departure reminder has been dispatched (see notifications.reminders)
+    reminder_sent_at = db.Column(db.DateTime, nullable=True)
     
     # Relationships
     ticket = db.relationship('Ticket', backref='booking', uselist=False, lazy=True)
@@ -31,8 +43,145 @@ class Booking(db.Model):
     
     __table_args__ = (
         db.UniqueConstraint("trip_id", "seat_number", name="uq_trip_seat"),
+        db.Index("ix_bookings_passenger_profile", "passenger_phone_normalized", "passenger_name", "created_at"),
+        db.Index("ix_bookings_trip_created", "trip_id", "created_at", "id"),  # staff booking list paging
     )
     
+    @validates('passenger_phone')
+    def _normalize_passenger_phone(self, key, value):
+        self.passenger_phone_normalized = normalize_phone(value.strip()) if value and value != 'N/A' else None
+        return value
+    
+    @classmethod
+    def passenger_profiles(cls, search=None, after=None, limit=50):
+        """Passengers aggregated from bookings, most recently active first.
+        
+        One GROUP BY over (name, normalized phone), served by ix_bookings_passenger_profile.
+        Rows carry name, phone, phone_key, num_bookings and last_booking_at; `after` is the
+        (last_booking_at, name, phone_key) of the previous page's last row (keyset paging).
+        """
+        phone_key = func.coalesce(cls.passenger_phone_normalized, '')
+        last_booking_at = func.max(cls.created_at)
+        query = select(
+            cls.passenger_name.label('name'),
+            func.max(cls.passenger_phone).label('phone'),
+            phone_key.label('phone_key'),
+            func.count(cls.id).label('num_bookings'),
+            last_booking_at.label('last_booking_at'),
+        ).group_by(cls.passenger_name, phone_key)
+        
+        search = (search or '').strip()
+        if search:
+            digits = ''.join(ch for ch in search if ch.isdigit())
+            if len(digits) >= 6 and not any(ch.isalpha() for ch in search):
+                phone = normalize_phone(search)
+                if len(phone) == 13 and phone.startswith('+254'):
+                    query = query.where(cls.passenger_phone_normalized == phone)
+                else:
+                    query = query.where(cls.passenger_phone_normalized.like(f'%{digits}%'))
+            else:
+                query = query.where(cls.passenger_name.ilike(f'%{search}%'))
+        
+        if after is not None:
+            query = query.having(tuple_(last_booking_at, cls.passenger_name, phone_key) < tuple_(*after))
+        query = query.order_by(last_booking_at.desc(), cls.passenger_name.desc(), phone_key.desc()).limit(limit)
+        return db.session.execute(query).all()
+    
+    @classmethod
+    def occupancy(cls, trips):
+        """Seat counts for a set of trips: {trip_id: TripOccupancy(total, booked, checked_in, free)}.
+        
+        Booked and checked-in counts come from one GROUP BY over the trips' bookings;
+        totals come from each trip's vehicle layout, so load `Trip.vehicle` with the trips.
+        """
+        trips = list(trips)
+        counts = {}
+        if trips:
+            holding = and_(
+                cls.status.in_(SEAT_HOLDING_STATUSES),
+                or_(cls.hold_expires_at.is_(None), cls.hold_expires_at > datetime.utcnow()),
+            )
+            rows = db.session.execute(
+                select(
+                    cls.trip_id,
+                    func.count(case((holding, cls.id))),
+                    func.count(case((cls.status == 'checked_in', cls.id))),
+                ).where(cls.trip_id.in_({t.id for t in trips})).group_by(cls.trip_id)
+            )
+            counts = {trip_id: (booked, checked_in) for trip_id, booked, checked_in in rows}
+        
+        occupancy = {}
+        for trip in trips:
+            total = len(trip.vehicle.seat_layout or []) if trip.vehicle else 0
+            booked, checked_in = counts.get(trip.id, (0, 0))
+            occupancy[trip.id] = TripOccupancy(total, booked, checked_in, max(total - booked, 0))
+        return occupancy
+    
+    @classmethod
+    def fill_walk_ins(cls, trip):
+        """Book every free seat on `trip` as a checked-in walk-in; returns the seats filled.
+        
+        A cancelled booking still holds its (trip, seat) slot in uq_trip_seat, so
+        those rows are turned into walk-ins with one UPDATE; the remaining free
+        seats get one multi-row INSERT. Seats taken by an online booking after we
+        looked are skipped by ON CONFLICT on uq_trip_seat instead of failing the
+        whole fill. The caller commits.
+        """
+        seats = [s['seat'] for s in (trip.vehicle.seat_layout or [])] if trip.vehicle else []
+        walk_in = dict(
+            user_id=None,  # No user account (physical walk-in)
+            status='checked_in',
+            fare=trip.base_fare,
+            passenger_name='Walk-in Passenger',
+            passenger_sex='other',
+            passenger_age=0,
+            passenger_phone='N/A',
+            passenger_phone_normalized=None,
+            passenger_id_number='N/A',
+        )
+        reused = list(db.session.scalars(
+            update(cls).where(
+                cls.trip_id == trip.id,
+                cls.seat_number.in_(seats),
+                cls.status == 'cancelled',
+            ).values(
+                reference=literal(f'WI-{trip.id}-') + cls.seat_number,
+                hold_expires_at=None,
+                pickup_location=None,
+                reminder_sent_at=None,
+                **walk_in,
+            ).returning(cls.seat_number).execution_options(synchronize_session=False)
+        )) if seats else []
+        
+        taken = set(db.session.scalars(select(cls.seat_number).where(cls.trip_id == trip.id)))
+        rows = [dict(
+            walk_in,
+            trip_id=trip.id,
+            seat_number=seat,
+            reference=f'WI-{trip.id}-{seat}',
+            created_at=datetime.utcnow(),
+        ) for seat in seats if seat not in taken]
+        if not rows:
+            return reused
+        
+        dialect = db.session.get_bind(mapper=cls.__mapper__).dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            dialect_insert = None
+        if dialect_insert is not None:
+            statement = dialect_insert(cls).on_conflict_do_nothing(index_elements=['trip_id', 'seat_number'])
+            filled = list(db.session.scalars(statement.returning(cls.seat_number), rows))
+        else:
+            db.session.execute(insert(cls), rows)
+            filled = [row['seat_number'] for row in rows]
+        
+        from maua.stats import counters as stats
+        stats.adjust('bookings_total', len(filled))  # bulk INSERT skips the ORM counter hooks
+        return reused + filled
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -52,6 +201,43 @@ class Booking(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+class BookingArchive(db.Model):
+    """Cold storage for bookings of archived trips (see catalog.archive).
+
+    Rows keep their original id. There are no foreign keys; the payment id and
+    ticket status are kept so the booking can still be traced to its payment.
+    """
+    __tablename__ = "bookings_archive"
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    trip_id = db.Column(db.Integer, index=True)
+    user_id = db.Column(db.Integer)
+    seat_number = db.Column(db.String(5))
+    status = db.Column(db.String(20))
+    fare = db.Column(db.Numeric(10,2))
+    reference = db.Column(db.String(30), index=True)
+    created_at = db.Column(db.DateTime)
+    passenger_name = db.Column(db.String(100))
+    passenger_sex = db.Column(db.String(10))
+    passenger_age = db.Column(db.Integer)
+    passenger_phone = db.Column(db.String(20))
+    passenger_phone_normalized = db.Column(db.String(30), index=True)
+    passenger_id_number = db.Column(db.String(30))
+    pickup_location = db.Column(db.String(255))
+    payment_id = db.Column(db.Integer)
+    ticket_status = db.Column(db.String(20))
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Columns copied verbatim from the hot table
+    COPIED_COLUMNS = (
+        'id', 'trip_id', 'user_id', 'seat_number', 'status', 'fare', 'reference', 'created_at',
+        'passenger_name', 'passenger_sex', 'passenger_age', 'passenger_phone',
+        'passenger_phone_normalized', 'passenger_id_number', 'pickup_location',
+    )
+    
+    def __repr__(self):
+        return f'<BookingArchive {self.reference}>'
+
 class Ticket(db.Model):
     __tablename__ = "tickets"
     
@@ -1,9 +1,9 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, Response, stream_with_context, send_file
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify, send_file
 from flask_login import login_required, current_user
 from maua.extensions import db
 from maua.notifications.sms import send_sms
 from maua.payment.cache import PaymentStatusCache
-from .models import Booking, Ticket
+from .models import Booking, Ticket, SEAT_HOLDING_STATUSES
 from .services import broker
 from .forms import PassengerDetailsForm
 from maua.catalog.models import Trip
@@ -70,22 +70,21 @@ def book(trip_id):
 
 @booking_bp.route('/stream/<int:trip_id>')
 def stream_trip_seats(trip_id: int):
-    q = broker.subscribe(trip_id)
+    """Seat events for one trip; shares the per-process stream cap with the bell streams"""
+    from maua.streams import event_stream_response
+    return event_stream_response(lambda: broker.subscribe(trip_id), lambda q: broker.unsubscribe(trip_id, q))
 
-    def event_stream():
-        try:
-            # Send a comment to keep connection open
-            yield ': connected\n\n'
-            while True:
-                data = q.get()
-                yield f"data: {data}\n\n"
-        except GeneratorExit:
-            pass
-        finally:
-            broker.unsubscribe(trip_id, q)
 
-    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
-    return Response(stream_with_context(event_stream()), mimetype='text/event-stream', headers=headers)
+@booking_bp.route('/trips/<int:trip_id>/seats.json')
+def trip_seats_json(trip_id: int):
+    """Taken seats for a trip; seat pickers resync from this on (re)connect and on a timer"""
+    taken = db.session.scalars(
+        db.select(Booking.seat_number).where(
+            Booking.trip_id == trip_id,
+            Booking.status.in_(SEAT_HOLDING_STATUSES),
+        )
+    ).all()
+    return jsonify({'trip_id': trip_id, 'taken': sorted(taken)})
 
 @booking_bp.route('/book/<int:trip_id>/passenger', methods=['GET', 'POST'])
 @login_required
@@ -382,7 +381,6 @@ def cancel(booking_id):
     try:
         booking.status = 'cancelled'
         db.session.commit()
-        broker.publish(booking.trip_id, {"type": "seat_cancelled", "seat": booking.seat_number, "status": "available"})
         
         # Send cancellation notification
         try:
@@ -1,35 +1,108 @@
 import queue
 import json
+import threading
 from typing import Dict, Any
 
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from maua.booking.models import Booking
+
 class SeatEventBroker:
 	"""In-memory broadcaster for seat status events per trip.
-	This is suitable for single-process deployments. For multi-process, replace with Redis pub/sub.
+	Events only reach streams in the publishing process, so seat maps also resync
+	from their seats.json endpoint. For cross-process push, replace with Redis pub/sub.
 	"""
 
 	def __init__(self):
 		self._trip_to_queues: Dict[int, set[queue.Queue]] = {}
+		self._lock = threading.Lock()
 
 	def subscribe(self, trip_id: int) -> queue.Queue:
-		q: queue.Queue = queue.Queue()
-		self._trip_to_queues.setdefault(trip_id, set()).add(q)
+		q: queue.Queue = queue.Queue(maxsize=100)
+		with self._lock:
+			self._trip_to_queues.setdefault(trip_id, set()).add(q)
 		return q
 
 	def unsubscribe(self, trip_id: int, q: queue.Queue) -> None:
-		qs = self._trip_to_queues.get(trip_id)
-		if not qs:
-			return
-		qs.discard(q)
-		if not qs:
-			self._trip_to_queues.pop(trip_id, None)
+		with self._lock:
+			qs = self._trip_to_queues.get(trip_id)
+			if not qs:
+				return
+			qs.discard(q)
+			if not qs:
+				self._trip_to_queues.pop(trip_id, None)
 
 	def publish(self, trip_id: int, event: Dict[str, Any]) -> None:
-		for q in list(self._trip_to_queues.get(trip_id, set())):
+		with self._lock:
+			queues = list(self._trip_to_queues.get(trip_id, set()))
+		payload = json.dumps(event)
+		for q in queues:
 			try:
-				q.put_nowait(json.dumps(event))
-			except Exception:
+				q.put_nowait(payload)
+			except queue.Full:
+				# Slow client; it resyncs from seats.json
 				pass
 
 
 broker = SeatEventBroker()
 
+
+# Seat event published when a booking enters a status
+SEAT_EVENTS = {
+	'pending_payment': ('seat_held', 'taken'),
+	'reserved': ('seat_held', 'taken'),
+	'confirmed': ('seat_confirmed', 'taken'),
+	'checked_in': ('seat_checked_in', 'taken'),
+	'completed': ('seat_completed', 'taken'),
+	'cancelled': ('seat_cancelled', 'available'),
+}
+_PENDING_KEY = 'pending_seat_events'
+
+
+def _queue_seat_event(target, event_type, status):
+	session = object_session(target)
+	if session is not None:
+		session.info.setdefault(_PENDING_KEY, []).append(
+			(target.trip_id, {"type": event_type, "seat": target.seat_number, "status": status})
+		)
+
+
+# ORM booking changes are turned into seat events and published once the
+# transaction commits, so every seat map (customer or staff) sees every path
+# that books, checks in or frees a seat. Bulk statements publish their own.
+
+@event.listens_for(Booking, 'after_insert')
+@event.listens_for(Booking, 'after_update')
+def _booking_seat_changed(mapper, connection, target):
+	state = inspect(target)
+	if not (state.attrs.status.history.has_changes() or state.attrs.seat_number.history.has_changes()):
+		return
+	previous_seat = state.attrs.seat_number.history.deleted
+	if previous_seat and previous_seat[0] != target.seat_number:
+		session = object_session(target)
+		if session is not None:
+			session.info.setdefault(_PENDING_KEY, []).append(
+				(target.trip_id, {"type": "seat_released", "seat": previous_seat[0], "status": "available"})
+			)
+	if target.status in SEAT_EVENTS:
+		_queue_seat_event(target, *SEAT_EVENTS[target.status])
+
+
+@event.listens_for(Booking, 'after_delete')
+def _booking_seat_released(mapper, connection, target):
+	_queue_seat_event(target, 'seat_released', 'available')
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_seat_events(session):
+	if session.in_nested_transaction():
+		return
+	for trip_id, payload in session.info.pop(_PENDING_KEY, None) or ():
+		broker.publish(trip_id, payload)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_seat_events(session, previous_transaction):
+	if previous_transaction.parent is None:
+		session.info.pop(_PENDING_KEY, None)
@@ -2,4 +2,4 @@ from flask import Blueprint
 
 bp = Blueprint('catalog', __name__)
 
-from maua.catalog import routes
\ No newline at end of file
+from maua.catalog import routes, commands  # noqa: E402,F401
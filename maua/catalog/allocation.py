@@ -0,0 +1,173 @@
+"""
+Vehicle and driver allocation for MAUA SHARK EXPRESS
+Keeps a vehicle (or a driver) off two trips that overlap in time:
+
+- a trip occupies [depart_at, arrive_eta), falling back to the route's
+  estimated duration and then to ALLOCATION_DEFAULT_TRIP_HOURS;
+- `AllocationIndex` keeps those windows per vehicle and per driver as sorted
+  start times plus a running maximum of end times, so a lookup is one bisect
+  and a short walk over the windows that actually overlap;
+- trip creation and reopening a cancelled or completed trip reject conflicts,
+  timetable generation skips them, and `find_conflicts` reports every
+  overlapping pair already on the board;
+- every path that puts a trip on the board checks under `lock_allocations`,
+  so two desks (or a desk and the timetable job) cannot both take a driver.
+"""
+
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from maua.extensions import db
+from maua.catalog.models import Route, Trip
+from maua.notifications.sms import normalize_phone
+from maua.stats.counters import ACTIVE_TRIP_STATUSES
+
+# Longest trip we expect; windows starting earlier than this cannot reach the range loaded
+MAX_TRIP_SPAN = timedelta(days=2)
+
+# Transaction-scoped Postgres advisory lock held while allocations are checked and written
+ALLOCATION_LOCK_ID = 4710470001
+
+# resource is ('vehicle', vehicle_id) or ('driver', phone or name); trip_id is None for a trip not saved yet
+Conflict = namedtuple('Conflict', 'resource trip_id other_trip_id')
+
+
+class AllocationConflict(Exception):
+    """A trip could not be put on the board; `conflicts` lists what it overlaps"""
+
+    def __init__(self, conflicts):
+        super().__init__(f'Overlaps {describe(conflicts)}')
+        self.conflicts = conflicts
+
+
+def describe(conflicts):
+    """Short text for staff, e.g. 'driver on trip #12, vehicle on trip #14'"""
+    return ', '.join(sorted({f"{c.resource[0]} on trip #{c.other_trip_id}" for c in conflicts}))
+
+
+def lock_allocations():
+    """Serialize allocation checks until the current transaction ends.
+
+    Drivers are free text with no row to lock, and a vehicle row lock does not
+    stop the same driver being put on two vehicles, so Postgres takes one
+    advisory lock for every allocation. SQLite already allows a single writer.
+    """
+    if db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute(select(func.pg_advisory_xact_lock(ALLOCATION_LOCK_ID)))
+
+
+def _naive(value):
+    return value.replace(tzinfo=None) if value is not None and value.tzinfo else value
+
+
+def trip_window(depart_at, arrive_eta=None, duration=None):
+    """(start, end) a trip keeps its vehicle and driver busy"""
+    start = _naive(depart_at)
+    end = _naive(arrive_eta)
+    if end is None or end <= start:
+        end = start + duration if duration else None
+    if end is None or end <= start:
+        end = start + timedelta(hours=current_app.config.get('ALLOCATION_DEFAULT_TRIP_HOURS', 4))
+    return start, end
+
+
+def resources(vehicle_id, driver_name=None, driver_phone=None):
+    """Index keys a trip occupies: its vehicle and, when named, its driver"""
+    keys = []
+    if vehicle_id:
+        keys.append(('vehicle', vehicle_id))
+    driver = normalize_phone((driver_phone or '').strip()) or (driver_name or '').strip().lower()
+    if driver:
+        keys.append(('driver', driver))
+    return keys
+
+
+class _Windows:
+    """One resource's windows sorted by start, with max_ends[i] = max(ends[:i + 1])"""
+    __slots__ = ('starts', 'ends', 'trip_ids', 'max_ends')
+
+    def __init__(self):
+        self.starts, self.ends, self.trip_ids, self.max_ends = [], [], [], []
+
+    def add(self, start, end, trip_id):
+        i = bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.trip_ids.insert(i, trip_id)
+        self.max_ends.insert(i, end)
+        running = self.max_ends[i - 1] if i else end
+        for j in range(i, len(self.max_ends)):
+            running = max(running, self.ends[j])
+            self.max_ends[j] = running
+
+    def overlapping(self, start, end, upto=None):
+        """Trip ids of windows overlapping [start, end) among the first `upto` windows"""
+        i = bisect_left(self.starts, end, hi=len(self.starts) if upto is None else upto) - 1
+        # Nothing at or before i ends after `start` once the running max drops to it
+        while i >= 0 and self.max_ends[i] > start:
+            if self.ends[i] > start:
+                yield self.trip_ids[i]
+            i -= 1
+
+
+class AllocationIndex:
+    """Committed time windows of vehicles and drivers"""
+
+    def __init__(self):
+        self._windows = defaultdict(_Windows)
+
+    def add(self, trip_id, vehicle_id, driver_name, driver_phone, start, end):
+        for key in resources(vehicle_id, driver_name, driver_phone):
+            self._windows[key].add(start, end, trip_id)
+
+    def conflicts(self, vehicle_id, driver_name, driver_phone, start, end, trip_id=None):
+        """Trips already holding the vehicle or driver during [start, end)"""
+        found = []
+        for key in resources(vehicle_id, driver_name, driver_phone):
+            windows = self._windows.get(key)
+            if windows is not None:
+                found.extend(Conflict(key, trip_id, other) for other in windows.overlapping(start, end)
+                             if trip_id is None or other != trip_id)
+        return found
+
+    def pairs(self):
+        """Every overlapping pair of windows, earlier-starting trip first"""
+        for key, windows in self._windows.items():
+            for i, (start, end) in enumerate(zip(windows.starts, windows.ends)):
+                for other in windows.overlapping(start, end, upto=i):
+                    yield Conflict(key, other, windows.trip_ids[i])
+
+    @classmethod
+    def load(cls, start, end):
+        """Index every active trip that can overlap [start, end) (one query)"""
+        index = cls()
+        rows = db.session.execute(
+            select(Trip.id, Trip.vehicle_id, Trip.driver_name, Trip.driver_phone,
+                   Trip.depart_at, Trip.arrive_eta, Route.estimated_duration)
+            .join(Route, Route.id == Trip.route_id)
+            .where(
+                Trip.status.in_(ACTIVE_TRIP_STATUSES),
+                Trip.depart_at >= start - MAX_TRIP_SPAN,
+                Trip.depart_at < end,
+            )
+        )
+        for trip_id, vehicle_id, driver_name, driver_phone, depart_at, arrive_eta, duration in rows:
+            index.add(trip_id, vehicle_id, driver_name, driver_phone, *trip_window(depart_at, arrive_eta, duration))
+        return index
+
+
+def check_trip(vehicle_id, driver_name, driver_phone, start, end, trip_id=None):
+    """Conflicts a trip over [start, end) would have with trips on the board"""
+    return AllocationIndex.load(start, end).conflicts(vehicle_id, driver_name, driver_phone, start, end, trip_id)
+
+
+def find_conflicts(start=None, days=None):
+    """Every vehicle or driver double allocation among active trips from `start` over `days`"""
+    start = start or datetime.utcnow()
+    days = days or current_app.config.get('TIMETABLE_HORIZON_DAYS', 14)
+    return sorted(AllocationIndex.load(start, start + timedelta(days=days)).pairs(),
+                  key=lambda c: (c.trip_id, c.other_trip_id, c.resource[0]))
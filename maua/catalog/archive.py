@@ -0,0 +1,190 @@
+"""
+Completed-trip export and archival for MAUA SHARK EXPRESS
+Staff export completed trips (PDF or CSV) and then clear them from the hot
+tables. Both steps are built to keep memory flat however many trips there are:
+
+- trips are streamed with `yield_per`, with route, depots and vehicle
+  joined in the same query (no per-trip lazy loads);
+- the report is written to a temp file as rows arrive and sent with send_file;
+- trips and their bookings are moved to `trips_archive` / `bookings_archive`
+  in bounded batches, each its own short transaction.
+"""
+
+import csv
+import logging
+import os
+import tempfile
+from array import array
+from datetime import datetime
+
+from flask import current_app
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+from sqlalchemy import delete, insert, literal, select, update
+from sqlalchemy.orm import aliased, joinedload
+
+from maua.extensions import db
+from maua.booking.models import Booking, BookingArchive, Ticket
+from maua.catalog.models import Depot, Route, Trip, TripArchive, Vehicle
+from maua.notifications.models import Notification
+from maua.parcels.models import Parcel
+from maua.payment.models import Payment
+from maua.stats import counters as stats
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = {'pdf': 'application/pdf', 'csv': 'text/csv'}
+CSV_COLUMNS = ('trip_id', 'route', 'origin', 'destination', 'depart_at', 'vehicle',
+               'driver_name', 'driver_phone', 'base_fare', 'status')
+
+
+def iter_completed_trips(chunk_size=500):
+    """Completed trips oldest first, fetched `chunk_size` rows at a time"""
+    return db.session.scalars(
+        select(Trip).options(
+            joinedload(Trip.route).joinedload(Route.origin),
+            joinedload(Trip.route).joinedload(Route.destination),
+            joinedload(Trip.vehicle),
+        ).where(Trip.status == 'completed')
+        .order_by(Trip.depart_at.asc(), Trip.id.asc())
+        .execution_options(yield_per=chunk_size)
+    )
+
+
+def _write_csv(out, trips, trip_ids):
+    writer = csv.writer(out)
+    writer.writerow(CSV_COLUMNS)
+    for t in trips:
+        writer.writerow([
+            t.id, t.route.code, t.route.origin.town, t.route.destination.town,
+            t.depart_at.strftime('%Y-%m-%d %H:%M') if t.depart_at else '',
+            getattr(t.vehicle, 'plate_no', ''), t.driver_name or '', t.driver_phone or '',
+            t.base_fare, t.status,
+        ])
+        trip_ids.append(t.id)
+
+
+def _write_pdf(path, trips, trip_ids):
+    # ReportLab keeps finished pages until save(); compressing them keeps that small
+    pdf = canvas.Canvas(path, pagesize=A4, pageCompression=1)
+    width, height = A4
+
+    margin_left = 40
+    margin_top = height - 40
+    line_height = 16
+
+    pdf.setTitle('Completed Trips')
+    pdf.setFont('Helvetica-Bold', 14)
+    pdf.drawString(margin_left, margin_top, 'Completed Trips Export')
+    pdf.setFont('Helvetica', 10)
+    y = margin_top - 24
+
+    for idx, t in enumerate(trips, start=1):
+        lines = [
+            f"#{idx} Trip ID: {t.id}",
+            f"Route: {t.route.origin.town} -> {t.route.destination.town}",
+            f"Departs: {t.depart_at.strftime('%Y-%m-%d %H:%M') if t.depart_at else ''}",
+            f"Vehicle: {getattr(t.vehicle, 'plate_no', '')} ({getattr(t.vehicle, 'make', '')} {getattr(t.vehicle, 'model', '')})",
+            f"Driver: {t.driver_name or ''} | Phone: {t.driver_phone or ''}",
+            f"Base Fare: {t.base_fare} | Status: {t.status}",
+        ]
+        for line in lines:
+            if y < 60:
+                pdf.showPage()
+                pdf.setFont('Helvetica', 10)
+                y = margin_top
+            pdf.drawString(margin_left, y, line)
+            y -= line_height
+        # spacer
+        y -= 8
+        trip_ids.append(t.id)
+
+    pdf.showPage()
+    pdf.save()
+
+
+def export_completed_trips(fmt='pdf'):
+    """Write every completed trip to a temp file.
+
+    Returns (path, trip ids written); the caller sends and then removes the file.
+    """
+    fd, path = tempfile.mkstemp(prefix='completed_trips_', suffix=f'.{fmt}')
+    trip_ids = array('q')
+    try:
+        trips = iter_completed_trips()
+        if fmt == 'csv':
+            with os.fdopen(fd, 'w', newline='', encoding='utf-8') as out:
+                _write_csv(out, trips, trip_ids)
+        else:
+            os.close(fd)
+            _write_pdf(path, trips, trip_ids)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, trip_ids
+
+
+def archive_batch(trip_ids):
+    """Move one batch of completed trips and their bookings into the archive and commit.
+
+    Returns (trips moved, bookings moved).
+    """
+    now = datetime.utcnow()
+    trip_ids = [row.id for row in db.session.execute(
+        select(Trip.id).where(Trip.id.in_(trip_ids), Trip.status == 'completed')
+    )]
+    if not trip_ids:
+        return 0, 0
+    booking_ids = select(Booking.id).where(Booking.trip_id.in_(trip_ids)).scalar_subquery()
+
+    origin, destination = aliased(Depot), aliased(Depot)
+    db.session.execute(insert(TripArchive).from_select(
+        list(TripArchive.COPIED_COLUMNS) + ['route_code', 'origin_town', 'destination_town', 'vehicle_plate', 'archived_at'],
+        select(
+            *[getattr(Trip, name) for name in TripArchive.COPIED_COLUMNS],
+            Route.code, origin.town, destination.town, Vehicle.plate_no, literal(now),
+        ).select_from(Trip)
+        .outerjoin(Route, Route.id == Trip.route_id)
+        .outerjoin(origin, origin.id == Route.origin_depot_id)
+        .outerjoin(destination, destination.id == Route.destination_depot_id)
+        .outerjoin(Vehicle, Vehicle.id == Trip.vehicle_id)
+        .where(Trip.id.in_(trip_ids))
+    ))
+
+    payment_id = select(Payment.id).where(Payment.booking_id == Booking.id).order_by(Payment.id).limit(1)
+    ticket_status = select(Ticket.status).where(Ticket.booking_id == Booking.id).limit(1)
+    bookings = db.session.execute(insert(BookingArchive).from_select(
+        list(BookingArchive.COPIED_COLUMNS) + ['payment_id', 'ticket_status', 'archived_at'],
+        select(
+            *[getattr(Booking, name) for name in BookingArchive.COPIED_COLUMNS],
+            payment_id.scalar_subquery(), ticket_status.scalar_subquery(), literal(now),
+        ).where(Booking.trip_id.in_(trip_ids))
+    )).rowcount
+
+    # Detach rows that outlive the trip; the archive keeps the ids for tracing
+    for statement in (
+        update(Payment).where(Payment.booking_id.in_(booking_ids)).values(booking_id=None),
+        update(Notification).where(Notification.booking_id.in_(booking_ids)).values(booking_id=None),
+        update(Notification).where(Notification.trip_id.in_(trip_ids)).values(trip_id=None),
+        update(Parcel).where(Parcel.trip_id.in_(trip_ids)).values(trip_id=None),
+        delete(Ticket).where(Ticket.booking_id.in_(booking_ids)),
+        delete(Booking).where(Booking.trip_id.in_(trip_ids)),
+        delete(Trip).where(Trip.id.in_(trip_ids)),
+    ):
+        db.session.execute(statement.execution_options(synchronize_session=False))
+
+    stats.adjust('bookings_total', -bookings)  # Core DELETEs skip the ORM counter hooks
+    db.session.commit()
+    return len(trip_ids), bookings
+
+
+def archive_trips(trip_ids, batch_size=None):
+    """Archive the given completed trips batch by batch. Returns (trips, bookings) moved."""
+    batch_size = batch_size or current_app.config.get('TRIP_ARCHIVE_BATCH_SIZE', 500)
+    trips = bookings = 0
+    for start in range(0, len(trip_ids), batch_size):
+        moved_trips, moved_bookings = archive_batch(list(trip_ids[start:start + batch_size]))
+        trips += moved_trips
+        bookings += moved_bookings
+    logger.info(f"Archived {trips} completed trips and {bookings} bookings")
+    return trips, bookings
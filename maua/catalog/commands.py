@@ -0,0 +1,20 @@
+import time
+
+import click
+
+from maua.catalog import bp
+
+
+@bp.cli.command('generate-trips')
+@click.option('--days', type=int, default=None, help='Days ahead to fill (default TIMETABLE_HORIZON_DAYS)')
+@click.option('--every', type=int, default=None, help='Keep running, generating every N seconds')
+def generate_trips_command(days, every):
+    """Create the trips of active timetables for the coming days (safe to rerun)."""
+    from maua.catalog.timetable import generate_trips
+    
+    while True:
+        result = generate_trips(days=days)
+        click.echo(f"Created {result['trips']} trip(s) over the next {result['days']} day(s)")
+        if not every:
+            break
+        time.sleep(every)
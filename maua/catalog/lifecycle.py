@@ -0,0 +1,170 @@
+"""
+Trip lifecycle for MAUA SHARK EXPRESS
+Moves one trip or many (end-of-day close-out) to a new status:
+
+- one UPDATE over the trips and one over their bookings, in one transaction;
+- cancelled trips also release their undelivered parcels back to dispatch;
+- a cancelled or completed trip put back on the board must pass the vehicle
+  and driver allocation check (raises `AllocationConflict` otherwise);
+- the bulk booking UPDATE skips the ORM seat-event hooks, so the seats it
+  changes are returned and published to open seat maps after the commit;
+- passenger messages (bell notifications and SMS) for every affected booking
+  are sent from a single background job after the commit.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from threading import Thread
+
+from flask import current_app
+from sqlalchemy import select, update
+from sqlalchemy.orm import joinedload
+
+from maua.extensions import db
+from maua.booking.models import Booking
+from maua.booking.services import SEAT_EVENTS, broker
+from maua.catalog.allocation import AllocationConflict, check_trip, lock_allocations, trip_window
+from maua.catalog.models import Route, Trip
+from maua.stats import counters as stats
+
+logger = logging.getLogger(__name__)
+
+TRIP_STATUSES = ('scheduled', 'in_progress', 'completed', 'cancelled')
+
+# Bookings carried along when a trip enters a status: (from statuses, new booking status)
+BOOKING_TRANSITIONS = {
+    'completed': (('confirmed', 'checked_in'), 'completed'),
+    'cancelled': (('confirmed', 'reserved', 'checked_in', 'pending_payment'), 'cancelled'),
+}
+# Passengers told about a trip starting (their bookings do not change)
+STARTED_BOOKING_STATUSES = ('confirmed', 'checked_in')
+
+
+def change_trip_status(trip_ids, new_status, notify=True, actor_id=None) -> dict:
+    """Move trips to `new_status` with their bookings (and parcels, on cancel) and commit.
+
+    Trips already in that status are left alone. Returns counts of trips,
+    bookings and parcels changed.
+    """
+    if new_status not in TRIP_STATUSES:
+        raise ValueError(f"Unknown trip status: {new_status}")
+    now = datetime.utcnow()
+    active = stats.ACTIVE_TRIP_STATUSES
+    try:
+        if new_status in active:
+            # Same lock as trip creation and timetable generation (taken before any row lock)
+            lock_allocations()
+        trips = db.session.execute(
+            select(Trip.id, Trip.status)
+            .where(Trip.id.in_(list(trip_ids)), Trip.status != new_status)
+            .with_for_update()
+        ).all()
+        changed = [trip_id for trip_id, _ in trips]
+        if not changed:
+            db.session.rollback()
+            return {'trips': 0, 'bookings': 0, 'parcels': 0}
+        if new_status in active:
+            _check_reopened([trip_id for trip_id, old in trips if old not in active])
+
+        db.session.execute(
+            update(Trip).where(Trip.id.in_(changed))
+            .values(status=new_status, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        # Core UPDATEs skip the ORM counter hooks
+        stats.adjust('trips_active', sum((new_status in active) - (old in active) for _, old in trips))
+
+        booking_ids = []
+        bookings_changed = 0
+        seats = []
+        if new_status in BOOKING_TRANSITIONS:
+            from_statuses, booking_status = BOOKING_TRANSITIONS[new_status]
+            rows = db.session.execute(
+                update(Booking).where(
+                    Booking.trip_id.in_(changed),
+                    Booking.status.in_(from_statuses),
+                ).values(status=booking_status)
+                .returning(Booking.id, Booking.trip_id, Booking.seat_number)
+                .execution_options(synchronize_session=False)
+            ).all()
+            booking_ids = [row.id for row in rows]
+            seats = [(row.trip_id, row.seat_number) for row in rows]
+            bookings_changed = len(booking_ids)
+        elif new_status == 'in_progress':
+            booking_ids = list(db.session.scalars(
+                select(Booking.id).where(
+                    Booking.trip_id.in_(changed),
+                    Booking.status.in_(STARTED_BOOKING_STATUSES),
+                )
+            ))
+        parcels_changed = 0
+        if new_status == 'cancelled':
+            from maua.parcels.manifest import unassign_trips
+            parcels_changed = unassign_trips(changed, 'trip_cancelled', actor_id=actor_id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    logger.info(f"{len(changed)} trip(s) -> {new_status}; {bookings_changed} booking(s) updated, "
+                f"{parcels_changed} parcel(s) unassigned")
+    if seats:
+        event_type, seat_status = SEAT_EVENTS[booking_status]
+        for trip_id, seat in seats:
+            broker.publish(trip_id, {"type": event_type, "seat": seat, "status": seat_status})
+    if notify and booking_ids:
+        queue_status_messages(booking_ids, new_status)
+    return {'trips': len(changed), 'bookings': bookings_changed, 'parcels': parcels_changed}
+
+
+def _check_reopened(trip_ids):
+    """Raise AllocationConflict if trips coming back onto the board overlap active trips"""
+    for trip in Trip.query.options(joinedload(Trip.route)).filter(Trip.id.in_(trip_ids)):
+        duration = trip.route.estimated_duration if trip.route else None
+        conflicts = check_trip(trip.vehicle_id, trip.driver_name, trip.driver_phone,
+                               *trip_window(trip.depart_at, trip.arrive_eta, duration), trip_id=trip.id)
+        if conflicts:
+            raise AllocationConflict(conflicts)
+
+
+def departed_trip_ids(now=None):
+    """Ids of today's trips that have already departed but are not closed yet"""
+    now = now or datetime.utcnow()
+    start = datetime.combine(now.date(), datetime.min.time())
+    return list(db.session.scalars(
+        select(Trip.id).where(
+            Trip.status.in_(stats.ACTIVE_TRIP_STATUSES),
+            Trip.depart_at >= start,
+            Trip.depart_at < min(now, start + timedelta(days=1)),
+        ).order_by(Trip.depart_at.asc())
+    ))
+
+
+def close_out_day(now=None) -> dict:
+    """End-of-day close-out: complete every trip that departed today"""
+    return change_trip_status(departed_trip_ids(now), 'completed')
+
+
+def _send_status_messages(app, booking_ids, new_status):
+    from maua.notifications.notification_service import NotificationService
+
+    with app.app_context():
+        try:
+            bookings = Booking.query.options(
+                joinedload(Booking.trip).joinedload(Trip.route).joinedload(Route.origin),
+                joinedload(Booking.trip).joinedload(Trip.route).joinedload(Route.destination),
+                joinedload(Booking.passenger),
+            ).filter(Booking.id.in_(booking_ids)).order_by(Booking.id.asc()).all()
+            NotificationService.notify_trip_status_bulk(bookings, new_status)
+        except Exception as e:
+            logger.error(f"Trip {new_status} notifications failed: {e}")
+        finally:
+            db.session.remove()
+
+
+def queue_status_messages(booking_ids, new_status):
+    """Send every passenger message for a status change from one background job"""
+    app = current_app._get_current_object()
+    thread = Thread(target=_send_status_messages, args=(app, list(booking_ids), new_status))
+    thread.daemon = True
+    thread.start()
@@ -42,6 +42,7 @@ class Vehicle(db.Model):
     seat_count = db.Column(db.Integer, default=14)
     seat_layout = db.Column(db.JSON)  # [{"seat":"1","label":"1A"}, ...]
     active = db.Column(db.Boolean, default=True)
+    cargo_capacity_kg = db.Column(db.Float, nullable=False, default=300.0)  # Parcel load limit (see parcels.manifest)
     
     # Relationships
     trips = db.relationship('Trip', backref='vehicle', lazy=True)
@@ -62,9 +63,18 @@ class Trip(db.Model):
     # Operational fields
     driver_name = db.Column(db.String(120))
     driver_phone = db.Column(db.String(30))
+    timetable_id = db.Column(db.Integer, db.ForeignKey("timetables.id"), index=True)  # Set on generated trips
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        # A timetable departure is materialized at most once
+        db.UniqueConstraint('timetable_id', 'depart_at', name='uq_timetable_departure'),
+        # Keyset paging of staff trip lists (by status, by route)
+        db.Index('ix_trips_status_depart', 'status', 'depart_at', 'id'),
+        db.Index('ix_trips_route_depart', 'route_id', 'depart_at', 'id'),
+    )
+    
     # Relationships
     bookings = db.relationship('Booking', backref='trip', lazy=True)
     
@@ -87,4 +97,73 @@ class Trip(db.Model):
         return [seat['seat'] for seat in self.vehicle.seat_layout 
                if seat['seat'] not in booked_seats]
 
-    
\ No newline at end of file
+    
+
+class Timetable(db.Model):
+    """A recurring departure pattern; catalog.timetable turns it into trips."""
+    __tablename__ = "timetables"
+    
+    id = db.Column(db.Integer, primary_key=True)
+    route_id = db.Column(db.Integer, db.ForeignKey("routes.id"), nullable=False)
+    vehicle_id = db.Column(db.Integer, db.ForeignKey("vehicles.id"), nullable=False)  # Default vehicle
+    departure_times = db.Column(db.JSON, nullable=False)  # ["06:00", "14:30"]
+    days_of_week = db.Column(db.JSON, nullable=False)  # [0, 1, 2, 3, 4, 5, 6], Monday = 0
+    base_fare = db.Column(db.Numeric(10,2), nullable=False)
+    driver_name = db.Column(db.String(120))
+    driver_phone = db.Column(db.String(30))
+    valid_from = db.Column(db.Date)
+    valid_until = db.Column(db.Date)
+    active = db.Column(db.Boolean, default=True, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    route = db.relationship('Route', lazy='joined')
+    vehicle = db.relationship('Vehicle', lazy='joined')
+    trips = db.relationship('Trip', backref='timetable', lazy=True)
+    
+    def runs_on(self, day):
+        """True if this timetable has departures on `day` (a date)"""
+        if self.valid_from and day < self.valid_from:
+            return False
+        if self.valid_until and day > self.valid_until:
+            return False
+        return day.weekday() in (self.days_of_week or [])
+    
+    def __repr__(self):
+        return f'<Timetable {self.id}: route {self.route_id} at {", ".join(self.departure_times or [])}>'
+
+
+class TripArchive(db.Model):
+    """Cold storage for exported completed trips (see catalog.archive).
+
+    Rows keep their original id plus the route and vehicle names they ran with,
+    so history stays readable after routes or vehicles are removed. No foreign keys.
+    """
+    __tablename__ = "trips_archive"
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    route_id = db.Column(db.Integer)
+    vehicle_id = db.Column(db.Integer)
+    route_code = db.Column(db.String(20))
+    origin_town = db.Column(db.String(120))
+    destination_town = db.Column(db.String(120))
+    vehicle_plate = db.Column(db.String(20))
+    depart_at = db.Column(db.DateTime(timezone=True), index=True)
+    arrive_eta = db.Column(db.DateTime(timezone=True))
+    base_fare = db.Column(db.Numeric(10,2))
+    status = db.Column(db.String(20))
+    is_full = db.Column(db.Boolean)
+    driver_name = db.Column(db.String(120))
+    driver_phone = db.Column(db.String(30))
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Columns copied verbatim from the hot table
+    COPIED_COLUMNS = (
+        'id', 'route_id', 'vehicle_id', 'depart_at', 'arrive_eta', 'base_fare', 'status',
+        'is_full', 'driver_name', 'driver_phone', 'created_at', 'updated_at',
+    )
+    
+    def __repr__(self):
+        return f'<TripArchive {self.id}: {self.route_code} on {self.depart_at}>'
@@ -1,17 +1,24 @@
 from flask import render_template, abort, redirect, url_for
 from maua.catalog import bp
-from maua.catalog.models import Trip
+from sqlalchemy.orm import joinedload
+from maua.catalog.models import Trip, Route
 from datetime import datetime
 from collections import defaultdict
 
 
 @bp.route('/routes')
 def routes():
+    from maua.booking.models import Booking
     # Only show scheduled trips that are not marked as full
-    trips_all = Trip.query.filter(
+    trips_all = Trip.query.options(
+        joinedload(Trip.route).joinedload(Route.origin),
+        joinedload(Trip.route).joinedload(Route.destination),
+        joinedload(Trip.vehicle),
+    ).filter(
         Trip.status == 'scheduled',
         Trip.is_full == False
     ).order_by(Trip.depart_at.asc(), Trip.id.asc()).limit(500).all()
+    occupancy = Booking.occupancy(trips_all)
 
     # Group by route_id and pick the first trip (earliest) that still has available seats
     route_to_active_trip = {}
@@ -22,12 +29,9 @@ def routes():
     for route_id, group in routes_groups.items():
         chosen = None
         for t in group:  # already sorted by depart_at asc
-            try:
-                if hasattr(t, 'available_seats') and len(t.available_seats) > 0:
-                    chosen = t
-                    break
-            except Exception:
-                continue
+            if occupancy[t.id].free > 0:
+                chosen = t
+                break
         if chosen:
             route_to_active_trip[route_id] = chosen
         # If no trips for this route have seats, do not surface the route
@@ -40,6 +44,7 @@ def routes():
 
 @bp.route('/trips/<int:trip_id>')
 def trip_detail(trip_id: int):
+    from maua.booking.models import Booking
     trip = Trip.query.get(trip_id)
     if trip is None:
         abort(404)
@@ -51,15 +56,16 @@ def trip_detail(trip_id: int):
     # Enforce one car at a time per route: if another trip (earliest) on this route has seats
     # and it is not this one, redirect to that one
     try:
-        siblings = Trip.query.filter(
+        siblings = Trip.query.options(joinedload(Trip.vehicle)).filter(
             Trip.status == 'scheduled',
             Trip.route_id == trip.route_id,
             Trip.is_full == False,
         ).order_by(Trip.depart_at.asc(), Trip.id.asc()).all()
         if siblings:
+            occupancy = Booking.occupancy(siblings)
             active = None
             for s in siblings:
-                if hasattr(s, 'available_seats') and len(s.available_seats) > 0:
+                if occupancy[s.id].free > 0:
                     active = s
                     break
             if active and active.id != trip.id:
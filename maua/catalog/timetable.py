@@ -0,0 +1,139 @@
+"""
+Recurring timetables for MAUA SHARK EXPRESS
+Turns timetable departures into trips for a rolling horizon:
+
+- one multi-row INSERT per day covering every timetable running that day;
+- departures already on the board (same route and time, generated or keyed
+  in by hand) are skipped, and ON CONFLICT on uq_timetable_departure makes
+  reruns and overlapping runs no-ops;
+- departures whose vehicle or driver is already busy are left out and
+  logged (see catalog.allocation);
+- each day is its own short transaction.
+"""
+
+import logging
+from datetime import datetime, time, timedelta
+
+from flask import current_app
+from sqlalchemy import insert, select
+
+from maua.extensions import db
+from maua.catalog.allocation import AllocationIndex, lock_allocations, trip_window
+from maua.catalog.models import Timetable, Trip
+from maua.stats import counters as stats
+
+logger = logging.getLogger(__name__)
+
+
+def parse_departure_times(values):
+    """Normalize departure times ('6:00', '14:30') to sorted unique 'HH:MM' strings.
+
+    Raises ValueError on anything that is not a time of day.
+    """
+    times = set()
+    for value in values:
+        value = (value or '').strip()
+        if value:
+            times.add(datetime.strptime(value, '%H:%M').strftime('%H:%M'))
+    if not times:
+        raise ValueError('At least one departure time is required')
+    return sorted(times)
+
+
+def _departure_rows(timetable, day):
+    duration = timetable.route.estimated_duration if timetable.route else None
+    rows = []
+    for value in timetable.departure_times or []:
+        depart_at = datetime.combine(day, time.fromisoformat(value))
+        rows.append(dict(
+            route_id=timetable.route_id,
+            vehicle_id=timetable.vehicle_id,
+            timetable_id=timetable.id,
+            depart_at=depart_at,
+            arrive_eta=depart_at + duration if duration else None,
+            base_fare=timetable.base_fare,
+            status='scheduled',
+            is_full=False,
+            driver_name=timetable.driver_name,
+            driver_phone=timetable.driver_phone,
+        ))
+    return rows
+
+
+def _insert_trips(rows):
+    """One INSERT for the rows; returns the ids actually created"""
+    dialect = db.session.get_bind(mapper=Trip.__mapper__).dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        dialect_insert = None
+    if dialect_insert is not None:
+        statement = dialect_insert(Trip).on_conflict_do_nothing(index_elements=['timetable_id', 'depart_at'])
+        return list(db.session.scalars(statement.returning(Trip.id), rows))
+    db.session.execute(insert(Trip), rows)
+    return [None] * len(rows)
+
+
+def generate_day(day, timetables):
+    """Create the trips for one day that are not on the board yet and commit.
+
+    Returns (trips created, departures left out for a vehicle or driver conflict).
+    """
+    rows = [row for tt in timetables if tt.runs_on(day) for row in _departure_rows(tt, day)]
+    if not rows:
+        return 0, 0
+    start = datetime.combine(day, time.min)
+    end = start + timedelta(days=1)
+    try:
+        lock_allocations()  # desks creating trips wait until this day is written
+        existing = {
+            (route_id, depart_at.replace(tzinfo=None))
+            for route_id, depart_at in db.session.execute(
+                select(Trip.route_id, Trip.depart_at)
+                .where(Trip.depart_at >= start, Trip.depart_at < end)
+            )
+        }
+        # Trips reaching into tomorrow count too, so load a day further
+        allocation = AllocationIndex.load(start, end + timedelta(days=1))
+        accepted, clashes = [], 0
+        for row in sorted(rows, key=lambda r: r['depart_at']):
+            if (row['route_id'], row['depart_at']) in existing:
+                continue
+            window = trip_window(row['depart_at'], row['arrive_eta'])
+            conflicts = allocation.conflicts(row['vehicle_id'], row['driver_name'], row['driver_phone'], *window)
+            if conflicts:
+                clashes += 1
+                logger.warning(f"Timetable {row['timetable_id']} departure {row['depart_at']} skipped: "
+                               f"{conflicts[0].resource[0]} busy on trip {conflicts[0].other_trip_id}")
+                continue
+            allocation.add(None, row['vehicle_id'], row['driver_name'], row['driver_phone'], *window)
+            accepted.append(row)
+        created = _insert_trips(accepted) if accepted else []
+        stats.adjust('trips_active', len(created))  # bulk INSERT skips the ORM counter hooks
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(created), clashes
+
+
+def generate_trips(days=None, start=None) -> dict:
+    """Materialize active timetables from `start` (today) for `days` days.
+
+    Idempotent: running it again creates only departures that are still missing.
+    Returns counts of days covered, trips created and departures left out for conflicts.
+    """
+    days = days or current_app.config.get('TIMETABLE_HORIZON_DAYS', 14)
+    start = start or datetime.utcnow().date()
+    timetables = Timetable.query.filter_by(active=True).all()
+    created = clashes = 0
+    if timetables:
+        for offset in range(days):
+            day_created, day_clashes = generate_day(start + timedelta(days=offset), timetables)
+            created += day_created
+            clashes += day_clashes
+    logger.info(f"Generated {created} trip(s) from {len(timetables)} timetable(s) over {days} day(s); "
+                f"{clashes} left out for allocation conflicts")
+    return {'days': days, 'trips': created, 'conflicts': clashes}
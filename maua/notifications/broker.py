@@ -0,0 +1,51 @@
+import json
+import queue
+import threading
+from typing import Any, Dict
+
+
+class NotificationBroker:
+    """In-memory broadcaster for new bell notifications.
+
+    Channels are ``staff`` (shared by all staff) and ``customer:<user_id>``,
+    matching ``NotificationCounter.key_for``. Like the seat broker this only
+    fans out within one process, so a pushed event is a hint, not the source of
+    truth: the bell keeps polling the cursor-based delta endpoint, which picks
+    up notifications written by other workers. For cross-process push, replace
+    with Redis pub/sub.
+    """
+
+    def __init__(self):
+        self._channel_to_queues: Dict[str, set] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel: str) -> queue.Queue:
+        q: queue.Queue = queue.Queue(maxsize=100)
+        with self._lock:
+            self._channel_to_queues.setdefault(channel, set()).add(q)
+        return q
+
+    def unsubscribe(self, channel: str, q: queue.Queue) -> None:
+        with self._lock:
+            qs = self._channel_to_queues.get(channel)
+            if not qs:
+                return
+            qs.discard(q)
+            if not qs:
+                self._channel_to_queues.pop(channel, None)
+
+    def publish(self, channel: str, event: Dict[str, Any]) -> None:
+        with self._lock:
+            queues = list(self._channel_to_queues.get(channel, set()))
+        if not queues:
+            return
+        payload = json.dumps(event)
+        for q in queues:
+            try:
+                q.put_nowait(payload)
+            except queue.Full:
+                # Slow client; it will resync from its cursor on reconnect
+                pass
+
+
+broker = NotificationBroker()
@@ -0,0 +1,156 @@
+"""
+SMS deduplication and per-recipient coalescing for MAUA SHARK EXPRESS
+
+Staff actions often fire several SMS at one person within seconds (status flips,
+repeated vehicle assignments, confirmation + loyalty messages). Before a message
+reaches the provider it passes through `SmsCoalescer`:
+
+- Dedup: the last message sent under a (recipient, template, entity) key is
+  remembered for `SMS_DEDUP_WINDOW` seconds; sending the same text again under
+  that key is suppressed. A different text under the same key (e.g. an edited
+  vehicle assignment) replaces a still-buffered one or goes out as an update.
+- Coalescing: messages to one recipient are held for `SMS_COALESCE_WINDOW`
+  seconds and merged into a single SMS, up to `SMS_COALESCE_MAX_CHARS`.
+
+State is in-memory and per-process, like `PaymentStatusCache`; each gunicorn
+worker coalesces its own traffic. Buffered messages are sent before the process
+exits (`atexit` here, plus gunicorn's `worker_exit` hook in gunicorn.conf.py),
+so recycled or redeployed workers do not drop them.
+"""
+
+import atexit
+import hashlib
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_SEPARATOR = '\n\n'
+
+
+def _digest(message: str) -> str:
+    return hashlib.sha1(message.encode('utf-8')).hexdigest()
+
+
+class SmsCoalescer:
+    """Suppress duplicate SMS and merge closely spaced SMS to the same recipient"""
+
+    _sent: Dict[Tuple, Dict[str, Any]] = {}       # dedup key -> {'digest', 'timestamp'}
+    _pending: Dict[str, Dict[str, Any]] = {}      # phone -> {'items', 'user_email', 'timer'}
+    _lock = threading.Lock()
+    _max_sent_entries = 10000
+
+    @classmethod
+    def submit(cls, app, phone: str, message: str, deliver: Callable[[str, str, Optional[str]], Any],
+               user_email: str = None, template: str = None, entity: str = None) -> bool:
+        """Queue a message for `phone`. Returns False if it was suppressed as a duplicate.
+
+        `deliver(phone, message, user_email)` is called (inside an app context) when
+        the recipient's buffer is flushed.
+        """
+        config = app.config
+        coalesce_window = config.get('SMS_COALESCE_WINDOW', 5)
+        max_chars = config.get('SMS_COALESCE_MAX_CHARS', 459)
+
+        key = cls._key(phone, message, template, entity)
+        flush_now = None
+
+        with cls._lock:
+            if not cls._record(app, key, phone, message, template, entity):
+                return False
+
+            if coalesce_window <= 0:
+                flush_now = [(key, message)], user_email
+            else:
+                pending = cls._pending.get(phone)
+                if pending is not None:
+                    items = [item for item in pending['items'] if item[0] != key]
+                    merged = MESSAGE_SEPARATOR.join(m for _, m in items + [(key, message)])
+                    if len(merged) <= max_chars:
+                        # Same key still buffered: the newer text supersedes it
+                        pending['items'] = items + [(key, message)]
+                        pending['user_email'] = pending['user_email'] or user_email
+                        return True
+                    # Buffer is full: send what is there now and start a new one
+                    pending['timer'].cancel()
+                    cls._pending.pop(phone)
+                    flush_now = pending['items'], pending['user_email']
+
+                timer = threading.Timer(coalesce_window, cls._flush, args=(app, phone, deliver))
+                timer.daemon = True
+                cls._pending[phone] = {'items': [(key, message)], 'user_email': user_email, 'timer': timer}
+                timer.start()
+
+        if flush_now is not None:
+            items, email = flush_now
+            cls._deliver(app, phone, items, email, deliver)
+        return True
+
+    @classmethod
+    def claim(cls, app, phone: str, message: str, template: str = None, entity: str = None) -> bool:
+        """Dedup only: record the message and return False if it is a duplicate.
+
+        For batch senders that deliver themselves and must not buffer per recipient.
+        """
+        with cls._lock:
+            return cls._record(app, cls._key(phone, message, template, entity), phone, message, template, entity)
+
+    @staticmethod
+    def _key(phone: str, message: str, template: str = None, entity: str = None) -> Tuple:
+        return (phone, template, entity) if (template or entity) else (phone, None, _digest(message))
+
+    @classmethod
+    def _record(cls, app, key: Tuple, phone: str, message: str, template: str = None, entity: str = None) -> bool:
+        """Remember `message` under `key`; False if it repeats a recent one (caller holds the lock)"""
+        dedup_window = app.config.get('SMS_DEDUP_WINDOW', 300)
+        digest = _digest(message)
+        now = time.time()
+        cls._prune(now, dedup_window)
+        last = cls._sent.get(key)
+        if last and last['digest'] == digest and now - last['timestamp'] < dedup_window:
+            logger.info('Duplicate SMS to %s suppressed (%s/%s)', phone, template, entity)
+            return False
+        cls._sent[key] = {'digest': digest, 'timestamp': now}
+        return True
+
+    @classmethod
+    def _flush(cls, app, phone: str, deliver) -> None:
+        """Timer callback: send everything buffered for `phone` as one SMS"""
+        with cls._lock:
+            pending = cls._pending.pop(phone, None)
+        if pending:
+            cls._deliver(app, phone, pending['items'], pending['user_email'], deliver)
+
+    @staticmethod
+    def _deliver(app, phone: str, items, user_email, deliver) -> None:
+        message = MESSAGE_SEPARATOR.join(m for _, m in items)
+        if len(items) > 1:
+            logger.info('Coalesced %d SMS to %s into one', len(items), phone)
+        try:
+            with app.app_context():
+                deliver(phone, message, user_email)
+        except Exception as exc:
+            logger.error('Coalesced SMS to %s failed: %s', phone, exc)
+
+    @classmethod
+    def flush_all(cls) -> None:
+        """Send every buffered message immediately (before a CLI command or worker exits)"""
+        with cls._lock:
+            pending = list(cls._pending.values())
+        for entry in pending:
+            entry['timer'].cancel()
+            entry['timer'].function(*entry['timer'].args)
+
+    @classmethod
+    def _prune(cls, now: float, window: int) -> None:
+        """Drop expired dedup keys once the table grows large (caller holds the lock)"""
+        if len(cls._sent) < cls._max_sent_entries:
+            return
+        expired = [k for k, v in cls._sent.items() if now - v['timestamp'] >= window]
+        for k in expired:
+            del cls._sent[k]
+
+
+atexit.register(SmsCoalescer.flush_all)
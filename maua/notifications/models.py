@@ -1,4 +1,7 @@
 from datetime import datetime
+from sqlalchemy import event, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
 from maua.extensions import db
 
 
@@ -36,11 +39,17 @@ class Notification(db.Model):
     read_at = db.Column(db.DateTime, nullable=True)
     
     # Timestamps
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
     # Relationships
     user = db.relationship('User', backref=db.backref('notifications', lazy='dynamic'))
     
+    __table_args__ = (
+        # Covers the bell list query (filter by user/audience, newest first)
+        db.Index('ix_notifications_user_audience_read_created',
+                 'user_id', 'audience', 'is_read', 'created_at'),
+    )
+    
     def __repr__(self):
         return f'<Notification {self.id}: {self.title[:30]}>'
     
@@ -92,6 +101,7 @@ class Notification(db.Model):
         if not self.is_read:
             self.is_read = True
             self.read_at = datetime.utcnow()
+            NotificationCounter.adjust(self.audience, self.user_id, -1)
     
     @classmethod
     def create_for_customer(cls, user_id, notification_type, title, message, 
@@ -112,8 +122,24 @@ class Notification(db.Model):
             parcel_id=parcel_id
         )
         db.session.add(notification)
+        NotificationCounter.adjust('customer', user_id, 1)
         return notification
     
+    @classmethod
+    def create_for_customers(cls, entries):
+        """Create many customer notifications at once (one counter update per customer).
+        
+        `entries` are dicts of the `create_for_customer` arguments.
+        """
+        notifications = [cls(audience='customer', **entry) for entry in entries]
+        db.session.add_all(notifications)
+        per_user = {}
+        for notification in notifications:
+            per_user[notification.user_id] = per_user.get(notification.user_id, 0) + 1
+        for user_id, count in per_user.items():
+            NotificationCounter.adjust('customer', user_id, count)
+        return notifications
+    
     @classmethod
     def create_for_staff(cls, notification_type, title, message,
                         icon='fa-bell', color='primary', link=None,
@@ -133,24 +159,84 @@ class Notification(db.Model):
             parcel_id=parcel_id
         )
         db.session.add(notification)
+        NotificationCounter.adjust('staff', None, 1)
         return notification
     
     @classmethod
     def get_unread_count_for_customer(cls, user_id):
         """Get unread notification count for a customer"""
+        return NotificationCounter.get('customer', user_id)
+    
+    @classmethod
+    def get_unread_count_for_staff(cls):
+        """Get unread notification count for staff (shared notifications)"""
+        return NotificationCounter.get('staff')
+    
+    @classmethod
+    def get_since_for_customer(cls, user_id, cursor, limit=50):
+        """Get a customer's notifications newer than ``cursor`` (a notification id), oldest first"""
         return cls.query.filter(
             cls.user_id == user_id,
             cls.audience == 'customer',
-            cls.is_read == False
-        ).count()
+            cls.id > cursor
+        ).order_by(cls.id.asc()).limit(limit).all()
     
     @classmethod
-    def get_unread_count_for_staff(cls):
-        """Get unread notification count for staff (shared notifications)"""
+    def get_since_for_staff(cls, cursor, limit=50):
+        """Get staff notifications newer than ``cursor`` (a notification id), oldest first"""
         return cls.query.filter(
             cls.audience == 'staff',
+            cls.id > cursor
+        ).order_by(cls.id.asc()).limit(limit).all()
+    
+    @property
+    def channel(self):
+        """Push channel this notification is delivered on"""
+        return NotificationCounter.key_for(self.audience, self.user_id)
+    
+    @classmethod
+    def count_unread(cls, audience, user_id=None):
+        """Count unread notifications with a real COUNT(*) (seeds counters; reads without a row)"""
+        query = cls.query.filter(cls.audience == audience, cls.is_read == False)
+        if audience == 'customer':
+            query = query.filter(cls.user_id == user_id)
+        return query.count()
+    
+    @classmethod
+    def mark_all_read_for_customer(cls, user_id):
+        """Mark all of a customer's notifications as read"""
+        cls.query.filter(
+            cls.user_id == user_id,
+            cls.audience == 'customer',
             cls.is_read == False
-        ).count()
+        ).update({'is_read': True, 'read_at': datetime.utcnow()}, synchronize_session=False)
+        NotificationCounter.set('customer', user_id, 0)
+    
+    @classmethod
+    def mark_all_read_for_staff(cls):
+        """Mark all staff notifications as read"""
+        cls.query.filter(
+            cls.audience == 'staff',
+            cls.is_read == False
+        ).update({'is_read': True, 'read_at': datetime.utcnow()}, synchronize_session=False)
+        NotificationCounter.set('staff', None, 0)
+    
+    @classmethod
+    def clear_for_customer(cls, user_id):
+        """Move all of a customer's notifications out of the hot table into the archive"""
+        NotificationArchive.move(cls.query.filter(
+            cls.user_id == user_id,
+            cls.audience == 'customer'
+        ))
+        NotificationCounter.set('customer', user_id, 0)
+    
+    @classmethod
+    def clear_for_staff(cls):
+        """Move all staff notifications out of the hot table into the archive"""
+        NotificationArchive.move(cls.query.filter(
+            cls.audience == 'staff'
+        ))
+        NotificationCounter.set('staff', None, 0)
     
     @classmethod
     def get_recent_for_customer(cls, user_id, limit=20):
@@ -167,3 +253,202 @@ class Notification(db.Model):
             cls.audience == 'staff'
         ).order_by(cls.created_at.desc()).limit(limit).all()
 
+
+class NotificationArchive(db.Model):
+    """Cold storage for cleared and expired notifications.
+
+    Rows keep their original id. There are no foreign keys so archived history
+    survives trips, bookings and parcels being archived or removed later.
+    """
+    __tablename__ = "notifications_archive"
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, nullable=True)
+    notification_type = db.Column(db.String(30), nullable=False)
+    audience = db.Column(db.String(20))
+    title = db.Column(db.String(200), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    icon = db.Column(db.String(50))
+    color = db.Column(db.String(20))
+    link = db.Column(db.String(255))
+    booking_id = db.Column(db.Integer)
+    trip_id = db.Column(db.Integer)
+    parcel_id = db.Column(db.Integer)
+    is_read = db.Column(db.Boolean)
+    read_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_notifications_archive_audience_created', 'audience', 'created_at'),
+    )
+    
+    # Columns copied verbatim from the hot table
+    COPIED_COLUMNS = (
+        'id', 'user_id', 'notification_type', 'audience', 'title', 'message', 'icon',
+        'color', 'link', 'booking_id', 'trip_id', 'parcel_id', 'is_read', 'read_at', 'created_at',
+    )
+    
+    def __repr__(self):
+        return f'<NotificationArchive {self.id}: {self.title[:30]}>'
+    
+    @classmethod
+    def move(cls, query, chunk_size=1000):
+        """Copy the notifications matched by ``query`` into the archive and delete them.
+
+        Ids are resolved up front so a row created mid-move is never deleted
+        without being archived. Each chunk is one INSERT ... SELECT plus one
+        DELETE; the caller commits. Returns the number of rows moved.
+        """
+        ids = [row.id for row in query.with_entities(Notification.id).order_by(Notification.id)]
+        for start in range(0, len(ids), chunk_size):
+            cls._move_ids(ids[start:start + chunk_size])
+        return len(ids)
+    
+    @classmethod
+    def _move_ids(cls, ids):
+        from sqlalchemy import insert, literal
+        
+        columns = [getattr(Notification, name) for name in cls.COPIED_COLUMNS]
+        db.session.execute(
+            insert(cls).from_select(
+                list(cls.COPIED_COLUMNS) + ['archived_at'],
+                select(*columns, literal(datetime.utcnow())).where(Notification.id.in_(ids))
+            )
+        )
+        Notification.query.filter(Notification.id.in_(ids)).delete(synchronize_session=False)
+
+
+class NotificationCounter(db.Model):
+    """Materialized unread counts so bell polls are a single-row lookup.
+
+    One row per customer (``customer:<user_id>``) plus one shared ``staff`` row.
+    Counters are written through in the same transaction as the notification
+    change. The migration seeds a row for every user and for staff; any other
+    missing row is created by the first write, never by a read.
+    """
+    __tablename__ = "notification_counters"
+    
+    key = db.Column(db.String(40), primary_key=True)
+    unread_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<NotificationCounter {self.key}: {self.unread_count}>'
+    
+    @staticmethod
+    def key_for(audience, user_id=None):
+        """Build the counter key for an audience (and user for customers)"""
+        if audience == 'customer':
+            return f'customer:{user_id}'
+        return audience
+    
+    @classmethod
+    def _read(cls, key):
+        """Read a counter value straight from the database (bypasses the identity map)"""
+        return db.session.execute(select(cls.unread_count).where(cls.key == key)).scalar()
+    
+    @classmethod
+    def _insert(cls, key, value):
+        """Insert a counter row; returns False if another worker created it first"""
+        try:
+            with db.session.begin_nested():
+                db.session.add(cls(key=key, unread_count=value))
+            return True
+        except IntegrityError:
+            return False
+    
+    @classmethod
+    def _update(cls, key, value):
+        """Run a single-row UPDATE; returns the number of rows matched"""
+        result = db.session.execute(
+            update(cls)
+            .where(cls.key == key)
+            .values(unread_count=value, updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount
+    
+    @classmethod
+    def _seed(cls, audience, user_id, delta):
+        """Create the counter row from the current table contents.
+
+        The COUNT(*) runs after a flush, so it already includes this
+        transaction's change. If another worker created the row first, its
+        count could not see our uncommitted rows, so ``delta`` is added to it.
+        """
+        key = cls.key_for(audience, user_id)
+        db.session.flush()
+        if not cls._insert(key, Notification.count_unread(audience, user_id)):
+            cls._update(key, cls.unread_count + delta)
+    
+    @classmethod
+    def get(cls, audience, user_id=None):
+        """Return the unread count for an audience (single primary-key lookup)
+
+        Reads never insert: GET requests do not commit, so a seed written here
+        would be rolled back and redone on every poll. Without a row the count
+        comes straight from the (indexed) notifications table.
+        """
+        if audience == 'customer' and user_id is None:
+            return 0
+        count = cls._read(cls.key_for(audience, user_id))
+        if count is None:
+            count = Notification.count_unread(audience, user_id)
+        return max(count or 0, 0)
+    
+    @classmethod
+    def adjust(cls, audience, user_id, delta):
+        """Atomically add ``delta`` to a counter, seeding it if it does not exist yet"""
+        if audience == 'customer' and user_id is None:
+            return
+        if not cls._update(cls.key_for(audience, user_id), cls.unread_count + delta):
+            cls._seed(audience, user_id, delta)
+    
+    @classmethod
+    def set(cls, audience, user_id, value):
+        """Overwrite a counter (used by mark-all-read and clear-all)"""
+        if audience == 'customer' and user_id is None:
+            return
+        key = cls.key_for(audience, user_id)
+        if not cls._update(key, value) and not cls._insert(key, value):
+            cls._update(key, value)
+
+
+# =============================================================================
+# PUSH DELIVERY
+# =============================================================================
+# New notifications are serialized when they are flushed and only pushed to
+# subscribers once the transaction commits, so a client that reacts to an event
+# by calling the delta endpoint always finds the row.
+
+_PENDING_KEY = 'pending_notification_events'
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_new_notifications(session, flush_context):
+    for obj in session.new:
+        if isinstance(obj, Notification) and obj.id is not None:
+            session.info.setdefault(_PENDING_KEY, []).append(
+                (obj.channel, {'type': 'notification', 'notification': obj.to_dict()})
+            )
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_new_notifications(session):
+    if session.in_nested_transaction():
+        # Savepoint release, not the real commit
+        return
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    from maua.notifications.broker import broker
+    for channel, payload in pending:
+        broker.publish(channel, payload)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_new_notifications(session, previous_transaction):
+    # Savepoint rollbacks (e.g. a lost counter-seed race) keep the outer batch
+    if previous_transaction.parent is None:
+        session.info.pop(_PENDING_KEY, None)
@@ -61,6 +61,11 @@ SMS_TEMPLATES = {
         "Track your parcel at our website using ref: {ref_code}"
     ),
     
+    'parcel_bulk_created': (
+        "MAUA SHARK: Dear {sender_name}, {count} parcels registered. Total: KES {total}. "
+        "Refs: {refs}. Track each parcel at our website using its ref."
+    ),
+    
     'parcel_receiver_notification': (
         "MAUA SHARK: Hello {receiver_name}! A parcel {ref_code} is being sent to you by {sender_name}. "
         "From: {origin} to {destination}. "
@@ -492,11 +497,17 @@ class NotificationService:
     """Unified notification service for SMS, Email, and In-App Bell Notifications"""
     
     @staticmethod
-    def send_sms(phone_number: str, message: str, user_email: str = None) -> bool:
-        """Send SMS notification"""
+    def send_sms(phone_number: str, message: str, user_email: str = None,
+                 template: str = None, entity: str = None) -> bool:
+        """Send SMS notification (deduplicated per recipient/template/entity).
+
+        Returns False when the message was suppressed as a duplicate, so callers
+        only count SMS that were actually queued.
+        """
         from maua.notifications.sms import send_sms as _send_sms
         try:
-            return _send_sms(phone_number, message, user_email=user_email)
+            return _send_sms(phone_number, message, user_email=user_email,
+                             template=template, entity=entity)
         except Exception as e:
             logger.error(f"SMS send error: {e}")
             return False
@@ -645,7 +656,8 @@ class NotificationService:
             results['sms'] = cls.send_sms(
                 booking.passenger_phone, 
                 sms_message,
-                user_email=booking.passenger.email if booking.passenger else None
+                user_email=booking.passenger.email if booking.passenger else None,
+                template='booking_confirmed', entity=booking.reference
             )
             
             # Send Email if user has email
@@ -694,7 +706,8 @@ class NotificationService:
                         passenger_name=booking.passenger_name
                     )
                     cls.send_sms(booking.passenger_phone, welcome_msg,
-                                user_email=booking.passenger.email if booking.passenger else None)
+                                user_email=booking.passenger.email if booking.passenger else None,
+                                template='thank_you_first_booking', entity=booking.reference)
                 elif booking_count % 5 == 0:
                     # Loyalty appreciation every 5 bookings
                     loyalty_msg = SMS_TEMPLATES['loyalty_appreciation'].format(
@@ -702,7 +715,8 @@ class NotificationService:
                         booking_count=booking_count
                     )
                     cls.send_sms(booking.passenger_phone, loyalty_msg,
-                                user_email=booking.passenger.email if booking.passenger else None)
+                                user_email=booking.passenger.email if booking.passenger else None,
+                                template='loyalty_appreciation', entity=booking.reference)
             
             logger.info(f"Booking confirmation sent for {booking.reference}")
             
@@ -731,7 +745,8 @@ class NotificationService:
             results['sms'] = cls.send_sms(
                 booking.passenger_phone, 
                 sms_message,
-                user_email=booking.passenger.email if booking.passenger else None
+                user_email=booking.passenger.email if booking.passenger else None,
+                template='booking_payment_received', entity=booking.reference
             )
             
         except Exception as e:
@@ -756,7 +771,8 @@ class NotificationService:
             results['sms'] = cls.send_sms(
                 booking.passenger_phone, 
                 sms_message,
-                user_email=booking.passenger.email if booking.passenger else None
+                user_email=booking.passenger.email if booking.passenger else None,
+                template='booking_checked_in', entity=booking.reference
             )
             
             # Create bell notification for customer
@@ -797,7 +813,8 @@ class NotificationService:
             results['sms'] = cls.send_sms(
                 booking.passenger_phone, 
                 sms_message,
-                user_email=booking.passenger.email if booking.passenger else None
+                user_email=booking.passenger.email if booking.passenger else None,
+                template='booking_completed', entity=booking.reference
             )
             
             # Email
@@ -843,7 +860,8 @@ class NotificationService:
             results['sms'] = cls.send_sms(
                 booking.passenger_phone, 
                 sms_message,
-                user_email=booking.passenger.email if booking.passenger else None
+                user_email=booking.passenger.email if booking.passenger else None,
+                template='booking_cancelled', entity=booking.reference
             )
             
         except Exception as e:
@@ -873,7 +891,8 @@ class NotificationService:
             results['sms'] = cls.send_sms(
                 booking.passenger_phone, 
                 sms_message,
-                user_email=booking.passenger.email if booking.passenger else None
+                user_email=booking.passenger.email if booking.passenger else None,
+                template='booking_reminder', entity=booking.reference
             )
             
             # Email
@@ -931,11 +950,13 @@ class NotificationService:
             
             # SMS to sender (with email fallback)
             sender_msg = SMS_TEMPLATES['parcel_created'].format(**sms_data)
-            results['sender_sms'] = cls.send_sms(parcel.sender_phone, sender_msg, user_email=sender_email)
+            results['sender_sms'] = cls.send_sms(parcel.sender_phone, sender_msg, user_email=sender_email,
+                                                 template='parcel_created', entity=parcel.ref_code)
             
             # SMS to receiver (with email fallback)
             receiver_msg = SMS_TEMPLATES['parcel_receiver_notification'].format(**sms_data)
-            results['receiver_sms'] = cls.send_sms(parcel.receiver_phone, receiver_msg, user_email=receiver_email)
+            results['receiver_sms'] = cls.send_sms(parcel.receiver_phone, receiver_msg, user_email=receiver_email,
+                                                   template='parcel_receiver_notification', entity=parcel.ref_code)
             
             # Full receipt data for email
             receipt_data = {
@@ -978,6 +999,63 @@ class NotificationService:
         
         return results
     
+    @classmethod
+    def notify_parcels_bulk_created(cls, parcels) -> dict:
+        """Notify a bulk intake batch: one staff bell, one SMS per sender, one per receiver"""
+        results = {'sender_sms': 0, 'receiver_sms': 0, 'bell': False}
+        if not parcels:
+            return results
+        
+        try:
+            from maua.notifications.sms import normalize_phone
+            
+            cls.create_bell_notification_for_staff(
+                notification_type='parcel',
+                title='Bulk Parcel Intake 📦',
+                message=f"{len(parcels)} parcels registered ({parcels[0].ref_code} - {parcels[-1].ref_code})",
+                icon='fa-boxes',
+                color='success',
+                link="/staff/parcels"
+            )
+            results['bell'] = True
+            
+            # One summary SMS per sender rather than one per parcel
+            by_sender = {}
+            for parcel in parcels:
+                by_sender.setdefault(normalize_phone(parcel.sender_phone), []).append(parcel)
+            for phone, sent in by_sender.items():
+                refs = ', '.join(p.ref_code for p in sent[:10])
+                if len(sent) > 10:
+                    refs += f" +{len(sent) - 10} more"
+                msg = SMS_TEMPLATES['parcel_bulk_created'].format(
+                    sender_name=sent[0].sender_name,
+                    count=len(sent),
+                    total=f"{sum(p.price for p in sent):,.0f}",
+                    refs=refs,
+                )
+                if cls.send_sms(phone, msg, user_email=sent[0].sender_email,
+                                template='parcel_bulk_created', entity=sent[0].ref_code):
+                    results['sender_sms'] += 1
+            
+            for parcel in parcels:
+                receiver_msg = SMS_TEMPLATES['parcel_receiver_notification'].format(
+                    receiver_name=parcel.receiver_name,
+                    ref_code=parcel.ref_code,
+                    sender_name=parcel.sender_name,
+                    origin=parcel.origin_name,
+                    destination=parcel.destination_name,
+                )
+                if cls.send_sms(parcel.receiver_phone, receiver_msg, user_email=parcel.receiver_email,
+                                template='parcel_receiver_notification', entity=parcel.ref_code):
+                    results['receiver_sms'] += 1
+            
+            logger.info(f"Bulk parcel notifications sent for {len(parcels)} parcels")
+            
+        except Exception as e:
+            logger.error(f"Error sending bulk parcel notifications: {e}")
+        
+        return results
+    
     @classmethod
     def notify_parcel_payment_confirmed(cls, parcel, user_email=None) -> dict:
         """Send parcel payment confirmation with receipt emails"""
@@ -997,7 +1075,8 @@ class NotificationService:
             
             # SMS to sender
             sms_message = SMS_TEMPLATES['parcel_payment_confirmed'].format(**sms_data)
-            results['sms'] = cls.send_sms(parcel.sender_phone, sms_message, user_email=sender_email)
+            results['sms'] = cls.send_sms(parcel.sender_phone, sms_message, user_email=sender_email,
+                                          template='parcel_payment_confirmed', entity=parcel.ref_code)
             
             # Full receipt data for email
             receipt_data = {
@@ -1062,11 +1141,13 @@ class NotificationService:
             
             # SMS to sender (with email fallback)
             sender_msg = SMS_TEMPLATES['parcel_in_transit'].format(**data)
-            results['sender_sms'] = cls.send_sms(parcel.sender_phone, sender_msg, user_email=sender_email)
+            results['sender_sms'] = cls.send_sms(parcel.sender_phone, sender_msg, user_email=sender_email,
+                                                 template='parcel_in_transit', entity=parcel.ref_code)
             
             # SMS to receiver (with email fallback)
             receiver_msg = SMS_TEMPLATES['parcel_in_transit_receiver'].format(**data)
-            results['receiver_sms'] = cls.send_sms(parcel.receiver_phone, receiver_msg, user_email=receiver_email)
+            results['receiver_sms'] = cls.send_sms(parcel.receiver_phone, receiver_msg, user_email=receiver_email,
+                                                   template='parcel_in_transit_receiver', entity=parcel.ref_code)
             
             # Create bell notification for staff
             cls.create_bell_notification_for_staff(
@@ -1102,11 +1183,13 @@ class NotificationService:
             
             # SMS to sender (with email fallback)
             sender_msg = SMS_TEMPLATES['parcel_delivered'].format(**data)
-            results['sender_sms'] = cls.send_sms(parcel.sender_phone, sender_msg, user_email=sender_email)
+            results['sender_sms'] = cls.send_sms(parcel.sender_phone, sender_msg, user_email=sender_email,
+                                                 template='parcel_delivered', entity=parcel.ref_code)
             
             # SMS to receiver (with email fallback)
             receiver_msg = SMS_TEMPLATES['parcel_delivered_receiver'].format(**data)
-            results['receiver_sms'] = cls.send_sms(parcel.receiver_phone, receiver_msg, user_email=receiver_email)
+            results['receiver_sms'] = cls.send_sms(parcel.receiver_phone, receiver_msg, user_email=receiver_email,
+                                                   template='parcel_delivered_receiver', entity=parcel.ref_code)
             
             # Create bell notification for staff
             cls.create_bell_notification_for_staff(
@@ -1126,53 +1209,75 @@ class NotificationService:
         return results
 
 
+    # Trip status -> (bell title, bell message, icon, color, SMS template or None)
+    TRIP_STATUS_MESSAGES = {
+        'in_progress': ('Trip Started! 🚌', "Your trip from {origin} to {destination} has started. Have a safe journey!",
+                        'fa-bus', 'warning', None),
+        'completed': ('Trip Completed! 🎉', "Your trip from {origin} to {destination} has been completed. Thank you for traveling with us!",
+                      'fa-flag-checkered', 'success', 'booking_completed'),
+        'cancelled': ('Trip Cancelled', "Your trip from {origin} to {destination} on {date} has been cancelled. Booking {reference} is cancelled.",
+                      'fa-ban', 'danger', 'booking_cancelled'),
+    }
+
     @classmethod
-    def notify_trip_status_change(cls, trip, new_status) -> dict:
-        """Notify all passengers when trip status changes (in_progress, completed)"""
-        results = {'notifications_sent': 0}
+    def notify_trip_status_bulk(cls, bookings, new_status) -> dict:
+        """Notify the passengers of many bookings that their trip changed status.
+        
+        All bell notifications are committed together and the SMS are sent from the
+        calling thread, so this is meant for a background batch job (see catalog.lifecycle).
+        Load each booking's trip, route and depots with the bookings.
+        """
+        results = {'notifications_sent': 0, 'sms_sent': 0}
+        if new_status not in cls.TRIP_STATUS_MESSAGES or not bookings:
+            return results
+        title, bell_text, icon, color, sms_template = cls.TRIP_STATUS_MESSAGES[new_status]
         
         try:
-            from maua.booking.models import Booking
-            
-            # Get all active bookings for this trip
-            bookings = Booking.query.filter(
-                Booking.trip_id == trip.id,
-                Booking.status.in_(['confirmed', 'checked_in'])
-            ).all()
-            
-            origin = trip.route.origin.town
-            destination = trip.route.destination.town
-            
-            if new_status == 'in_progress':
-                title = 'Trip Started! 🚌'
-                message = f"Your trip from {origin} to {destination} has started. Have a safe journey!"
-                icon = 'fa-bus'
-                color = 'warning'
-            elif new_status == 'completed':
-                title = 'Trip Completed! 🎉'
-                message = f"Your trip from {origin} to {destination} has been completed. Thank you for traveling with us!"
-                icon = 'fa-flag-checkered'
-                color = 'success'
-            else:
-                return results
-            
-            # Create bell notifications for each customer with an account
+            from maua.notifications.models import Notification
+            from maua.notifications.sms import send_sms_batch
+            from maua.extensions import db
+            
+            entries = []
+            messages = []
             for booking in bookings:
+                trip = booking.trip
+                data = {
+                    'origin': trip.route.origin.town,
+                    'destination': trip.route.destination.town,
+                    'date': trip.depart_at.strftime('%b %d, %Y %H:%M') if trip.depart_at else '',
+                    'reference': booking.reference,
+                    'passenger_name': booking.passenger_name,
+                }
                 if booking.user_id:
-                    cls.create_bell_notification_for_customer(
-                        user_id=booking.user_id,
-                        notification_type='trip',
-                        title=title,
-                        message=message,
-                        icon=icon,
-                        color=color,
-                        link=f"/booking/confirmation/{booking.id}",
-                        booking_id=booking.id,
-                        trip_id=trip.id
-                    )
-                    results['notifications_sent'] += 1
-            
-            logger.info(f"Trip status change notifications sent: {results['notifications_sent']} for trip {trip.id}")
+                    entries.append({
+                        'user_id': booking.user_id,
+                        'notification_type': 'trip',
+                        'title': title,
+                        'message': bell_text.format(**data),
+                        'icon': icon,
+                        'color': color,
+                        'link': f"/booking/confirmation/{booking.id}",
+                        'booking_id': booking.id,
+                        'trip_id': trip.id,
+                    })
+                if sms_template:
+                    messages.append({
+                        'phone': booking.passenger_phone,
+                        'message': SMS_TEMPLATES[sms_template].format(**data),
+                        'user_email': booking.passenger.email if booking.passenger else None,
+                        'template': sms_template,
+                        'entity': booking.reference,
+                    })
+            
+            if entries:
+                Notification.create_for_customers(entries)
+                db.session.commit()
+                results['notifications_sent'] = len(entries)
+            if messages:
+                results['sms_sent'] = send_sms_batch(messages)
+            
+            logger.info(f"Trip {new_status} notifications: {results['notifications_sent']} bell, "
+                        f"{results['sms_sent']} SMS for {len(bookings)} bookings")
             
         except Exception as e:
             logger.error(f"Error sending trip status notifications: {e}")
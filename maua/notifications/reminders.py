@@ -0,0 +1,109 @@
+"""
+Trip reminder dispatcher for MAUA SHARK EXPRESS
+Finds confirmed bookings departing within the reminder window and sends
+`NotificationService.notify_trip_reminder` for each, exactly once.
+
+Each tick rechecks every confirmed booking on a trip inside the reminder window
+that has not had its reminder yet, however late it was confirmed. The scan is
+bounded by the window (trips by status and departure time, then bookings by
+trip) rather than by the bookings table, so no watermark is kept: a
+watermark on departure time would skip bookings confirmed after their trip
+was first scanned. Due bookings are grouped into departure-time buckets and
+dispatched in batches.
+
+Run on a schedule (e.g. every 15 minutes):
+    flask --app wsgi notifications send-reminders
+"""
+
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.orm import joinedload
+
+from maua.extensions import db
+from maua.booking.models import Booking
+from maua.catalog.models import Trip, Route
+
+logger = logging.getLogger(__name__)
+
+
+def _bucket_start(depart_at, bucket_minutes):
+    """Floor a departure time to the start of its bucket"""
+    minutes = (depart_at.hour * 60 + depart_at.minute) // bucket_minutes * bucket_minutes
+    return depart_at.replace(hour=minutes // 60, minute=minutes % 60, second=0, microsecond=0)
+
+
+def find_due_bookings(now, lead):
+    """Return (booking_id, depart_at) pairs that still need a reminder.
+
+    Keyed on the booking's current state only, so a booking confirmed hours
+    after it was created (e.g. a slow M-Pesa callback or a staff confirmation)
+    is picked up by the next tick.
+    """
+    window_end = now + lead
+
+    return db.session.query(Booking.id, Trip.depart_at).join(
+        Trip, Booking.trip_id == Trip.id
+    ).filter(
+        Trip.depart_at > now,
+        Trip.depart_at <= window_end,
+        Trip.status == 'scheduled',
+        Booking.status == 'confirmed',
+        Booking.reminder_sent_at.is_(None)
+    ).order_by(Trip.depart_at.asc(), Booking.id.asc()).all()
+
+
+def _dispatch_batch(booking_ids, marker):
+    """Claim a batch with the sent-marker, then send reminders for the claimed rows"""
+    from maua.notifications.notification_service import NotificationService
+
+    # Claim first so a concurrent run (or a retry) can never send the same reminder
+    Booking.query.filter(
+        Booking.id.in_(booking_ids),
+        Booking.reminder_sent_at.is_(None)
+    ).update({'reminder_sent_at': marker}, synchronize_session=False)
+    db.session.commit()
+
+    bookings = Booking.query.options(
+        joinedload(Booking.trip).joinedload(Trip.route).joinedload(Route.origin),
+        joinedload(Booking.trip).joinedload(Trip.route).joinedload(Route.destination),
+        joinedload(Booking.trip).joinedload(Trip.vehicle),
+        joinedload(Booking.passenger),
+    ).filter(
+        Booking.id.in_(booking_ids),
+        Booking.reminder_sent_at == marker
+    ).all()
+
+    for booking in bookings:
+        NotificationService.notify_trip_reminder(booking)
+    return len(bookings)
+
+
+def dispatch_reminders(now=None, lead_hours=None, bucket_minutes=None, batch_size=None) -> dict:
+    """Run one reminder tick. Returns counts of buckets and reminders sent."""
+    config = current_app.config
+    now = now or datetime.utcnow()
+    lead = timedelta(hours=lead_hours or config.get('TRIP_REMINDER_LEAD_HOURS', 24))
+    bucket_minutes = bucket_minutes or config.get('TRIP_REMINDER_BUCKET_MINUTES', 60)
+    batch_size = batch_size or config.get('TRIP_REMINDER_BATCH_SIZE', 100)
+
+    due = find_due_bookings(now, lead)
+
+    buckets = defaultdict(list)
+    for booking_id, depart_at in due:
+        buckets[_bucket_start(depart_at, bucket_minutes)].append(booking_id)
+
+    sent = 0
+    for bucket in sorted(buckets):
+        ids = buckets[bucket]
+        for start in range(0, len(ids), batch_size):
+            try:
+                sent += _dispatch_batch(ids[start:start + batch_size], now)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Trip reminder batch for {bucket} failed: {e}")
+
+    logger.info(f"Trip reminders: {sent} sent across {len(buckets)} bucket(s)")
+    return {'buckets': len(buckets), 'sent': sent}
@@ -0,0 +1,113 @@
+"""
+Notification retention for MAUA SHARK EXPRESS
+Moves read and expired notifications from the hot `notifications` table into
+`notifications_archive` in bounded batches, and streams archived history out as CSV.
+
+Run on a schedule (e.g. a nightly Render cron job):
+    flask --app wsgi notifications archive
+"""
+
+import csv
+import io
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, or_
+
+from maua.extensions import db
+from maua.notifications.models import Notification, NotificationArchive, NotificationCounter
+
+logger = logging.getLogger(__name__)
+
+
+def _expired_filter(now, read_days, unread_days):
+    """Read notifications older than `read_days`, or any notification older than `unread_days`"""
+    return or_(
+        and_(Notification.is_read == True, Notification.created_at < now - timedelta(days=read_days)),
+        Notification.created_at < now - timedelta(days=unread_days),
+    )
+
+
+def archive_batch(read_days, unread_days, batch_size, now=None) -> int:
+    """Archive one batch of expired notifications and commit. Returns rows moved."""
+    now = now or datetime.utcnow()
+    rows = db.session.query(
+        Notification.id, Notification.audience, Notification.user_id, Notification.is_read
+    ).filter(
+        _expired_filter(now, read_days, unread_days)
+    ).order_by(Notification.id.asc()).limit(batch_size).all()
+    if not rows:
+        return 0
+
+    # Unread rows leaving the hot table must come off the materialized counters
+    unread = Counter((r.audience, r.user_id) for r in rows if not r.is_read)
+    moved = NotificationArchive.move(Notification.query.filter(Notification.id.in_([r.id for r in rows])))
+    for (audience, user_id), count in unread.items():
+        NotificationCounter.adjust(audience, user_id, -count)
+    db.session.commit()
+    return moved
+
+
+def archive_expired(read_days=None, unread_days=None, batch_size=None, max_batches=None) -> int:
+    """Archive expired notifications batch by batch until none are left (or `max_batches`).
+
+    Each batch is its own short transaction so locks on the hot table stay brief.
+    """
+    config = current_app.config
+    read_days = read_days or config.get('NOTIFICATION_RETENTION_READ_DAYS', 30)
+    unread_days = unread_days or config.get('NOTIFICATION_RETENTION_UNREAD_DAYS', 90)
+    batch_size = batch_size or config.get('NOTIFICATION_ARCHIVE_BATCH_SIZE', 1000)
+
+    now = datetime.utcnow()
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        try:
+            moved = archive_batch(read_days, unread_days, batch_size, now=now)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Notification archive batch failed: {e}")
+            break
+        if not moved:
+            break
+        total += moved
+        batches += 1
+
+    logger.info(f"Archived {total} notifications in {batches} batch(es)")
+    return total
+
+
+ARCHIVE_EXPORT_COLUMNS = (
+    'id', 'created_at', 'audience', 'user_id', 'notification_type', 'title', 'message',
+    'booking_id', 'trip_id', 'parcel_id', 'is_read', 'read_at', 'archived_at',
+)
+
+
+def iter_archive_csv(start=None, end=None, audience=None, chunk_size=1000):
+    """Yield archived notifications as CSV text, one chunk of rows at a time"""
+    query = NotificationArchive.query
+    if start:
+        query = query.filter(NotificationArchive.created_at >= start)
+    if end:
+        query = query.filter(NotificationArchive.created_at < end)
+    if audience:
+        query = query.filter(NotificationArchive.audience == audience)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(ARCHIVE_EXPORT_COLUMNS)
+
+    rows = 0
+    for notification in query.order_by(NotificationArchive.id.asc()).yield_per(chunk_size):
+        writer.writerow([
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in (getattr(notification, name) for name in ARCHIVE_EXPORT_COLUMNS)
+        ])
+        rows += 1
+        if rows % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
@@ -1,8 +1,11 @@
-from flask import Blueprint, jsonify, request, render_template
+import time
+from datetime import datetime
+import click
+from flask import Blueprint, jsonify, request, render_template, Response, stream_with_context
 from flask_login import login_required, current_user
 from maua.extensions import db
-from maua.notifications.models import Notification
-from datetime import datetime
+from maua.notifications.models import Notification, NotificationCounter
+from maua.notifications.broker import broker
 
 notifications_bp = Blueprint('notifications', __name__, url_prefix='/notifications')
 
@@ -20,6 +23,30 @@ def staff_or_admin_required(f):
     return decorated_function
 
 
+def _delta_response(notifications, cursor, unread_count):
+    """Build a delta payload; the returned cursor is the newest id the client has seen"""
+    if notifications:
+        cursor = max(cursor, notifications[-1].id)
+    return jsonify({
+        'notifications': [n.to_dict() for n in notifications],
+        'cursor': cursor,
+        'unread_count': unread_count
+    })
+
+
+def _event_stream_response(channel):
+    """Server-sent event stream of new notifications for one channel.
+
+    Only notifications created in this process are pushed, so clients treat
+    events as hints and also resync from their cursor on connect and on a timer.
+    The cap, keepalives and lifetime are shared with the seat streams
+    (see maua.streams); clients that are turned away just keep delta polling.
+    """
+    from maua.streams import event_stream_response
+    return event_stream_response(lambda: broker.subscribe(channel), lambda q: broker.unsubscribe(channel, q),
+                                 event='notification')
+
+
 # ============================================================================
 # CUSTOMER NOTIFICATION ENDPOINTS
 # ============================================================================
@@ -31,10 +58,28 @@ def customer_list():
     notifications = Notification.get_recent_for_customer(current_user.id, limit=30)
     return jsonify({
         'notifications': [n.to_dict() for n in notifications],
+        'cursor': max((n.id for n in notifications), default=0),
         'unread_count': Notification.get_unread_count_for_customer(current_user.id)
     })
 
 
+@notifications_bp.route('/api/customer/delta')
+@login_required
+def customer_delta():
+    """Get customer notifications newer than the client's cursor"""
+    cursor = request.args.get('cursor', 0, type=int)
+    notifications = Notification.get_since_for_customer(current_user.id, cursor)
+    return _delta_response(notifications, cursor,
+                           Notification.get_unread_count_for_customer(current_user.id))
+
+
+@notifications_bp.route('/stream/customer')
+@login_required
+def customer_stream():
+    """Push new notifications to the current customer as they are created"""
+    return _event_stream_response(NotificationCounter.key_for('customer', current_user.id))
+
+
 @notifications_bp.route('/api/customer/unread-count')
 @login_required
 def customer_unread_count():
@@ -65,12 +110,7 @@ def customer_mark_read(notification_id):
 @login_required
 def customer_mark_all_read():
     """Mark all notifications as read for customer"""
-    Notification.query.filter(
-        Notification.user_id == current_user.id,
-        Notification.audience == 'customer',
-        Notification.is_read == False
-    ).update({'is_read': True, 'read_at': datetime.utcnow()})
-    
+    Notification.mark_all_read_for_customer(current_user.id)
     db.session.commit()
     return jsonify({'success': True})
 
@@ -79,11 +119,7 @@ def customer_mark_all_read():
 @login_required
 def customer_clear_all():
     """Delete all notifications for customer"""
-    Notification.query.filter(
-        Notification.user_id == current_user.id,
-        Notification.audience == 'customer'
-    ).delete()
-    
+    Notification.clear_for_customer(current_user.id)
     db.session.commit()
     return jsonify({'success': True, 'message': 'All notifications cleared'})
 
@@ -100,10 +136,29 @@ def staff_list():
     notifications = Notification.get_recent_for_staff(limit=50)
     return jsonify({
         'notifications': [n.to_dict() for n in notifications],
+        'cursor': max((n.id for n in notifications), default=0),
         'unread_count': Notification.get_unread_count_for_staff()
     })
 
 
+@notifications_bp.route('/api/staff/delta')
+@login_required
+@staff_or_admin_required
+def staff_delta():
+    """Get staff notifications newer than the client's cursor"""
+    cursor = request.args.get('cursor', 0, type=int)
+    notifications = Notification.get_since_for_staff(cursor)
+    return _delta_response(notifications, cursor, Notification.get_unread_count_for_staff())
+
+
+@notifications_bp.route('/stream/staff')
+@login_required
+@staff_or_admin_required
+def staff_stream():
+    """Push new staff notifications (e.g. new online bookings) as they are created"""
+    return _event_stream_response(NotificationCounter.key_for('staff'))
+
+
 @notifications_bp.route('/api/staff/unread-count')
 @login_required
 @staff_or_admin_required
@@ -137,11 +192,7 @@ def staff_mark_read(notification_id):
 @staff_or_admin_required
 def staff_mark_all_read():
     """Mark all staff notifications as read"""
-    Notification.query.filter(
-        Notification.audience == 'staff',
-        Notification.is_read == False
-    ).update({'is_read': True, 'read_at': datetime.utcnow()})
-    
+    Notification.mark_all_read_for_staff()
     db.session.commit()
     return jsonify({'success': True})
 
@@ -151,10 +202,7 @@ def staff_mark_all_read():
 @staff_or_admin_required
 def staff_clear_all():
     """Delete all staff notifications"""
-    Notification.query.filter(
-        Notification.audience == 'staff'
-    ).delete()
-    
+    Notification.clear_for_staff()
     db.session.commit()
     return jsonify({'success': True, 'message': 'All notifications cleared'})
 
@@ -179,3 +227,68 @@ def staff_notifications_page():
     notifications = Notification.get_recent_for_staff(limit=100)
     return render_template('notifications/staff_list.html', notifications=notifications)
 
+
+@notifications_bp.route('/staff/archive/export.csv')
+@login_required
+@staff_or_admin_required
+def staff_archive_export():
+    """Stream archived notification history as CSV (optional ?from=YYYY-MM-DD&to=YYYY-MM-DD&audience=)"""
+    from maua.notifications.retention import iter_archive_csv
+    
+    try:
+        start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else None
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    audience = request.args.get('audience') or None
+    
+    filename = f"notifications_archive_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.csv"
+    return Response(
+        stream_with_context(iter_archive_csv(start, end, audience)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+
+# ============================================================================
+# MAINTENANCE COMMANDS (flask --app wsgi notifications <command>)
+# ============================================================================
+
+@notifications_bp.cli.command('archive')
+@click.option('--read-days', type=int, default=None, help='Archive read notifications older than this')
+@click.option('--unread-days', type=int, default=None, help='Archive any notification older than this')
+@click.option('--batch-size', type=int, default=None, help='Rows moved per transaction')
+@click.option('--max-batches', type=int, default=None, help='Stop after this many batches')
+def archive_command(read_days, unread_days, batch_size, max_batches):
+    """Move read and expired notifications into the archive table."""
+    from maua.notifications.retention import archive_expired
+    
+    moved = archive_expired(read_days, unread_days, batch_size, max_batches)
+    click.echo(f"Archived {moved} notification(s)")
+
+
+@notifications_bp.cli.command('send-reminders')
+@click.option('--lead-hours', type=int, default=None, help='Remind bookings departing within this many hours')
+@click.option('--every', type=int, default=None, help='Keep running, ticking every N seconds')
+def send_reminders_command(lead_hours, every):
+    """Dispatch pre-departure trip reminders (each booking is reminded once)."""
+    from maua.notifications.reminders import dispatch_reminders
+    
+    while True:
+        result = dispatch_reminders(lead_hours=lead_hours)
+        click.echo(f"Sent {result['sent']} reminder(s) across {result['buckets']} bucket(s)")
+        if not every:
+            break
+        time.sleep(every)
+    _wait_for_background_sends()
+
+
+def _wait_for_background_sends(timeout=30):
+    """SMS/email go out on daemon threads; let them finish before a CLI process exits"""
+    import threading
+    from maua.notifications.coalesce import SmsCoalescer
+    
+    SmsCoalescer.flush_all()
+    for thread in threading.enumerate():
+        if thread is not threading.current_thread() and thread.daemon:
+            thread.join(timeout=timeout)
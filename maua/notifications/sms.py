@@ -151,49 +151,96 @@ def _send_twilio_async(app, client, phone: str, from_number: str, message: str,
             logger.warning('No email provided for fallback - SMS to %s will not be delivered', phone)
 
 
-def send_sms(phone_number: str, message: str, sender_id: Optional[str] = None, user_email: str = None) -> bool:
+def send_sms(phone_number: str, message: str, sender_id: Optional[str] = None, user_email: str = None,
+             template: Optional[str] = None, entity: Optional[str] = None) -> bool:
     """Send an SMS via available provider (non-blocking).
 
-    Returns True immediately after queuing the SMS. Actual delivery happens in background.
+    Messages go through `SmsCoalescer`: a repeat of the same (recipient, template,
+    entity) message is suppressed, and messages to one recipient sent within a
+    few seconds of each other are merged into one SMS.
+
+    Returns True as soon as the SMS is queued (delivery happens in the background),
+    False if it was suppressed as a duplicate or could not be queued.
     """
     try:
         phone = normalize_phone(phone_number)
         if not phone or not message:
             return False
 
-        # Try Twilio first if configured
-        client = _twilio_client_or_none()
-        if client is not None:
-            from_number = os.environ.get('TWILIO_FROM_NUMBER')
-            
-            # Get app instance for background thread
-            try:
-                app = current_app._get_current_object()
-                
-                # Send in background thread to avoid blocking request
-                thread = Thread(
-                    target=_send_twilio_async, 
-                    args=(app, client, phone, from_number, message, user_email)
-                )
-                thread.daemon = True
-                thread.start()
-                
-                logging.getLogger(__name__).info('SMS queued for %s', phone)
-                return True
-            except RuntimeError:
-                # No app context (e.g., during testing) - try synchronous
-                try:
-                    client.messages.create(to=phone, from_=from_number, body=message)
-                    return True
-                except Exception as exc:
-                    logging.getLogger(__name__).warning('Twilio send failed: %s', exc)
-                    return _send_email_fallback(phone, message, user_email)
-
-        # No Twilio configured - log message (development mode)
-        logging.getLogger(__name__).info('SMS to %s: %s', phone, message[:50])
-        return True
+        try:
+            app = current_app._get_current_object()
+        except RuntimeError:
+            # No app context (e.g., during testing) - send directly
+            return _deliver_sms(phone, message, user_email)
+
+        from maua.notifications.coalesce import SmsCoalescer
+        return SmsCoalescer.submit(app, phone, message, _deliver_sms,
+                                   user_email=user_email, template=template, entity=entity)
     except Exception as exc:
         logging.getLogger(__name__).error('send_sms error: %s', exc)
         return False
 
 
+def send_sms_batch(messages) -> int:
+    """Send many SMS from the calling thread (e.g. a background batch job).
+
+    `messages` holds dicts with phone, message and optionally user_email, template
+    and entity. Duplicates are suppressed like `send_sms`, but nothing is buffered
+    per recipient and no thread is started per message. Returns the number sent.
+    """
+    app = current_app._get_current_object()
+    from maua.notifications.coalesce import SmsCoalescer
+    client = _twilio_client_or_none()
+    from_number = os.environ.get('TWILIO_FROM_NUMBER')
+    sent = 0
+    for item in messages:
+        phone = normalize_phone(item.get('phone'))
+        message = item.get('message')
+        if not phone or phone == 'N/A' or not message:
+            continue
+        if not SmsCoalescer.claim(app, phone, message, item.get('template'), item.get('entity')):
+            continue
+        try:
+            if client is not None:
+                _send_twilio_async(app, client, phone, from_number, message, item.get('user_email'))
+            else:
+                logging.getLogger(__name__).info('SMS to %s: %s', phone, message[:50])
+            sent += 1
+        except Exception as exc:
+            logging.getLogger(__name__).error('Batch SMS to %s failed: %s', phone, exc)
+    return sent
+
+
+def _deliver_sms(phone: str, message: str, user_email: str = None) -> bool:
+    """Hand one (already normalized) message to the provider."""
+    # Try Twilio first if configured
+    client = _twilio_client_or_none()
+    if client is not None:
+        from_number = os.environ.get('TWILIO_FROM_NUMBER')
+        
+        # Get app instance for background thread
+        try:
+            app = current_app._get_current_object()
+            
+            # Send in background thread to avoid blocking request
+            thread = Thread(
+                target=_send_twilio_async, 
+                args=(app, client, phone, from_number, message, user_email)
+            )
+            thread.daemon = True
+            thread.start()
+            
+            logging.getLogger(__name__).info('SMS queued for %s', phone)
+            return True
+        except RuntimeError:
+            # No app context (e.g., during testing) - try synchronous
+            try:
+                client.messages.create(to=phone, from_=from_number, body=message)
+                return True
+            except Exception as exc:
+                logging.getLogger(__name__).warning('Twilio send failed: %s', exc)
+                return _send_email_fallback(phone, message, user_email)
+
+    # No Twilio configured - log message (development mode)
+    logging.getLogger(__name__).info('SMS to %s: %s', phone, message[:50])
+    return True
@@ -0,0 +1,249 @@
+"""
+Bulk parcel intake for MAUA SHARK EXPRESS
+Lets depot staff register a whole drop-off (CSV, JSON array or JSON Lines) in
+one request: rows are parsed as a stream and validated, then parcels, payments
+and their 'created' events go in with multi-row INSERTs in a single
+transaction. Notifications for the batch are sent by one background job.
+"""
+
+import csv
+import io
+import json
+import logging
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from threading import Thread
+
+from flask import current_app
+from sqlalchemy import String, insert
+
+from maua.extensions import db
+from maua.notifications.sms import normalize_phone
+from maua.parcels.models import Parcel, ParcelEvent
+from maua.parcels.pricing import get_table
+from maua.parcels.refcodes import next_parcel_ref
+from maua.stats import counters as stats
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_FIELDS = ('sender_name', 'sender_phone', 'receiver_name', 'receiver_phone',
+                   'origin_name', 'destination_name')
+OPTIONAL_FIELDS = ('sender_email', 'sender_id_number', 'receiver_email', 'receiver_id_number', 'weight_kg',
+                   'price')  # price defaults to the tariff quote
+PAYMENT_METHODS = ('cash', 'mpesa')
+# Column widths, so an oversized field is reported against its row instead of failing the INSERT
+FIELD_LENGTHS = {
+    field: Parcel.__table__.c[field].type.length
+    for field in REQUIRED_FIELDS + OPTIONAL_FIELDS
+    if isinstance(Parcel.__table__.c[field].type, String) and Parcel.__table__.c[field].type.length
+}
+
+
+class BulkIntakeError(Exception):
+    """The batch was rejected; `errors` lists (row number, message) pairs"""
+
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} error(s) in parcel batch')
+        self.errors = errors
+
+
+def _iter_json_array(stream, chunk_size=64 * 1024):
+    """Yield objects from a JSON array without loading the whole document"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    while True:
+        chunk = stream.read(chunk_size)
+        buffer += chunk
+        while True:
+            buffer = buffer.lstrip()
+            if not started:
+                if not buffer:
+                    break
+                if buffer[0] != '[':
+                    raise ValueError('Expected a JSON array of parcels')
+                buffer = buffer[1:]
+                started = True
+                continue
+            if buffer.startswith(','):
+                buffer = buffer[1:]
+                continue
+            if buffer.startswith(']'):
+                return
+            try:
+                obj, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                break  # need more input
+            yield obj
+            buffer = buffer[end:]
+        if not chunk:
+            raise ValueError('Unexpected end of JSON array')
+
+
+def iter_rows(stream, fmt):
+    """Yield raw row dicts from a binary stream in 'csv', 'json' or 'jsonl' format"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='' if fmt == 'csv' else None)
+    if fmt == 'csv':
+        for row in csv.DictReader(text):
+            yield {k.strip(): v for k, v in row.items() if k}
+    elif fmt == 'jsonl':
+        for line in text:
+            if line.strip():
+                yield json.loads(line)
+    elif fmt == 'json':
+        yield from _iter_json_array(text)
+    else:
+        raise ValueError(f'Unsupported batch format: {fmt}')
+
+
+def validate_row(row, tariff=None):
+    """Return (clean values, error messages) for one raw row; rows without a price are quoted from `tariff`"""
+    errors = []
+    if not isinstance(row, dict):
+        return None, ['Row must be an object']
+    values = {k: (str(row.get(k)).strip() if row.get(k) is not None else '') for k in REQUIRED_FIELDS + OPTIONAL_FIELDS}
+
+    for field in REQUIRED_FIELDS:
+        if not values[field]:
+            errors.append(f'{field} is required')
+    for field, length in FIELD_LENGTHS.items():
+        if len(values[field]) > length:
+            errors.append(f'{field} must be at most {length} characters')
+    try:
+        price = Decimal(values['price']) if values['price'] else None
+        if price is not None and price <= 0:
+            errors.append('price must be positive')
+    except InvalidOperation:
+        price = None
+        errors.append('price must be a number')
+    try:
+        weight = float(values['weight_kg']) if values['weight_kg'] else None
+    except ValueError:
+        weight = None
+        errors.append('weight_kg must be a number')
+    if price is None and not errors:
+        quoted = tariff.quote(values['origin_name'], values['destination_name'], weight) if tariff else None
+        if quoted is None:
+            errors.append('price is required (no tariff for this route)')
+        else:
+            price = Decimal(quoted)
+    if errors:
+        return None, errors
+
+    values['price'] = price
+    values['weight_kg'] = weight
+    for field in ('sender_email', 'receiver_email'):
+        values[field] = values[field] or None
+    for field in ('sender_id_number', 'receiver_id_number'):
+        values[field] = values[field] or 'N/A'
+    return values, []
+
+
+def parse_batch(stream, fmt):
+    """Parse and validate a whole batch; raise BulkIntakeError listing every bad row"""
+    max_rows = current_app.config.get('PARCEL_BULK_MAX_ROWS', 500)
+    tariff = get_table()
+    rows, errors = [], []
+    try:
+        for number, raw in enumerate(iter_rows(stream, fmt), start=1):
+            if number > max_rows:
+                errors.append((number, f'Batch is limited to {max_rows} parcels'))
+                break
+            values, row_errors = validate_row(raw, tariff)
+            errors.extend((number, message) for message in row_errors)
+            if values:
+                rows.append(values)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        errors.append((0, f'Could not read batch: {e}'))
+    if not rows and not errors:
+        errors.append((0, 'Batch contains no parcels'))
+    if errors:
+        raise BulkIntakeError(errors)
+    return rows
+
+
+def create_batch(rows, payment_method, actor_id):
+    """Insert parcels, payments and 'created' events for validated rows in one transaction.
+
+    Returns the new parcels, in input order.
+    """
+    from maua.payment.models import Payment
+
+    if payment_method not in PAYMENT_METHODS:
+        raise BulkIntakeError([(0, f'payment_method must be one of {", ".join(PAYMENT_METHODS)}')])
+    paid = payment_method == 'cash'
+    now = datetime.utcnow()
+
+    parcel_rows = []
+    for values in rows:
+        parcel_rows.append(dict(
+            values,
+            ref_code=next_parcel_ref(),
+            # Bulk INSERTs bypass Parcel's @validates hook, so normalize here
+            sender_phone_normalized=normalize_phone(values['sender_phone']),
+            receiver_phone_normalized=normalize_phone(values['receiver_phone']),
+            status='pending' if paid else 'pending_payment',
+            payment_status='paid' if paid else 'pending',
+            created_by=actor_id,
+            created_at=now,
+        ))
+
+    try:
+        inserted = db.session.execute(
+            insert(Parcel).returning(Parcel.id, Parcel.ref_code, sort_by_parameter_order=True),
+            parcel_rows,
+        ).all()
+        ids = [row.id for row in inserted]
+
+        db.session.execute(insert(Payment), [{
+            'amount': float(values['price']),
+            'payment_method': payment_method,
+            'status': 'completed' if paid else 'pending',
+            'user_id': actor_id,
+            'parcel_id': parcel_id,
+            'payment_date': now,
+        } for parcel_id, values in zip(ids, rows)])
+
+        db.session.execute(insert(ParcelEvent), [{
+            'parcel_id': parcel_id,
+            'event_type': 'created',
+            'status': parcel_row['status'],
+            'payload': {
+                'origin': parcel_row['origin_name'],
+                'destination': parcel_row['destination_name'],
+                'payment_method': payment_method,
+                'bulk': True,
+            },
+            'actor_id': actor_id,
+            'created_at': now,
+        } for parcel_id, parcel_row in zip(ids, parcel_rows)])
+
+        stats.adjust('parcels_total', len(ids))  # Core INSERTs skip the ORM counter hooks
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    by_id = {p.id: p for p in Parcel.query.filter(Parcel.id.in_(ids)).all()}
+    return [by_id[parcel_id] for parcel_id in ids]
+
+
+def _send_batch_notifications(app, parcel_ids):
+    from maua.notifications.notification_service import NotificationService
+
+    with app.app_context():
+        try:
+            parcels = Parcel.query.filter(Parcel.id.in_(parcel_ids)).order_by(Parcel.id.asc()).all()
+            NotificationService.notify_parcels_bulk_created(parcels)
+        except Exception as e:
+            logger.error(f"Bulk intake notifications failed: {e}")
+        finally:
+            db.session.remove()
+
+
+def queue_batch_notifications(parcel_ids):
+    """Send the whole batch's notifications from one background job"""
+    app = current_app._get_current_object()
+    thread = Thread(target=_send_batch_notifications, args=(app, list(parcel_ids)))
+    thread.daemon = True
+    thread.start()
@@ -0,0 +1,225 @@
+"""
+Parcel dispatch planning for MAUA SHARK EXPRESS
+Packs pending parcels onto the day's scheduled trips for their route, limited
+by each vehicle's `cargo_capacity_kg`, and builds per-trip manifests.
+
+Packing is first-fit decreasing per lane (origin -> destination): heaviest
+parcels first, each onto the earliest trip that still has room, so parcels
+leave as early as possible and big items are not stranded behind small ones.
+Parcels without a recorded weight count as `PARCEL_DEFAULT_WEIGHT_KG`.
+
+When a trip is cancelled its undelivered parcels go back to the pending pool
+(`unassign_trips`, called from the trip status change) so the next dispatch
+can place them on another trip.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import joinedload
+
+from maua.extensions import db
+from maua.catalog.models import Trip, Route
+from maua.parcels.models import Parcel, ParcelEvent
+
+logger = logging.getLogger(__name__)
+
+# Parcels taken off a cancelled trip; delivered ones stay on it as history
+UNASSIGN_STATUSES = ('pending', 'in_transit')
+
+
+def _key(name):
+    return (name or '').strip().lower()
+
+
+def _default_weight():
+    return current_app.config.get('PARCEL_DEFAULT_WEIGHT_KG', 1.0)
+
+
+def parcel_weight(parcel):
+    return parcel.weight_kg if parcel.weight_kg else _default_weight()
+
+
+def _trip_lanes(trip):
+    """(origin, destination) keys a trip serves; parcels may name the depot or its town"""
+    origin, destination = trip.route.origin, trip.route.destination
+    return {(o, d) for o in {_key(origin.name), _key(origin.town)}
+            for d in {_key(destination.name), _key(destination.town)}}
+
+
+def current_loads(trip_ids):
+    """Parcel weight already on each trip, from one GROUP BY"""
+    if not trip_ids:
+        return {}
+    rows = db.session.query(
+        Parcel.trip_id,
+        func.sum(func.coalesce(Parcel.weight_kg, _default_weight()))
+    ).filter(Parcel.trip_id.in_(trip_ids)).group_by(Parcel.trip_id).all()
+    return {trip_id: float(load or 0) for trip_id, load in rows}
+
+
+def plan_dispatch(day, now=None, lock=False):
+    """Plan which pending parcels go on which of `day`'s upcoming trips.
+
+    Returns {'trips': [{'trip', 'parcels', 'load_kg', 'capacity_kg'}, ...],
+    'unassigned': [(parcel, reason), ...]}. Nothing is written.
+    """
+    now = now or datetime.utcnow()
+    start = datetime.combine(day, datetime.min.time())
+    query = Trip.query.options(
+        joinedload(Trip.route).joinedload(Route.origin),
+        joinedload(Trip.route).joinedload(Route.destination),
+        joinedload(Trip.vehicle),
+    ).filter(
+        Trip.status == 'scheduled',
+        Trip.depart_at >= max(start, now),
+        Trip.depart_at < start + timedelta(days=1),
+    ).order_by(Trip.depart_at.asc(), Trip.id.asc())
+    if lock:
+        # Serialize concurrent dispatches so two staff cannot overfill a vehicle
+        query = query.with_for_update(of=Trip)
+    trips = query.all()
+
+    loads = current_loads([t.id for t in trips])
+    bins = []
+    trips_by_lane = defaultdict(list)
+    for trip in trips:
+        capacity = trip.vehicle.cargo_capacity_kg if trip.vehicle else 0
+        entry = {'trip': trip, 'parcels': [], 'load_kg': loads.get(trip.id, 0.0), 'capacity_kg': capacity or 0}
+        bins.append(entry)
+        for lane in _trip_lanes(trip):
+            trips_by_lane[lane].append(entry)
+
+    pending = Parcel.query.filter(
+        Parcel.status == 'pending',
+        Parcel.trip_id.is_(None),
+    ).order_by(Parcel.created_at.asc()).all()
+
+    lanes = defaultdict(list)
+    for parcel in pending:
+        lanes[(_key(parcel.origin_name), _key(parcel.destination_name))].append(parcel)
+
+    unassigned = []
+    for lane, parcels in lanes.items():
+        candidates = trips_by_lane.get(lane)
+        if not candidates:
+            unassigned.extend((p, 'No trip on this route') for p in parcels)
+            continue
+        # First-fit decreasing; the sort is stable so ties keep drop-off order
+        for parcel in sorted(parcels, key=parcel_weight, reverse=True):
+            weight = parcel_weight(parcel)
+            for entry in candidates:
+                if entry['load_kg'] + weight <= entry['capacity_kg']:
+                    entry['parcels'].append(parcel)
+                    entry['load_kg'] += weight
+                    break
+            else:
+                reason = 'Heavier than any vehicle' if all(weight > e['capacity_kg'] for e in candidates) else 'No capacity left'
+                unassigned.append((parcel, reason))
+
+    return {'trips': bins, 'unassigned': unassigned}
+
+
+def apply_dispatch(plan, actor_id=None):
+    """Write a plan: one set-based UPDATE per trip plus the matching events, one commit.
+
+    Parcels changed since planning (no longer pending or already on a trip) are skipped.
+    Returns the number of parcels assigned.
+    """
+    assigned = 0
+    events = []
+    now = datetime.utcnow()
+    try:
+        for entry in plan['trips']:
+            if not entry['parcels']:
+                continue
+            trip = entry['trip']
+            plate = trip.vehicle.plate_no if trip.vehicle else None
+            ids = db.session.execute(
+                update(Parcel).where(
+                    Parcel.id.in_([p.id for p in entry['parcels']]),
+                    Parcel.trip_id.is_(None),
+                    Parcel.status == 'pending',
+                ).values(
+                    trip_id=trip.id,
+                    vehicle_plate=plate,
+                    driver_name=trip.driver_name,
+                    driver_phone=trip.driver_phone,
+                ).returning(Parcel.id).execution_options(synchronize_session=False)
+            ).scalars().all()
+            assigned += len(ids)
+            events.extend({
+                'parcel_id': parcel_id,
+                'event_type': 'assigned',
+                'status': 'pending',
+                'payload': {'trip_id': trip.id, 'vehicle_plate': plate, 'depart_at': trip.depart_at.isoformat()},
+                'actor_id': actor_id,
+                'created_at': now,
+            } for parcel_id in ids)
+        if events:
+            db.session.execute(insert(ParcelEvent), events)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    db.session.expire_all()
+    logger.info(f"Dispatched {assigned} parcels onto {sum(1 for e in plan['trips'] if e['parcels'])} trips")
+    return assigned
+
+
+def unassign_trips(trip_ids, reason, actor_id=None):
+    """Put the undelivered parcels of `trip_ids` back in the pending pool, with an event each.
+
+    Runs inside the caller's transaction (the caller commits). Returns the
+    number of parcels unassigned.
+    """
+    rows = db.session.execute(
+        select(Parcel.id, Parcel.trip_id, Parcel.status, Parcel.vehicle_plate).where(
+            Parcel.trip_id.in_(list(trip_ids)),
+            Parcel.status.in_(UNASSIGN_STATUSES),
+        ).with_for_update()
+    ).all()
+    if not rows:
+        return 0
+    db.session.execute(
+        update(Parcel).where(Parcel.id.in_([row.id for row in rows])).values(
+            trip_id=None,
+            status='pending',
+            vehicle_plate=None,
+            driver_name=None,
+            driver_phone=None,
+        ).execution_options(synchronize_session=False)
+    )
+    now = datetime.utcnow()
+    db.session.execute(insert(ParcelEvent), [{
+        'parcel_id': row.id,
+        'event_type': 'unassigned',
+        'status': 'pending',
+        'payload': {'trip_id': row.trip_id, 'vehicle_plate': row.vehicle_plate, 'from': row.status, 'reason': reason},
+        'actor_id': actor_id,
+        'created_at': now,
+    } for row in rows])
+    return len(rows)
+
+
+def dispatch_day(day, actor_id=None):
+    """Plan and apply a day's dispatch in one transaction. Returns (assigned, plan)."""
+    plan = plan_dispatch(day, lock=True)
+    return apply_dispatch(plan, actor_id=actor_id), plan
+
+
+def trip_manifest(trip):
+    """Parcels on a trip grouped for loading, with totals"""
+    parcels = trip.parcels.order_by(Parcel.destination_name.asc(), Parcel.ref_code.asc()).all()
+    total = sum(parcel_weight(p) for p in parcels)
+    capacity = trip.vehicle.cargo_capacity_kg if trip.vehicle else 0
+    return {
+        'trip': trip,
+        'parcels': parcels,
+        'total_kg': total,
+        'capacity_kg': capacity,
+        'remaining_kg': max((capacity or 0) - total, 0),
+    }
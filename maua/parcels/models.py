@@ -1,5 +1,8 @@
 from datetime import datetime
+from sqlalchemy import event, select, union
+from sqlalchemy.orm import validates
 from maua.extensions import db
+from maua.notifications.sms import normalize_phone
 
 
 class Parcel(db.Model):
@@ -26,13 +29,115 @@ class Parcel(db.Model):
     driver_phone = db.Column(db.String(30))   # e.g., +2547...
     created_by = db.Column(db.Integer, db.ForeignKey("user.id"))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # ETag source for tracking pages
     photo_filename = db.Column(db.String(255))
+    # Trip the parcel travels on (set by dispatch, see parcels.manifest)
+    trip_id = db.Column(db.Integer, db.ForeignKey("trips.id"), nullable=True, index=True)
+    # Canonical (+254...) forms of the phones above, kept in sync by _normalize_phones
+    sender_phone_normalized = db.Column(db.String(30), index=True)
+    receiver_phone_normalized = db.Column(db.String(30), index=True)
     
     # Relationship with Payment
     payment = db.relationship('Payment', backref=db.backref('parcel', uselist=False), uselist=False)
+    trip = db.relationship('Trip', backref=db.backref('parcels', lazy='dynamic'))
+    
+    # Keyset paging of the staff parcel list, with and without a status filter
+    __table_args__ = (
+        db.Index('ix_parcels_created', 'created_at', 'id'),
+        db.Index('ix_parcels_status_created', 'status', 'created_at', 'id'),
+    )
+    
+    @validates('sender_phone', 'receiver_phone')
+    def _normalize_phones(self, key, value):
+        setattr(self, f'{key}_normalized', normalize_phone(value.strip()) if value else None)
+        return value
+    
+    @classmethod
+    def find_by_phone(cls, phone, limit=20):
+        """Most recent parcels sent or received by `phone`, in any common format"""
+        phone = normalize_phone(phone.strip()) if phone else None
+        if not phone:
+            return []
+        # UNION of two index lookups instead of an OR that can fall back to a scan
+        ids = union(
+            select(cls.id).where(cls.sender_phone_normalized == phone),
+            select(cls.id).where(cls.receiver_phone_normalized == phone),
+        ).subquery()
+        return cls.query.filter(cls.id.in_(select(ids.c.id))).order_by(
+            cls.created_at.desc()
+        ).limit(limit).all()
+
+
+class RefCodeSequence(db.Model):
+    """Counter behind reference codes; workers reserve blocks from it (see parcels.refcodes)"""
+    __tablename__ = "ref_code_sequences"
+    name = db.Column(db.String(30), primary_key=True)
+    next_value = db.Column(db.BigInteger, nullable=False, default=1)
 
 
 class ParcelEvent(db.Model):
+    """Append-only history of a parcel: creation, status changes, assignments, payments.
+
+    Rows are only ever inserted (see the before_update/before_delete guards below);
+    the current state still lives on `Parcel`, this is the audit trail behind it.
+    """
     __tablename__ = "parcel_events"
     id = db.Column(db.Integer, primary_key=True)
-    # Add fields later as needed (e.g., parcel_id, event, created_at)
\ No newline at end of file
+    parcel_id = db.Column(db.Integer, db.ForeignKey("parcels.id"), nullable=False)
+    event_type = db.Column(db.String(30), nullable=False)  # created, status_changed, assigned, payment_confirmed
+    status = db.Column(db.String(20))  # Parcel.status right after the event
+    payload = db.Column(db.JSON)  # e.g. {"from": "pending", "to": "in_transit"}
+    actor_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="SET NULL"), nullable=True)  # None for system/customer
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    parcel = db.relationship('Parcel', backref=db.backref('events', lazy='dynamic'))
+    
+    __table_args__ = (
+        db.Index('ix_parcel_events_parcel_created', 'parcel_id', 'created_at'),
+    )
+    
+    def __repr__(self):
+        return f'<ParcelEvent {self.parcel_id} {self.event_type}>'
+    
+    def to_dict(self):
+        """Public representation (actor is not exposed)"""
+        return {
+            'event_type': self.event_type,
+            'status': self.status,
+            'payload': self.payload or {},
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+        }
+    
+    @classmethod
+    def record(cls, parcel, event_type, payload=None, actor_id=None):
+        """Append an event for `parcel`; it is written with the caller's commit"""
+        event = cls(parcel=parcel, event_type=event_type, status=parcel.status,
+                    payload=payload, actor_id=actor_id, created_at=datetime.utcnow())
+        db.session.add(event)
+        return event
+    
+    @classmethod
+    def timeline(cls, parcel_id):
+        """Events for one parcel, oldest first (served by ix_parcel_events_parcel_created)"""
+        return cls.query.filter_by(parcel_id=parcel_id).order_by(
+            cls.created_at.asc(), cls.id.asc()
+        ).all()
+    
+    @classmethod
+    def timelines(cls, parcel_ids):
+        """Events for many parcels in one query, as {parcel_id: [events oldest first]}"""
+        result = {parcel_id: [] for parcel_id in parcel_ids}
+        if not result:
+            return result
+        rows = cls.query.filter(cls.parcel_id.in_(list(result))).order_by(
+            cls.parcel_id.asc(), cls.created_at.asc(), cls.id.asc()
+        ).all()
+        for row in rows:
+            result[row.parcel_id].append(row)
+        return result
+
+
+@event.listens_for(ParcelEvent, 'before_update')
+@event.listens_for(ParcelEvent, 'before_delete')
+def _parcel_events_are_append_only(mapper, connection, target):
+    raise ValueError('ParcelEvent rows are append-only')
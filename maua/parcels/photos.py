@@ -0,0 +1,159 @@
+"""
+Parcel photo storage for MAUA SHARK EXPRESS
+Uploads are streamed to disk in chunks while being hashed, checked to really be
+an image with Pillow, and stored as ``<sha256>.<ext>`` so identical images share
+one file and names never collide. A thumbnail and a web-sized variant are
+rendered in a one-process pool so resizing never runs on a request thread:
+
+    <sha256>.<ext>          original
+    <sha256>.thumb.jpg      small preview for lists
+    <sha256>.web.jpg        downscaled copy for receipts/status pages
+
+Content-addressed files never change, so they are served with long-lived cache headers.
+"""
+
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp'}
+# Extension stored for each format Pillow detects; anything else is rejected
+FORMAT_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+VARIANTS = ('thumb', 'web')
+CHUNK_SIZE = 64 * 1024
+# Every gunicorn worker gets its own pool, and each spawned process re-imports the
+# app and Pillow, so one process per worker is the most the host can afford
+RESIZE_WORKERS = 1
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def photo_dir() -> str:
+    return os.path.join(current_app.root_path, 'static', 'uploads', 'parcels')
+
+
+def variant_filename(filename: str, size: str) -> str:
+    """Name of the `size` variant for a stored photo (legacy names included)"""
+    stem = filename.rsplit('.', 1)[0]
+    return f'{stem}.{size}.jpg'
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """Lazily start the resize pool; spawn avoids forking a multi-threaded worker"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=RESIZE_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def image_extension(path: str) -> Optional[str]:
+    """Extension for the image at `path`, or None if Pillow cannot read it as an allowed format"""
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            image.verify()
+            return FORMAT_EXTENSIONS.get(image.format)
+    except Exception:
+        # Not an image, truncated, or a decompression bomb
+        return None
+
+
+def store_upload(file) -> Optional[str]:
+    """Save an uploaded image under its content hash and queue its variants.
+
+    The stored extension comes from the detected format, not the client's name.
+    Returns the stored filename, or None if the upload is not an allowed image.
+    """
+    ext = file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ''
+    if ext not in ALLOWED_EXTENSIONS:
+        return None
+
+    directory = photo_dir()
+    os.makedirs(directory, exist_ok=True)
+
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.upload')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = file.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+
+        ext = image_extension(tmp_path)
+        if ext is None:
+            os.remove(tmp_path)
+            return None
+        filename = f'{digest.hexdigest()}.{ext}'
+        path = os.path.join(directory, filename)
+        if os.path.exists(path):
+            # Same image uploaded before: keep the existing copy
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    if not all(os.path.exists(os.path.join(directory, variant_filename(filename, s))) for s in VARIANTS):
+        schedule_variants(path)
+    return filename
+
+
+def schedule_variants(path: str) -> None:
+    """Render variants for `path` in the process pool without waiting for them"""
+    config = current_app.config
+    sizes = {
+        'thumb': config.get('PARCEL_PHOTO_THUMB_SIZE', 240),
+        'web': config.get('PARCEL_PHOTO_WEB_SIZE', 1280),
+    }
+    global _executor
+    try:
+        future = _get_executor().submit(render_variants, path, sizes)
+    except BrokenProcessPool:
+        # A pool process died (e.g. OOM on a huge image); start a fresh pool once
+        with _executor_lock:
+            _executor = None
+        future = _get_executor().submit(render_variants, path, sizes)
+    future.add_done_callback(_log_variant_failure)
+
+
+def _log_variant_failure(future) -> None:
+    exc = future.exception()
+    if exc is not None:
+        logger.error(f"Parcel photo resize failed: {exc}")
+
+
+def render_variants(path: str, sizes: dict) -> None:
+    """Runs in a pool process: write `<stem>.<size>.jpg` for each size (longest edge in px)"""
+    from PIL import Image, ImageOps
+
+    directory, filename = os.path.split(path)
+    with Image.open(path) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        for size, edge in sizes.items():
+            variant = image.copy()
+            variant.thumbnail((edge, edge))
+            target = os.path.join(directory, variant_filename(filename, size))
+            tmp_target = f'{target}.{os.getpid()}.tmp'  # concurrent renders of one photo must not share it
+            variant.save(tmp_target, 'JPEG', quality=82, optimize=True, progressive=True)
+            os.replace(tmp_target, target)
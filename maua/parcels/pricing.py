@@ -0,0 +1,147 @@
+"""
+Parcel pricing for MAUA SHARK EXPRESS
+Prices come from a tariff table precomputed from every active route's
+`distance_km` and the configured rates:
+
+    price = base + per_km * distance_km * band multiplier, rounded up
+
+for each weight band (``PARCEL_WEIGHT_BANDS``). Parcels heavier than the top
+band pay the top band plus ``PARCEL_TARIFF_EXTRA_PER_KG`` per extra kg.
+
+The table lives in process memory, so a quote is a dict lookup plus a bisect.
+It is rebuilt when a route or depot changes in this process, and at least every
+``PARCEL_TARIFF_TTL`` seconds so other workers pick up admin edits.
+"""
+
+import logging
+import math
+import threading
+import time
+from bisect import bisect_left
+from typing import Optional
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload, object_session
+
+from maua.catalog.models import Route, Depot
+
+logger = logging.getLogger(__name__)
+
+
+def _key(name):
+    return (name or '').strip().lower()
+
+
+def _depot_keys(depot):
+    """Names a parcel may use for a depot: its name, its town, or 'Town - Name'"""
+    return {_key(depot.name), _key(depot.town), _key(f'{depot.town} - {depot.name}')}
+
+
+class TariffTable:
+    """Band prices per (origin, destination) lane; immutable once built"""
+
+    def __init__(self, limits, lanes, extra_per_kg):
+        self.limits = limits  # upper weight bound (kg) of each band, ascending
+        self.lanes = lanes  # (origin key, destination key) -> tuple of band prices
+        self.extra_per_kg = extra_per_kg
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def build(cls, config):
+        bands = sorted(config.get('PARCEL_WEIGHT_BANDS', ((5, 1.0),)))
+        base = config.get('PARCEL_TARIFF_BASE', 100)
+        per_km = config.get('PARCEL_TARIFF_PER_KM', 0.5)
+        step = config.get('PARCEL_TARIFF_ROUNDING', 10) or 1
+
+        routes = Route.query.options(
+            joinedload(Route.origin), joinedload(Route.destination)
+        ).filter(Route.active.is_(True), Route.distance_km.isnot(None)).all()
+
+        lanes = {}
+        distances = {}
+        for route in routes:
+            prices = tuple(
+                int(math.ceil((base + per_km * route.distance_km * multiplier) / step) * step)
+                for _, multiplier in bands
+            )
+            for origin in _depot_keys(route.origin):
+                for destination in _depot_keys(route.destination):
+                    lane = (origin, destination)
+                    # Town-level names can match several routes; quote the shortest
+                    if lane not in distances or route.distance_km < distances[lane]:
+                        distances[lane] = route.distance_km
+                        lanes[lane] = prices
+
+        return cls([limit for limit, _ in bands], lanes, config.get('PARCEL_TARIFF_EXTRA_PER_KG', 20))
+
+    def quote(self, origin, destination, weight_kg=None) -> Optional[int]:
+        """Price in KES, or None when no priced route serves the lane"""
+        prices = self.lanes.get((_key(origin), _key(destination)))
+        if prices is None:
+            return None
+        weight = weight_kg or 0
+        band = bisect_left(self.limits, weight)
+        if band < len(prices):
+            return prices[band]
+        return prices[-1] + int(math.ceil(weight - self.limits[-1])) * self.extra_per_kg
+
+    def band_label(self, weight_kg=None) -> str:
+        weight = weight_kg or 0
+        band = bisect_left(self.limits, weight)
+        if band >= len(self.limits):
+            return f'over {self.limits[-1]:g} kg'
+        lower = self.limits[band - 1] if band else 0
+        return f'{lower:g}-{self.limits[band]:g} kg'
+
+
+_table = None
+_lock = threading.Lock()
+
+
+def get_table() -> TariffTable:
+    """The current tariff table, rebuilt if invalidated or older than the TTL"""
+    global _table
+    table = _table
+    ttl = current_app.config.get('PARCEL_TARIFF_TTL', 300)
+    if table is not None and time.monotonic() - table.built_at < ttl:
+        return table
+    with _lock:
+        if _table is None or time.monotonic() - _table.built_at >= ttl:
+            _table = TariffTable.build(current_app.config)
+            logger.info(f"Built parcel tariff table: {len(_table.lanes)} lanes x {len(_table.limits)} bands")
+        return _table
+
+
+def invalidate() -> None:
+    global _table
+    _table = None
+
+
+def quote(origin, destination, weight_kg=None) -> Optional[int]:
+    """Price a single parcel in KES (None if the lane has no tariff)"""
+    return get_table().quote(origin, destination, weight_kg)
+
+
+@event.listens_for(Route, 'after_insert')
+@event.listens_for(Route, 'after_update')
+@event.listens_for(Route, 'after_delete')
+@event.listens_for(Depot, 'after_update')
+def _routes_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info['tariff_stale'] = True
+    else:
+        invalidate()
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    # Rebuilding before the commit landed would cache the old routes until the TTL
+    if session.info.pop('tariff_stale', False):
+        invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending_invalidation(session):
+    session.info.pop('tariff_stale', None)
@@ -1,10 +1,12 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, make_response
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, make_response, jsonify, send_from_directory, abort
 from flask_login import login_required, current_user
 from maua.extensions import db
 from datetime import datetime
 from werkzeug.utils import secure_filename
 import os
-from .models import Parcel
+from .models import Parcel, ParcelEvent
+from . import pricing
+from .tracking import cached_page, parcel_version, rate_limited
 from maua.notifications.sms import send_sms
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -28,6 +30,7 @@ def index():
 
 
 @parcels_bp.route('/track')
+@rate_limited
 def track():
     """Public parcel tracking by reference code.
     Example: /parcels/track?ref=P123456789
@@ -41,16 +44,20 @@ def track():
     
     if ref:
         try:
-            parcel = Parcel.query.filter_by(ref_code=ref.strip()).first()
+            version = parcel_version(ref.strip())
         except Exception:
-            parcel = None
+            version = None
+        if version:
+            parcel_id, last_modified, seed = version
+            return cached_page(
+                ('track', ref), f'{seed}:{ref}', last_modified,
+                lambda: render_template('parcels/track.html', parcel=db.session.get(Parcel, parcel_id),
+                                        parcels_list=[], ref=ref, phone='', not_found=False),
+            )
     elif phone:
         # Allow tracking by sender or receiver phone
         try:
-            parcels_list = Parcel.query.filter(
-                (Parcel.sender_phone == phone.strip()) | 
-                (Parcel.receiver_phone == phone.strip())
-            ).order_by(Parcel.created_at.desc()).limit(20).all()
+            parcels_list = Parcel.find_by_phone(phone, limit=20)
         except Exception:
             parcels_list = []
     
@@ -74,10 +81,104 @@ def create():
     return redirect(url_for('parcels.track'))
 
 @parcels_bp.route('/status/<ref_code>')
+@rate_limited
 def status(ref_code):
-    """View parcel status by reference code - public access"""
-    parcel = Parcel.query.filter_by(ref_code=ref_code).first()
-    if not parcel:
+    """View parcel status by reference code - public access.
+    Conditional requests get a 304 from the version lookup alone.
+    """
+    version = parcel_version(ref_code)
+    if not version:
         flash('Parcel not found.', 'warning')
         return redirect(url_for('parcels.track'))
-    return render_template('parcels/status.html', parcel=parcel)
+    parcel_id, last_modified, seed = version
+    
+    def render():
+        return render_template('parcels/status.html', parcel=db.session.get(Parcel, parcel_id),
+                               events=ParcelEvent.timeline(parcel_id))
+    
+    return cached_page('status', seed, last_modified, render)
+
+
+@parcels_bp.route('/photos/<filename>')
+def photo(filename):
+    """Serve a parcel photo, or its `?size=thumb|web` variant when it has been rendered"""
+    from maua.parcels.photos import photo_dir, variant_filename, VARIANTS
+    
+    directory = photo_dir()
+    if secure_filename(filename) != filename:
+        abort(404)
+    size = request.args.get('size')
+    if size in VARIANTS:
+        variant = variant_filename(filename, size)
+        if os.path.exists(os.path.join(directory, variant)):
+            # Content-addressed, so the bytes behind this URL never change
+            return send_from_directory(directory, variant, max_age=31536000)
+    # Original (or a variant still being rendered): cache briefly
+    return send_from_directory(directory, filename, max_age=300)
+
+
+MAX_TIMELINE_REFS = 100
+
+
+@parcels_bp.route('/api/timelines')
+@rate_limited
+def timelines_api():
+    """Timelines for several parcels at once - public access by reference code.
+    Example: /parcels/api/timelines?refs=P123,P456
+    """
+    refs = [r.strip() for r in request.args.get('refs', '').split(',') if r.strip()]
+    if not refs:
+        return jsonify({'error': 'refs is required'}), 400
+    if len(refs) > MAX_TIMELINE_REFS:
+        return jsonify({'error': f'At most {MAX_TIMELINE_REFS} refs per request'}), 400
+    
+    parcels = Parcel.query.filter(Parcel.ref_code.in_(refs)).all()
+    events = ParcelEvent.timelines([p.id for p in parcels])
+    return jsonify({
+        'parcels': {
+            p.ref_code: {
+                'status': p.status,
+                'events': [e.to_dict() for e in events[p.id]],
+            }
+            for p in parcels
+        },
+        'not_found': sorted(set(refs) - {p.ref_code for p in parcels}),
+    })
+
+
+@parcels_bp.route('/api/quote', methods=['GET', 'POST'])
+def quote_api():
+    """Parcel price quotes from the tariff table - public access.
+    GET  /parcels/api/quote?origin=Nairobi&destination=Meru&weight_kg=3.5
+    POST {"parcels": [{"origin": ..., "destination": ..., "weight_kg": ...}, ...]}
+    """
+    table = pricing.get_table()
+    if request.method == 'GET':
+        origin = request.args.get('origin', '')
+        destination = request.args.get('destination', '')
+        weight = request.args.get('weight_kg', type=float)
+        if not origin or not destination:
+            return jsonify({'error': 'origin and destination are required'}), 400
+        price = table.quote(origin, destination, weight)
+        if price is None:
+            return jsonify({'error': 'No tariff for this route'}), 404
+        return jsonify({
+            'origin': origin,
+            'destination': destination,
+            'weight_kg': weight,
+            'band': table.band_label(weight),
+            'price': price,
+        })
+    
+    items = (request.get_json(silent=True) or {}).get('parcels')
+    if not isinstance(items, list):
+        return jsonify({'error': 'parcels must be a list'}), 400
+    max_rows = current_app.config.get('PARCEL_BULK_MAX_ROWS', 500)
+    if len(items) > max_rows:
+        return jsonify({'error': f'At most {max_rows} parcels per request'}), 400
+    try:
+        quotes = [table.quote(i.get('origin'), i.get('destination'), float(i.get('weight_kg') or 0))
+                  for i in items]
+    except (AttributeError, TypeError, ValueError):
+        return jsonify({'error': 'Each parcel needs origin, destination and a numeric weight_kg'}), 400
+    return jsonify({'quotes': quotes, 'total': sum(q for q in quotes if q is not None)})
@@ -0,0 +1,216 @@
+"""
+Public tracking support for MAUA SHARK EXPRESS
+Keeps anonymous traffic on `parcels.track` / `parcels.status` off the database:
+
+- `parcel_version` reads only a parcel's id and last-change markers, which is
+  enough to build an ETag/Last-Modified and answer conditional requests with
+  304 before anything else is loaded or rendered.
+- `PageCache` keeps rendered pages for anonymous visitors for a few seconds,
+  keyed by that version, so a changed parcel is never served stale.
+- `TokenBucket` limits requests per client IP so guessing reference codes
+  cannot turn into a database load.
+
+Both caches are per process, like PaymentStatusCache.
+"""
+
+import hashlib
+import threading
+import time
+from datetime import timezone
+from functools import wraps
+from typing import Optional
+
+from flask import current_app, jsonify, request, session
+from flask_login import current_user
+from sqlalchemy import func, select
+
+from maua.extensions import db
+from maua.parcels.models import Parcel, ParcelEvent
+
+
+def parcel_version(ref_code: str):
+    """(parcel id, last modified, version seed) for a parcel, or None; one indexed lookup"""
+    last_event_id = select(func.max(ParcelEvent.id)).where(
+        ParcelEvent.parcel_id == Parcel.id).correlate(Parcel).scalar_subquery()
+    last_event_at = select(func.max(ParcelEvent.created_at)).where(
+        ParcelEvent.parcel_id == Parcel.id).correlate(Parcel).scalar_subquery()
+    row = db.session.execute(
+        select(Parcel.id, Parcel.created_at, Parcel.updated_at, last_event_id, last_event_at)
+        .where(Parcel.ref_code == ref_code)
+    ).first()
+    if row is None:
+        return None
+    parcel_id, created_at, updated_at, event_id, event_at = row
+    stamps = [t for t in (created_at, updated_at, event_at) if t is not None]
+    last_modified = max(stamps).replace(tzinfo=timezone.utc, microsecond=0) if stamps else None
+    return parcel_id, last_modified, f'{parcel_id}:{updated_at.isoformat() if updated_at else ""}:{event_id or 0}'
+
+
+def cacheable_request() -> bool:
+    """Anonymous visitor with nothing flashed, so the page is the same for everyone"""
+    return not current_user.is_authenticated and not session.get('_flashes')
+
+
+def etag_for(seed: str) -> str:
+    salt = current_app.config.get('TRACKING_ETAG_SALT', '')
+    # The navigation bar differs per user, so the viewer is part of the tag
+    viewer = current_user.get_id() if current_user.is_authenticated else 'anon'
+    return hashlib.sha1(f'{request.endpoint}:{seed}:{viewer}:{salt}'.encode()).hexdigest()
+
+
+def _set_validators(response, etag: str, last_modified=None):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Vary'] = 'Cookie'
+    response.cache_control.no_cache = True  # always revalidate; 304s are cheap
+    if cacheable_request():
+        response.cache_control.public = True
+    else:
+        response.cache_control.private = True
+    return response
+
+
+def not_modified(etag: str, last_modified=None):
+    """A 304 response if the client already has this version, else None"""
+    if session.get('_flashes'):
+        return None
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    elif request.if_modified_since and last_modified is not None:
+        fresh = last_modified <= request.if_modified_since
+    else:
+        fresh = False
+    if not fresh:
+        return None
+    return _set_validators(current_app.response_class(status=304), etag, last_modified)
+
+
+def cached_page(key, seed: str, last_modified, render):
+    """304, a cached copy, or `render()` for the page showing parcel version `seed`"""
+    etag = etag_for(seed)
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        return response
+    cacheable = cacheable_request()
+    key = (key, seed)  # a new version never matches an old page
+    html = PageCache.get(key) if cacheable else None
+    if html is None:
+        html = render()
+        if cacheable:
+            PageCache.set(key, html)
+    return _set_validators(current_app.response_class(html), etag, last_modified)
+
+
+class PageCache:
+    """Short-lived rendered pages for anonymous visitors, keyed by parcel version"""
+
+    _pages = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, key) -> Optional[str]:
+        entry = cls._pages.get(key)
+        if entry is None:
+            return None
+        html, expires = entry
+        if time.monotonic() >= expires:
+            cls._pages.pop(key, None)
+            return None
+        return html
+
+    @classmethod
+    def set(cls, key, html: str) -> None:
+        ttl = current_app.config.get('PUBLIC_TRACKING_CACHE_TTL', 30)
+        max_entries = current_app.config.get('PUBLIC_TRACKING_CACHE_SIZE', 1000)
+        with cls._lock:
+            if len(cls._pages) >= max_entries:
+                cls._prune()
+            cls._pages[key] = (html, time.monotonic() + ttl)
+
+    @classmethod
+    def clear(cls) -> None:
+        with cls._lock:
+            cls._pages.clear()
+
+    @classmethod
+    def _prune(cls) -> None:
+        now = time.monotonic()
+        for key in [k for k, (_, expires) in cls._pages.items() if expires <= now]:
+            del cls._pages[key]
+        # Still full of live pages: drop the oldest half (dicts keep insertion order)
+        if len(cls._pages) >= current_app.config.get('PUBLIC_TRACKING_CACHE_SIZE', 1000):
+            for key in list(cls._pages)[:len(cls._pages) // 2]:
+                del cls._pages[key]
+
+
+class TokenBucket:
+    """Per-key token bucket: `burst` requests at once, refilled at `rate` per second"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _limits(self):
+        config = current_app.config
+        return config.get('PUBLIC_TRACKING_RATE', 1.0), config.get('PUBLIC_TRACKING_BURST', 20)
+
+    def take(self, key: str, cost: float = 1.0) -> float:
+        """Spend `cost` tokens; returns 0 if allowed, else seconds until it would be"""
+        rate, burst = self._limits()
+        now = time.monotonic()
+        with self._lock:
+            if len(self._buckets) > 10000:
+                self._prune(now, rate, burst)
+            tokens, last = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            return (cost - tokens) / rate if rate else 60.0
+
+    def _prune(self, now, rate, burst) -> None:
+        # A bucket that has refilled completely is the same as no bucket
+        full = [k for k, (tokens, last) in self._buckets.items() if tokens + (now - last) * rate >= burst]
+        for key in full:
+            del self._buckets[key]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+public_lookups = TokenBucket()
+
+
+def client_ip() -> str:
+    """Client address, skipping the configured number of trusted proxies"""
+    hops = current_app.config.get('RATE_LIMIT_PROXY_HOPS', 0)
+    route = request.access_route if hops else [request.remote_addr]
+    if hops and len(route) >= hops:
+        return route[-hops]
+    return route[0] if route else 'unknown'
+
+
+def rate_limited(f):
+    """Reject a public lookup with 429 once the client's bucket is empty"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not current_app.config.get('PUBLIC_TRACKING_RATE_LIMIT', True):
+            return f(*args, **kwargs)
+        ip = client_ip()
+        wait = public_lookups.take(ip)
+        if wait:
+            retry_after = str(max(1, int(wait + 0.999)))
+            current_app.logger.warning(f"Rate limited public parcel lookup from {ip} on {request.path}")
+            if request.path.startswith('/parcels/api/'):
+                response = jsonify({'error': 'Too many requests, please slow down'})
+            else:
+                response = current_app.response_class(
+                    'Too many tracking requests. Please wait a moment and try again.', mimetype='text/plain')
+            response.status_code = 429
+            response.headers['Retry-After'] = retry_after
+            return response
+        return f(*args, **kwargs)
+    return decorated_function
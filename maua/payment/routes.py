@@ -4,10 +4,9 @@ from datetime import datetime
 from maua.extensions import db
 from maua.payment.models import Payment
 from maua.booking.models import Booking
-from maua.parcels.models import Parcel
+from maua.parcels.models import Parcel, ParcelEvent
 from maua.payment.mpesa_service import MpesaService
 from maua.payment.cache import PaymentStatusCache
-from maua.booking.services import broker
 import json
 
 payment_bp = Blueprint('payment', __name__, url_prefix='/payments')
@@ -165,6 +164,7 @@ def mpesa_callback():
                     if parcel:
                         parcel.status = 'pending'  # Change from pending_payment to pending (ready for dispatch)
                         parcel.payment_status = 'paid'
+                        ParcelEvent.record(parcel, 'payment_confirmed', {'payment_id': payment.id})
                         
                         # Send parcel payment confirmation notifications using parcel's stored emails
                         try:
@@ -191,10 +191,6 @@ def mpesa_callback():
                         booking = Booking.query.get(payment.booking_id)
                         if booking and booking.status == 'pending_payment':
                             booking.status = 'cancelled'
-                            try:
-                                broker.publish(booking.trip_id, {"type": "seat_cancelled", "seat": booking.seat_number, "status": "available"})
-                            except Exception:
-                                pass
                     db.session.commit()
                     current_app.logger.info(f'Payment {payment.id} failed: {callback_result.get("result_desc")}')
         
@@ -262,6 +258,7 @@ def check_payment_status(payment_id):
                         if parcel:
                             parcel.status = 'pending'  # Change from pending_payment to pending (ready for dispatch)
                             parcel.payment_status = 'paid'
+                            ParcelEvent.record(parcel, 'payment_confirmed', {'payment_id': payment.id})
                             
                             # Send parcel payment confirmation notifications using parcel's stored emails
                             try:
@@ -290,10 +287,6 @@ def check_payment_status(payment_id):
                         booking = Booking.query.get(payment.booking_id)
                         if booking and booking.status == 'pending_payment':
                             booking.status = 'cancelled'
-                            try:
-                                broker.publish(booking.trip_id, {"type": "seat_cancelled", "seat": booking.seat_number, "status": "available"})
-                            except Exception:
-                                pass
                     db.session.commit()
                     
                     # Cache the failed status
@@ -314,10 +307,6 @@ def check_payment_status(payment_id):
                         booking = Booking.query.get(payment.booking_id)
                         if booking and booking.status == 'pending_payment':
                             booking.status = 'cancelled'
-                            try:
-                                broker.publish(booking.trip_id, {"type": "seat_cancelled", "seat": booking.seat_number, "status": "available"})
-                            except Exception:
-                                pass
                     db.session.commit()
                     
                     # Cache the failed status
@@ -337,10 +326,6 @@ def check_payment_status(payment_id):
                         booking = Booking.query.get(payment.booking_id)
                         if booking and booking.status == 'pending_payment':
                             booking.status = 'cancelled'
-                            try:
-                                broker.publish(booking.trip_id, {"type": "seat_cancelled", "seat": booking.seat_number, "status": "available"})
-                            except Exception:
-                                pass
                     db.session.commit()
 
                     PaymentStatusCache.set_status(payment.id, {
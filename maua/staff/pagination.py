@@ -0,0 +1,64 @@
+"""
+Keyset pagination for MAUA SHARK EXPRESS staff lists
+Lists are sorted newest first on (timestamp, id) and paged by cursors that
+carry the last row's key, so every page is one indexed range scan of
+`page_size + 1` rows however deep staff go:
+
+- `after` pages towards older rows, `before` back towards newer ones;
+- cursors are opaque url-safe strings; a bad cursor starts from the top.
+"""
+
+import base64
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+PAGE_SIZE = 50
+
+# newer/older are cursors for the neighbouring pages, None at either end
+Page = namedtuple('Page', 'items newer older')
+
+
+def encode_cursor(value, row_id):
+    payload = json.dumps([value.isoformat() if value else None, row_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(timestamp, id) from a page cursor, or None if absent/invalid"""
+    if not cursor:
+        return None
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return (datetime.fromisoformat(value) if value else None), int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def keyset_page(query, column, id_column, after=None, before=None, page_size=PAGE_SIZE):
+    """One page of `query` ordered by (column, id) descending.
+
+    `query` carries the filters but no ORDER BY; each row's key is read from
+    its attributes named after the two columns.
+    """
+    key = lambda row: (getattr(row, column.key), getattr(row, id_column.key))
+    after, before = decode_cursor(after), decode_cursor(before)
+    if before and not after:
+        value, row_id = before
+        rows = query.filter(or_(column > value, and_(column == value, id_column > row_id))) \
+            .order_by(column.asc(), id_column.asc()).limit(page_size + 1).all()
+        items = rows[:page_size][::-1]
+        newer = encode_cursor(*key(items[0])) if len(rows) > page_size else None
+        older = encode_cursor(*key(items[-1])) if items else encode_cursor(value, row_id)
+        return Page(items, newer, older)
+
+    if after:
+        value, row_id = after
+        query = query.filter(or_(column < value, and_(column == value, id_column < row_id)))
+    rows = query.order_by(column.desc(), id_column.desc()).limit(page_size + 1).all()
+    items = rows[:page_size]
+    newer = encode_cursor(*key(items[0])) if after and items else None
+    older = encode_cursor(*key(items[-1])) if len(rows) > page_size else None
+    return Page(items, newer, older)
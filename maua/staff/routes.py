@@ -1,20 +1,29 @@
-from flask import render_template, redirect, url_for, flash, request, jsonify, send_file, current_app, make_response
+from flask import render_template, redirect, url_for, flash, request, jsonify, send_file, current_app, make_response, Response, stream_with_context
 from flask_login import login_required, current_user
 from functools import wraps
 from maua.extensions import db
 from . import staff_bp
-from maua.booking.models import Booking
-from maua.catalog.models import Trip, Vehicle, Route
-from maua.parcels.models import Parcel
-from datetime import datetime
+from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
+from maua.booking.models import Booking, SEAT_HOLDING_STATUSES
+from maua.booking.services import broker
+from maua.catalog.models import Timetable, Trip, Vehicle, Route
+from maua.parcels.models import Parcel, ParcelEvent
+from maua.catalog.archive import EXPORT_FORMATS, export_completed_trips, archive_trips
+from maua.catalog.lifecycle import TRIP_STATUSES, change_trip_status, close_out_day
+from maua.catalog.timetable import generate_trips, parse_departure_times
+from maua.catalog.allocation import AllocationConflict, check_trip, describe, find_conflicts, lock_allocations, trip_window
+from maua.staff.pagination import keyset_page
+from maua.staff.exports import EXPORT_DATASETS, EXPORT_FORMATS as ACCOUNTING_FORMATS, iter_export
+from maua.staff.search import BOOKING_SEARCH, PARCEL_SEARCH, filter_matching, search as counter_search
+from datetime import date, datetime, timedelta
 from maua.notifications.sms import send_sms
 from maua.notifications.notification_service import NotificationService
-from werkzeug.utils import secure_filename
 import os
-import io
+import json
+import base64
 from io import BytesIO
 from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
@@ -22,6 +31,15 @@ from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER
 
 
+def _with_trip_details(query):
+    """Load each trip's route, depots and vehicle in the same query (list pages show them)"""
+    return query.options(
+        joinedload(Trip.route).joinedload(Route.origin),
+        joinedload(Trip.route).joinedload(Route.destination),
+        joinedload(Trip.vehicle),
+    )
+
+
 def staff_required(f):
     """Require staff or admin role to access this route"""
     @wraps(f)
@@ -40,15 +58,22 @@ def staff_required(f):
 @login_required
 @staff_required
 def dashboard():
-    booking_count = Booking.query.count()
-    parcel_count = Parcel.query.count()
-    active_trips = Trip.query.filter(Trip.status.in_(['scheduled', 'in_progress'])).count()
+    from maua.stats.counters import snapshot
+    counts = snapshot('bookings_total', 'parcels_total', 'trips_active')
+    booking_count = counts['bookings_total']
+    parcel_count = counts['parcels_total']
+    active_trips = counts['trips_active']
     today_date = datetime.now().strftime('%b %d, %Y')
+    upcoming = _with_trip_details(Trip.query.filter(
+        Trip.status == 'scheduled', Trip.depart_at >= datetime.utcnow()
+    )).order_by(Trip.depart_at.asc()).limit(5).all()
     return render_template('staff/dashboard.html', 
                          booking_count=booking_count, 
                          parcel_count=parcel_count, 
                          active_trips=active_trips,
-                         today_date=today_date)
+                         today_date=today_date,
+                         upcoming=upcoming,
+                         occupancy=Booking.occupancy(upcoming))
 
 
 @staff_bp.route('/bookings/routes')
@@ -64,9 +89,14 @@ def bookings_routes():
 @staff_required
 def bookings_route_trips(route_id: int):
     route = Route.query.get_or_404(route_id)
-    # Show recent/scheduled trips for this route
-    trips = Trip.query.filter_by(route_id=route_id).order_by(Trip.depart_at.desc()).limit(200).all()
-    return render_template('staff/bookings_route_trips.html', route=route, trips=trips)
+    status = request.args.get('status')
+    # Trips for this route, newest departure first, one keyset page at a time
+    query = Trip.query.options(joinedload(Trip.vehicle)).filter(Trip.route_id == route_id)
+    if status:
+        query = query.filter(Trip.status == status)
+    page = keyset_page(query, Trip.depart_at, Trip.id, request.args.get('after'), request.args.get('before'))
+    return render_template('staff/bookings_route_trips.html', route=route, trips=page.items, page=page,
+                           status=status, occupancy=Booking.occupancy(page.items))
 
 
 @staff_bp.route('/bookings')
@@ -74,15 +104,20 @@ def bookings_route_trips(route_id: int):
 @staff_required
 def bookings_list():
     status = request.args.get('status')
+    search = request.args.get('q', '').strip()
     trip_id = request.args.get('trip_id', type=int)
     if not trip_id:
         return redirect(url_for('staff.bookings_routes'))
-    query = Booking.query.filter(Booking.trip_id == trip_id).order_by(Booking.created_at.desc())
+    selected_trip = Trip.query.get_or_404(trip_id)
+    query = Booking.query.filter(Booking.trip_id == trip_id)
     if status:
         query = query.filter(Booking.status == status)
-    bookings = query.limit(200).all()
-    selected_trip = Trip.query.get_or_404(trip_id)
-    return render_template('staff/bookings.html', bookings=bookings, selected_trip=selected_trip)
+    if search:
+        matching = filter_matching(db.select(Booking.id).where(Booking.trip_id == trip_id), BOOKING_SEARCH, search)
+        query = query.filter(or_(Booking.seat_number == search, Booking.id.in_(matching)))
+    page = keyset_page(query, Booking.created_at, Booking.id, request.args.get('after'), request.args.get('before'))
+    return render_template('staff/bookings.html', bookings=page.items, page=page, selected_trip=selected_trip,
+                           status=status, q=search)
 
 
 @staff_bp.route('/bookings/<int:booking_id>/status', methods=['POST'])
@@ -127,11 +162,14 @@ def bookings_update_status(booking_id: int):
 @staff_required
 def parcels_list():
     status = request.args.get('status')
-    query = Parcel.query.order_by(Parcel.created_at.desc())
+    search = request.args.get('q', '').strip()
+    query = Parcel.query
     if status:
         query = query.filter_by(status=status)
-    parcels = query.limit(200).all()
-    return render_template('staff/parcels.html', parcels=parcels)
+    if search:
+        query = filter_matching(query, PARCEL_SEARCH, search)
+    page = keyset_page(query, Parcel.created_at, Parcel.id, request.args.get('after'), request.args.get('before'))
+    return render_template('staff/parcels.html', parcels=page.items, page=page, status=status, q=search)
 
 
 @staff_bp.route('/parcels/<int:parcel_id>/status', methods=['POST'])
@@ -144,7 +182,11 @@ def parcels_update_status(parcel_id: int):
         flash('Invalid status.', 'danger')
         return redirect(url_for('staff.parcels_list'))
     try:
+        old_status = parcel.status
         parcel.status = new_status
+        if old_status != new_status:
+            ParcelEvent.record(parcel, 'status_changed', {'from': old_status, 'to': new_status},
+                               actor_id=current_user.id)
         db.session.commit()
         
         # Send notifications based on status change
@@ -167,7 +209,8 @@ def parcels_update_status(parcel_id: int):
             elif new_status == 'pending':
                 # Simple SMS for pending status
                 msg = f"Maua Shark Express: Parcel {parcel.ref_code} is pending dispatch from {parcel.origin_name}."
-                send_sms(parcel.sender_phone, msg, user_email=parcel.sender_email)
+                send_sms(parcel.sender_phone, msg, user_email=parcel.sender_email,
+                         template='parcel_pending', entity=parcel.ref_code)
         except Exception as e:
             current_app.logger.error(f'Failed to send parcel notification: {e}')
         
@@ -199,12 +242,13 @@ def parcels_assign_tracking(parcel_id: int):
     try:
         if tracking_number:
             parcel.tracking_number = tracking_number
-        if vehicle_plate:
-            parcel.vehicle_plate = vehicle_plate
-        if driver_name:
-            parcel.driver_name = driver_name
-        if driver_phone:
-            parcel.driver_phone = driver_phone
+        changes = {}
+        for field, value in (('vehicle_plate', vehicle_plate), ('driver_name', driver_name), ('driver_phone', driver_phone)):
+            if value and value != getattr(parcel, field):
+                changes[field] = value
+                setattr(parcel, field, value)
+        if changes:
+            ParcelEvent.record(parcel, 'assigned', changes, actor_id=current_user.id)
         db.session.commit()
         # Notify customer of vehicle assignment using parcel's stored emails
         try:
@@ -221,10 +265,12 @@ def parcels_assign_tracking(parcel_id: int):
                     f"Maua Shark Express: Parcel {parcel.ref_code} assigned to {info}. Track with your reference code."
                 )
                 # Use parcel's stored emails for notifications
-                send_sms(parcel.sender_phone, msg_sender, user_email=parcel.sender_email)
+                send_sms(parcel.sender_phone, msg_sender, user_email=parcel.sender_email,
+                         template='parcel_assigned', entity=parcel.ref_code)
                 # Inform receiver as well
                 try:
-                    send_sms(parcel.receiver_phone, msg_sender, user_email=parcel.receiver_email)
+                    send_sms(parcel.receiver_phone, msg_sender, user_email=parcel.receiver_email,
+                             template='parcel_assigned', entity=parcel.ref_code)
                 except Exception:
                     pass
         except Exception:
@@ -236,19 +282,63 @@ def parcels_assign_tracking(parcel_id: int):
     return redirect(url_for('staff.parcels_list'))
 
 
+@staff_bp.route('/parcels/dispatch', methods=['GET', 'POST'])
+@login_required
+@staff_required
+def parcels_dispatch():
+    """Preview (GET) or apply (POST) packing of pending parcels onto a day's trips"""
+    from maua.parcels.manifest import plan_dispatch, dispatch_day
+    
+    day_text = request.values.get('date')
+    try:
+        day = datetime.strptime(day_text, '%Y-%m-%d').date() if day_text else datetime.utcnow().date()
+    except ValueError:
+        flash('Invalid date.', 'danger')
+        return redirect(url_for('staff.parcels_dispatch'))
+    
+    if request.method == 'POST':
+        try:
+            assigned, plan = dispatch_day(day, actor_id=current_user.id)
+            flash(f'{assigned} parcel(s) assigned to trips. {len(plan["unassigned"])} left unassigned.',
+                  'success' if assigned else 'info')
+        except Exception as e:
+            current_app.logger.error(f'Parcel dispatch failed: {e}')
+            flash('Failed to dispatch parcels. Nothing was changed.', 'danger')
+        return redirect(url_for('staff.parcels_dispatch', date=day.isoformat()))
+    
+    plan = plan_dispatch(day)
+    return render_template('staff/parcels_dispatch.html', plan=plan, day=day)
+
+
+@staff_bp.route('/trips/<int:trip_id>/manifest')
+@login_required
+@staff_required
+def trip_manifest(trip_id: int):
+    """Printable parcel manifest for one trip"""
+    from maua.parcels.manifest import trip_manifest as build_manifest
+    
+    trip = Trip.query.get_or_404(trip_id)
+    return render_template('staff/trip_manifest.html', manifest=build_manifest(trip))
+
+
 @staff_bp.route('/trips')
 @login_required
 @staff_required
 def trips_list():
     status = request.args.get('status')
-    query = Trip.query.order_by(Trip.depart_at.desc())
+    route_id = request.args.get('route_id', type=int)
+    query = _with_trip_details(Trip.query)
     if status:
         query = query.filter_by(status=status)
     else:
         # By default, show only active trips (exclude completed)
         query = query.filter(Trip.status.in_(['scheduled', 'in_progress']))
-    trips = query.limit(200).all()
-    return render_template('staff/trips.html', trips=trips)
+    if route_id:
+        query = query.filter(Trip.route_id == route_id)
+    page = keyset_page(query, Trip.depart_at, Trip.id, request.args.get('after'), request.args.get('before'))
+    return render_template('staff/trips.html', trips=page.items, page=page, status=status, route_id=route_id,
+                           routes=Route.query.order_by(Route.code.asc()).all(),
+                           occupancy=Booking.occupancy(page.items))
 
 
 @staff_bp.route('/trips/create', methods=['GET', 'POST'])
@@ -264,11 +354,21 @@ def trips_create():
         driver_phone = request.form.get('driver_phone')
         try:
             depart_dt = datetime.fromisoformat(depart_at)
-            trip = Trip(route_id=route_id, vehicle_id=vehicle_id, depart_at=depart_dt, base_fare=base_fare, status='scheduled', driver_name=driver_name, driver_phone=driver_phone)
-            db.session.add(trip)
-            db.session.commit()
-            flash('Trip created.', 'success')
-            return redirect(url_for('staff.trips_list'))
+            route = db.session.get(Route, route_id)
+            duration = route.estimated_duration if route else None
+            arrive_eta = depart_dt + duration if duration else None
+            # Serialize with every other allocation so two desks cannot take the vehicle or driver
+            lock_allocations()
+            conflicts = check_trip(vehicle_id, driver_name, driver_phone, *trip_window(depart_dt, arrive_eta))
+            if conflicts:
+                db.session.rollback()
+                flash(f'Not scheduled: overlaps {describe(conflicts)}.', 'danger')
+            else:
+                trip = Trip(route_id=route_id, vehicle_id=vehicle_id, depart_at=depart_dt, arrive_eta=arrive_eta, base_fare=base_fare, status='scheduled', driver_name=driver_name, driver_phone=driver_phone)
+                db.session.add(trip)
+                db.session.commit()
+                flash('Trip created.', 'success')
+                return redirect(url_for('staff.trips_list'))
         except Exception:
             db.session.rollback()
             flash('Failed to create trip.', 'danger')
@@ -277,55 +377,100 @@ def trips_create():
     return render_template('staff/trips_create.html', routes=routes, vehicles=vehicles)
 
 
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+
+@staff_bp.route('/timetables', methods=['GET', 'POST'])
+@login_required
+@staff_required
+def timetables_list():
+    """Recurring departures; trips are generated from them instead of keyed in one by one"""
+    if request.method == 'POST':
+        try:
+            days = sorted({d for d in request.form.getlist('days_of_week', type=int) if 0 <= d < 7})
+            if not days:
+                raise ValueError('Pick at least one day')
+            timetable = Timetable(
+                route_id=request.form.get('route_id', type=int),
+                vehicle_id=request.form.get('vehicle_id', type=int),
+                departure_times=parse_departure_times(request.form.get('departure_times', '').split(',')),
+                days_of_week=days,
+                base_fare=request.form.get('base_fare', type=float),
+                driver_name=request.form.get('driver_name') or None,
+                driver_phone=request.form.get('driver_phone') or None,
+                valid_from=request.form.get('valid_from', type=date.fromisoformat) or None,
+                valid_until=request.form.get('valid_until', type=date.fromisoformat) or None,
+            )
+            db.session.add(timetable)
+            db.session.commit()
+            result = generate_trips()
+            flash(f"Timetable saved. {result['trips']} trip(s) scheduled.", 'success')
+            if result['conflicts']:
+                flash(f"{result['conflicts']} departure(s) left out: vehicle or driver already busy.", 'warning')
+            return redirect(url_for('staff.timetables_list'))
+        except ValueError as e:
+            db.session.rollback()
+            flash(f'Invalid timetable: {e}', 'danger')
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f'Failed to create timetable: {e}')
+            flash('Failed to create timetable.', 'danger')
+    timetables = Timetable.query.options(
+        joinedload(Timetable.route).joinedload(Route.origin),
+        joinedload(Timetable.route).joinedload(Route.destination),
+    ).order_by(Timetable.active.desc(), Timetable.id.asc()).all()
+    return render_template('staff/timetables.html', timetables=timetables, weekdays=WEEKDAYS,
+                           routes=Route.query.all(), vehicles=Vehicle.query.all(),
+                           horizon_days=current_app.config.get('TIMETABLE_HORIZON_DAYS', 14))
+
+
+@staff_bp.route('/timetables/<int:timetable_id>/toggle', methods=['POST'])
+@login_required
+@staff_required
+def timetables_toggle(timetable_id: int):
+    # Pausing stops new trips only; trips already generated stay on the board
+    timetable = Timetable.query.get_or_404(timetable_id)
+    timetable.active = not timetable.active
+    db.session.commit()
+    flash('Timetable resumed.' if timetable.active else 'Timetable paused.', 'info')
+    return redirect(url_for('staff.timetables_list'))
+
+
+@staff_bp.route('/timetables/generate', methods=['POST'])
+@login_required
+@staff_required
+def timetables_generate():
+    try:
+        result = generate_trips()
+        flash(f"{result['trips']} new trip(s) scheduled for the next {result['days']} day(s).", 'success')
+        if result['conflicts']:
+            flash(f"{result['conflicts']} departure(s) left out: vehicle or driver already busy.", 'warning')
+    except Exception as e:
+        current_app.logger.error(f'Timetable generation failed: {e}')
+        flash('Failed to generate trips.', 'danger')
+    return redirect(url_for('staff.timetables_list'))
+
+
 @staff_bp.route('/trips/<int:trip_id>/status', methods=['POST'])
 @login_required
 @staff_required
 def trips_update_status(trip_id: int):
     trip = Trip.query.get_or_404(trip_id)
     new_status = request.form.get('status')
-    if new_status not in ['scheduled', 'in_progress', 'completed', 'cancelled']:
+    if new_status not in TRIP_STATUSES:
         flash('Invalid status.', 'danger')
         return redirect(url_for('staff.trips_list'))
     try:
-        trip.status = new_status
-        db.session.commit()
-        
-        # Send bell notifications to customers about trip status change
-        try:
-            NotificationService.notify_trip_status_change(trip, new_status)
-        except Exception as e:
-            current_app.logger.error(f'Failed to send trip status notifications: {e}')
-        
-        # When trip is completed, mark relevant bookings as completed
-        if new_status == 'completed':
-            try:
-                bookings_to_complete = Booking.query.filter(
-                    Booking.trip_id == trip.id,
-                    Booking.status.in_(['confirmed', 'checked_in'])
-                ).all()
-                for b in bookings_to_complete:
-                    b.status = 'completed'
-                    try:
-                        msg = (
-                            f"Maua Shark Express: Trip completed. Thank you for traveling with us, {b.passenger_name}. "
-                            f"We appreciate you and welcome you to ride with MAUA SHARK EXPRESS again."
-                        )
-                        user_email = b.user.email if b.user and hasattr(b.user, 'email') else None
-                        send_sms(b.passenger_phone, msg, user_email=user_email)
-                    except Exception:
-                        pass
-                db.session.commit()
-            except Exception:
-                db.session.rollback()
-                # Swallow error but log it
-                try:
-                    from flask import current_app
-                    current_app.logger.error('Failed to auto-complete bookings for trip %s', trip.id)
-                except Exception:
-                    pass
-        flash('Trip status updated.', 'success')
-    except Exception:
-        db.session.rollback()
+        # One UPDATE for the trip and one for its bookings; passengers are messaged in the background
+        changed = change_trip_status([trip.id], new_status, actor_id=current_user.id)
+        if changed['parcels']:
+            flash(f"Trip status updated. {changed['parcels']} parcel(s) returned to dispatch.", 'success')
+        else:
+            flash('Trip status updated.', 'success')
+    except AllocationConflict as e:
+        flash(f'Not reopened: overlaps {describe(e.conflicts)}.', 'danger')
+    except Exception as e:
+        current_app.logger.error(f'Failed to update trip {trip_id} to {new_status}: {e}')
         flash('Failed to update trip.', 'danger')
     # If marked completed, take user to completed trips page
     if new_status == 'completed':
@@ -333,78 +478,83 @@ def trips_update_status(trip_id: int):
     return redirect(url_for('staff.trips_list'))
 
 
+@staff_bp.route('/trips/conflicts')
+@login_required
+@staff_required
+def trips_conflicts():
+    """Vehicles and drivers currently on two overlapping trips"""
+    conflicts = find_conflicts()
+    trip_ids = {c.trip_id for c in conflicts} | {c.other_trip_id for c in conflicts}
+    trips = {t.id: t for t in _with_trip_details(Trip.query).filter(Trip.id.in_(trip_ids)).all()} if trip_ids else {}
+    return render_template('staff/trip_conflicts.html', conflicts=conflicts, trips=trips)
+
+
+@staff_bp.route('/trips/close-out', methods=['POST'])
+@login_required
+@staff_required
+def trips_close_out():
+    """End of day: complete every trip that departed today in one go"""
+    try:
+        result = close_out_day()
+        if result['trips']:
+            flash(f"Closed out {result['trips']} departed trip(s); {result['bookings']} booking(s) completed.", 'success')
+        else:
+            flash('No departed trips left to close out today.', 'info')
+    except Exception as e:
+        current_app.logger.error(f'End-of-day close-out failed: {e}')
+        flash('Failed to close out departed trips.', 'danger')
+    return redirect(url_for('staff.trips_completed'))
+
+
 @staff_bp.route('/trips/completed')
 @login_required
 @staff_required
 def trips_completed():
-    trips = Trip.query.filter_by(status='completed').order_by(Trip.depart_at.desc()).limit(500).all()
-    return render_template('staff/trips_completed.html', trips=trips)
+    route_id = request.args.get('route_id', type=int)
+    query = _with_trip_details(Trip.query).filter(Trip.status == 'completed')
+    if route_id:
+        query = query.filter(Trip.route_id == route_id)
+    page = keyset_page(query, Trip.depart_at, Trip.id, request.args.get('after'), request.args.get('before'))
+    return render_template('staff/trips_completed.html', trips=page.items, page=page, route_id=route_id,
+                           routes=Route.query.order_by(Route.code.asc()).all())
 
 
 @staff_bp.route('/trips/completed/export_pdf', methods=['POST'])
 @login_required
 @staff_required
 def trips_completed_export_pdf():
-    # Fetch completed trips to export
-    trips = Trip.query.filter_by(status='completed').order_by(Trip.depart_at.asc()).all()
-    if not trips:
+    fmt = request.form.get('format', 'pdf')
+    if fmt not in EXPORT_FORMATS:
+        fmt = 'pdf'
+
+    # Streamed to a temp file; the trips written are the ones archived below
+    path, trip_ids = export_completed_trips(fmt)
+    if not trip_ids:
+        os.remove(path)
         flash('No completed trips to export.', 'info')
         return redirect(url_for('staff.trips_completed'))
 
-    # Generate PDF in-memory
-    buffer = io.BytesIO()
-    pdf = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-
-    margin_left = 40
-    margin_top = height - 40
-    line_height = 16
-
-    pdf.setTitle('Completed Trips')
-    pdf.setFont('Helvetica-Bold', 14)
-    pdf.drawString(margin_left, margin_top, 'Completed Trips Export')
-    pdf.setFont('Helvetica', 10)
-    y = margin_top - 24
-
-    for idx, t in enumerate(trips, start=1):
-        lines = [
-            f"#{idx} Trip ID: {t.id}",
-            f"Route: {t.route.origin.town} -> {t.route.destination.town}",
-            f"Departs: {t.depart_at.strftime('%Y-%m-%d %H:%M') if t.depart_at else ''}",
-            f"Vehicle: {getattr(t.vehicle, 'plate_no', '')} ({getattr(t.vehicle, 'make', '')} {getattr(t.vehicle, 'model', '')})",
-            f"Driver: {t.driver_name or ''} | Phone: {t.driver_phone or ''}",
-            f"Base Fare: {t.base_fare} | Status: {t.status}",
-        ]
-        for line in lines:
-            if y < 60:
-                pdf.showPage()
-                pdf.setFont('Helvetica', 10)
-                y = margin_top
-            pdf.drawString(margin_left, y, line)
-            y -= line_height
-        # spacer
-        y -= 8
-
-    pdf.showPage()
-    pdf.save()
-    buffer.seek(0)
-
-    # After generating, delete the completed trips
+    # Move the exported trips and their bookings to the archive tables
     try:
-        for t in trips:
-            db.session.delete(t)
-        db.session.commit()
-        flash('Exported and cleared completed trips.', 'success')
-    except Exception:
+        archived, _ = archive_trips(trip_ids)
+        if archived < len(trip_ids):
+            current_app.logger.warning(f"Archived {archived} of {len(trip_ids)} exported trips")
+        flash('Exported and archived completed trips.', 'success')
+    except Exception as e:
         db.session.rollback()
-        flash('Export successful, but failed to clear completed trips.', 'warning')
+        current_app.logger.error(f"Failed to archive completed trips: {e}")
+        flash('Export successful, but failed to archive completed trips.', 'warning')
 
-    return send_file(
-        buffer,
+    response = send_file(
+        path,
         as_attachment=True,
-        download_name=f"completed_trips_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.pdf",
-        mimetype='application/pdf'
+        download_name=f"completed_trips_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{fmt}",
+        mimetype=EXPORT_FORMATS[fmt]
     )
+    # Passthrough responses skip close callbacks, so let the file be iterated normally
+    response.direct_passthrough = False
+    response.call_on_close(lambda: os.remove(path))
+    return response
 
 
 @staff_bp.route('/vehicles')
@@ -442,29 +592,98 @@ def vehicle_seat_layout(vehicle_id: int):
     return render_template('staff/vehicle_seats.html', vehicle=vehicle, seats_text=seats_text)
 
 
+@staff_bp.route('/search')
+@login_required
+@staff_required
+def search():
+    """Counter search: bookings and parcels by partial name, phone, ID number or reference"""
+    term = request.args.get('q', '').strip()
+    results = counter_search(term) if term else {'bookings': [], 'parcels': []}
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({
+            'q': term,
+            'bookings': [b.to_dict() for b in results['bookings']],
+            'parcels': [{
+                'id': p.id, 'ref_code': p.ref_code, 'status': p.status,
+                'sender_name': p.sender_name, 'sender_phone': p.sender_phone,
+                'receiver_name': p.receiver_name, 'receiver_phone': p.receiver_phone,
+                'origin_name': p.origin_name, 'destination_name': p.destination_name,
+                'created_at': p.created_at.isoformat() if p.created_at else None,
+            } for p in results['parcels']],
+        })
+    return render_template('staff/search.html', q=term, **results)
+
+
+@staff_bp.route('/exports')
+@login_required
+@staff_required
+def exports():
+    """Accounting export form; the download itself streams from exports_download"""
+    return render_template('staff/exports.html', datasets=list(EXPORT_DATASETS), formats=list(ACCOUNTING_FORMATS),
+                           routes=Route.query.order_by(Route.code.asc()).all())
+
+
+@staff_bp.route('/exports/<dataset>')
+@login_required
+@staff_required
+def exports_download(dataset: str):
+    """Stream bookings, parcels or payments as CSV/JSONL (?from=&to=&route_id=&status=&format=&gzip=1)"""
+    fmt = request.args.get('format', 'csv')
+    if dataset not in EXPORT_DATASETS or fmt not in ACCOUNTING_FORMATS:
+        return jsonify({'error': f"Export one of {', '.join(EXPORT_DATASETS)} as {' or '.join(ACCOUNTING_FORMATS)}"}), 404
+    try:
+        start = date.fromisoformat(request.args['from']) if request.args.get('from') else None
+        # `to` is inclusive: everything before the next midnight
+        end = date.fromisoformat(request.args['to']) + timedelta(days=1) if request.args.get('to') else None
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    compress = request.args.get('gzip') in ('1', 'true', 'on')
+
+    filename = f"{dataset}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{fmt}" + ('.gz' if compress else '')
+    return Response(
+        stream_with_context(iter_export(
+            dataset, fmt, compress,
+            start=datetime.combine(start, datetime.min.time()) if start else None,
+            end=datetime.combine(end, datetime.min.time()) if end else None,
+            route_id=request.args.get('route_id', type=int),
+            status=request.args.get('status') or None,
+        )),
+        mimetype='application/gzip' if compress else ACCOUNTING_FORMATS[fmt],
+        headers={
+            'Content-Disposition': f'attachment; filename={filename}',
+            'X-Accel-Buffering': 'no',  # let proxies pass chunks on as they are produced
+        },
+    )
+
+
 @staff_bp.route('/customers')
 @login_required
 @staff_required
 def customers_list():
-    # Show passenger profiles derived from bookings, not login accounts
-    bookings = Booking.query.order_by(Booking.created_at.desc()).limit(2000).all()
-    key_to_passenger = {}
-    for b in bookings:
-        key = (b.passenger_name or 'Passenger', b.passenger_phone or 'N/A')
-        rec = key_to_passenger.get(key)
-        if not rec:
-            rec = {
-                'name': b.passenger_name,
-                'phone': b.passenger_phone,
-                'num_bookings': 0,
-                'last_booking_at': b.created_at,
-            }
-            key_to_passenger[key] = rec
-        rec['num_bookings'] += 1
-        if b.created_at and (rec['last_booking_at'] is None or b.created_at > rec['last_booking_at']):
-            rec['last_booking_at'] = b.created_at
-    passengers = sorted(key_to_passenger.values(), key=lambda r: r['last_booking_at'] or datetime.min, reverse=True)
-    return render_template('staff/customers.html', passengers=passengers)
+    """Passenger profiles derived from bookings (not login accounts), with search and keyset paging"""
+    search = request.args.get('q', '').strip()
+    after = _decode_customer_cursor(request.args.get('after'))
+    page_size = 50
+    rows = Booking.passenger_profiles(search=search, after=after, limit=page_size + 1)
+    next_cursor = _encode_customer_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+    return render_template('staff/customers.html', passengers=rows[:page_size],
+                           q=search, next_cursor=next_cursor, paged=after is not None)
+
+
+def _encode_customer_cursor(row):
+    payload = json.dumps([row.last_booking_at.isoformat() if row.last_booking_at else None, row.name, row.phone_key])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def _decode_customer_cursor(cursor):
+    """(last_booking_at, name, phone_key) from a page cursor, or None if absent/invalid"""
+    if not cursor:
+        return None
+    try:
+        last_at, name, phone_key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return datetime.fromisoformat(last_at), name, phone_key
+    except (ValueError, TypeError):
+        return None
 
 
 @staff_bp.route('/trips/<int:trip_id>/seats')
@@ -474,29 +693,56 @@ def trip_seat_map(trip_id: int):
     trip = Trip.query.get_or_404(trip_id)
     seat_layout = trip.vehicle.seat_layout or []
     seat_to_booking = {}
+    # Same statuses the seat events report as taken, so the live map starts in step
     for b in trip.bookings:
-        if b.status in ['confirmed', 'reserved', 'checked_in', 'completed']:
+        if b.status in SEAT_HOLDING_STATUSES:
             seat_to_booking[b.seat_number] = b
     return render_template('staff/trip_seats.html', trip=trip, seat_layout=seat_layout, seat_to_booking=seat_to_booking)
 
 
+@staff_bp.route('/trips/<int:trip_id>/seats.json')
+@login_required
+@staff_required
+def trip_seat_map_json(trip_id: int):
+    """Current state of every held seat; the live map resyncs from this (events are per process)"""
+    Trip.query.get_or_404(trip_id)
+    rows = db.session.execute(
+        db.select(Booking.seat_number, Booking.status, Booking.passenger_name).where(
+            Booking.trip_id == trip_id,
+            Booking.status.in_(SEAT_HOLDING_STATUSES),
+        )
+    ).all()
+    return jsonify({'seats': {
+        seat: {'state': 'checked_in' if status in ('checked_in', 'completed') else 'booked', 'passenger_name': name}
+        for seat, status, name in rows
+    }})
+
+
 @staff_bp.route('/trips/<int:trip_id>/seats/<seat>/checkin', methods=['POST'])
 @login_required
 @staff_required
 def trip_seat_checkin(trip_id: int, seat: str):
-    trip = Trip.query.get_or_404(trip_id)
-    booking = Booking.query.filter_by(trip_id=trip.id, seat_number=seat).first()
-    if not booking:
+    # JSON for the live seat map (updates the seat in place); redirect for plain form posts
+    wants_json = request.accept_mimetypes.best == 'application/json'
+    booking = Booking.query.filter_by(trip_id=trip_id, seat_number=seat).first()
+    if not booking or booking.status == 'cancelled':
+        if wants_json:
+            return jsonify({'success': False, 'message': 'No booking found for this seat.'}), 404
         flash('No booking found for this seat.', 'warning')
-        return redirect(url_for('staff.trip_seat_map', trip_id=trip.id))
+        return redirect(url_for('staff.trip_seat_map', trip_id=trip_id))
     try:
         booking.status = 'checked_in'
-        db.session.commit()
+        db.session.commit()  # publishes seat_checked_in to every open seat map
+        if wants_json:
+            return jsonify({'success': True, 'seat': seat, 'status': booking.status,
+                            'passenger_name': booking.passenger_name})
         flash('Passenger checked in.', 'success')
     except Exception:
         db.session.rollback()
+        if wants_json:
+            return jsonify({'success': False, 'message': 'Failed to check in.'}), 500
         flash('Failed to check in.', 'danger')
-    return redirect(url_for('staff.trip_seat_map', trip_id=trip.id))
+    return redirect(url_for('staff.trip_seat_map', trip_id=trip_id))
 
 
 @staff_bp.route('/trips/<int:trip_id>/mark-full', methods=['POST'])
@@ -504,48 +750,20 @@ def trip_seat_checkin(trip_id: int, seat: str):
 @staff_required
 def trip_mark_full(trip_id: int):
     """Mark a trip as full (physical check-ins). Creates bookings for empty seats."""
-    import uuid
-    trip = Trip.query.get_or_404(trip_id)
+    # Lock the trip so two staff marking it full at once do not both fill it
+    trip = Trip.query.filter_by(id=trip_id).with_for_update(of=Trip).first_or_404()
     
     # Toggle the is_full flag
     new_state = not trip.is_full
     
     try:
         if new_state:
-            # Marking as full - create bookings for all remaining empty seats
-            seat_layout = trip.vehicle.seat_layout or []
-            all_seats = {s['seat'] for s in seat_layout}
-            
-            # Get currently booked seats
-            booked_seats = {b.seat_number for b in trip.bookings 
-                          if b.status in ['confirmed', 'reserved', 'checked_in', 'completed', 'pending_payment']}
-            
-            # Find empty seats
-            empty_seats = all_seats - booked_seats
-            
-            # Create "walk-in" bookings for empty seats
-            for seat in empty_seats:
-                ref = f"WI-{uuid.uuid4().hex[:8].upper()}"
-                booking = Booking(
-                    trip_id=trip.id,
-                    user_id=None,  # No user account (physical walk-in)
-                    seat_number=seat,
-                    status='checked_in',
-                    fare=trip.base_fare,
-                    reference=ref,
-                    hold_expires_at=None,
-                    passenger_name='Walk-in Passenger',
-                    passenger_sex='other',
-                    passenger_age=0,
-                    passenger_phone='N/A',
-                    passenger_id_number='N/A',
-                    pickup_location=None
-                )
-                db.session.add(booking)
-            
+            # Marking as full - one bulk insert of walk-in bookings for the empty seats
+            filled = Booking.fill_walk_ins(trip)
             trip.is_full = True
             db.session.commit()
-            flash(f'Trip marked as full. {len(empty_seats)} walk-in passenger(s) added.', 'success')
+            broker.publish(trip.id, {"type": "trip_full", "seats": filled, "status": "taken"})
+            flash(f'Trip marked as full. {len(filled)} walk-in passenger(s) added.', 'success')
         else:
             # Unmarking - just toggle the flag (keep bookings)
             trip.is_full = False
@@ -653,7 +871,7 @@ def trip_seat_book(trip_id: int, seat: str):
                 f"{trip.depart_at.strftime('%b %d at %H:%M')}. "
                 f"Fare: KES {trip.base_fare}. Safe travels!"
             )
-            send_sms(passenger_phone, msg)
+            send_sms(passenger_phone, msg, template='booking_confirmed', entity=ref)
         except Exception as e:
             current_app.logger.error(f'Failed to send booking SMS: {e}')
         
@@ -661,7 +879,10 @@ def trip_seat_book(trip_id: int, seat: str):
             'success': True, 
             'message': f'Booking created! Reference: {ref}',
             'reference': ref,
-            'booking_id': booking.id
+            'booking_id': booking.id,
+            'seat': seat,
+            'status': booking.status,
+            'passenger_name': passenger_name
         })
         
     except Exception as e:
@@ -679,24 +900,22 @@ def bookings_quick():
     from datetime import datetime, timedelta
     now = datetime.utcnow()
     
-    trips = Trip.query.filter(
+    trips = _with_trip_details(Trip.query.filter(
         Trip.status.in_(['scheduled', 'in_progress']),
         Trip.depart_at >= now - timedelta(hours=1)  # Include trips departing in the last hour
-    ).order_by(Trip.depart_at.asc()).limit(50).all()
+    )).order_by(Trip.depart_at.asc()).limit(50).all()
     
-    # Calculate available seats for each trip
+    # Seat counts for all trips in one query
+    occupancy = Booking.occupancy(trips)
     trip_data = []
     for trip in trips:
-        seat_layout = trip.vehicle.seat_layout or []
-        total_seats = len(seat_layout)
-        booked_seats = len([b for b in trip.bookings if b.status in ['confirmed', 'reserved', 'checked_in', 'completed', 'pending_payment']])
-        available = total_seats - booked_seats
-        
+        seats = occupancy[trip.id]
         trip_data.append({
             'trip': trip,
-            'total_seats': total_seats,
-            'booked_seats': booked_seats,
-            'available_seats': available
+            'total_seats': seats.total,
+            'booked_seats': seats.booked,
+            'checked_in_seats': seats.checked_in,
+            'available_seats': seats.free
         })
     
     return render_template('staff/bookings_quick.html', trip_data=trip_data)
@@ -723,21 +942,31 @@ def parcels_create():
         origin_name = request.form.get('origin_name')
         destination_name = request.form.get('destination_name')
         weight_kg = request.form.get('weight_kg', type=float)
-        price = request.form.get('price')
+        price = request.form.get('price', '').strip()
         payment_method = request.form.get('payment_method', 'cash')  # cash or mpesa
+        
+        if not price:
+            # Left blank: charge the route tariff for this weight
+            from maua.parcels.pricing import quote
+            price = quote(origin_name, destination_name, weight_kg)
+            if price is None:
+                flash(f'No tariff for {origin_name} to {destination_name}; please enter a price.', 'danger')
+                return render_template('staff/parcels_create.html')
 
         # Handle photo upload
         photo_filename = None
         file = request.files.get('parcel_photo')
         if file and file.filename:
-            filename = secure_filename(file.filename)
-            upload_dir = os.path.join(current_app.root_path, 'static', 'uploads', 'parcels')
-            os.makedirs(upload_dir, exist_ok=True)
-            filepath = os.path.join(upload_dir, filename)
-            file.save(filepath)
-            photo_filename = filename
-
-        ref_code = f"P{int(datetime.utcnow().timestamp())}"
+            from maua.parcels.photos import store_upload
+            try:
+                photo_filename = store_upload(file)
+                if photo_filename is None:
+                    flash('Photo must be a JPG, PNG, GIF or WebP image; parcel saved without it.', 'warning')
+            except Exception as e:
+                current_app.logger.error(f'Failed to store parcel photo: {e}')
+
+        from maua.parcels.refcodes import next_parcel_ref
+        ref_code = next_parcel_ref()
         
         # Staff creates parcel - can mark as paid immediately for cash payments
         parcel = Parcel(
@@ -760,6 +989,11 @@ def parcels_create():
             payment_status="paid" if payment_method == 'cash' else "pending"
         )
         db.session.add(parcel)
+        ParcelEvent.record(parcel, 'created', {
+            'origin': origin_name,
+            'destination': destination_name,
+            'payment_method': payment_method,
+        }, actor_id=current_user.id)
         db.session.commit()
         
         # Create payment record
@@ -834,6 +1068,60 @@ def parcels_create():
     return render_template('staff/parcels_create.html')
 
 
+BULK_FORMATS = {'csv': 'csv', 'json': 'json', 'jsonl': 'jsonl', 'ndjson': 'jsonl'}
+
+
+@staff_bp.route('/parcels/bulk', methods=['GET', 'POST'])
+@login_required
+@staff_required
+def parcels_bulk():
+    """Register a batch of parcels from a CSV/JSON upload (or a JSON request body)"""
+    from maua.parcels.intake import BulkIntakeError, parse_batch, create_batch, queue_batch_notifications
+    
+    if request.method == 'GET':
+        return render_template('staff/parcels_bulk.html')
+    
+    wants_json = request.is_json or request.accept_mimetypes.best == 'application/json'
+    payment_method = request.args.get('payment_method') or request.form.get('payment_method', 'cash')
+    if request.is_json or request.mimetype == 'application/x-ndjson':
+        stream = request.stream
+        fmt = 'jsonl' if request.mimetype == 'application/x-ndjson' else 'json'
+    else:
+        file = request.files.get('batch_file')
+        ext = file.filename.rsplit('.', 1)[-1].lower() if file and '.' in file.filename else ''
+        if ext not in BULK_FORMATS:
+            flash('Upload a .csv, .json or .jsonl file.', 'danger')
+            return redirect(url_for('staff.parcels_bulk'))
+        stream, fmt = file.stream, BULK_FORMATS[ext]
+    
+    try:
+        rows = parse_batch(stream, fmt)
+        parcels = create_batch(rows, payment_method, current_user.id)
+    except BulkIntakeError as e:
+        if wants_json:
+            return jsonify({'success': False, 'errors': [{'row': r, 'message': m} for r, m in e.errors]}), 400
+        return render_template('staff/parcels_bulk.html', errors=e.errors), 400
+    except Exception as e:
+        current_app.logger.error(f'Bulk parcel intake failed: {e}')
+        if wants_json:
+            return jsonify({'success': False, 'message': 'Failed to register parcels'}), 500
+        flash('Failed to register parcels. Nothing was saved.', 'danger')
+        return redirect(url_for('staff.parcels_bulk'))
+    
+    queue_batch_notifications([p.id for p in parcels])
+    total = sum(p.price for p in parcels)
+    if wants_json:
+        return jsonify({
+            'success': True,
+            'count': len(parcels),
+            'total': float(total),
+            'parcels': [{'id': p.id, 'ref_code': p.ref_code, 'price': float(p.price), 'status': p.status}
+                        for p in parcels],
+        }), 201
+    return render_template('staff/parcels_bulk_receipt.html', parcels=parcels, total=total,
+                           payment_method=payment_method)
+
+
 @staff_bp.route('/parcels/<int:parcel_id>/receipt')
 @login_required
 @staff_required
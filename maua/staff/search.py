@@ -0,0 +1,162 @@
+"""
+Counter search for MAUA SHARK EXPRESS staff
+Finds bookings and parcels by any part of a name, phone, ID number or
+reference, ranked best match first:
+
+- Postgres: pg_trgm GIN indexes over one lower-cased expression per table,
+  so `LIKE '%term%'` is an index scan; ranked by word_similarity;
+- SQLite: FTS5 tables with the trigram tokenizer, kept in sync by triggers
+  and ranked by bm25;
+- phone numbers match however they are typed (0712..., +254 712..., 712...);
+- words shorter than three characters cannot use a trigram index and only
+  narrow the indexed matches (a search made only of them falls back to a scan).
+"""
+
+import re
+from collections import namedtuple
+
+from sqlalchemy import DDL, and_, column, event, func, literal_column, select, table
+from sqlalchemy.orm import joinedload
+
+from maua.extensions import db
+from maua.booking.models import Booking
+from maua.catalog.models import Route, Trip
+from maua.parcels.models import Parcel
+
+SEARCH_LIMIT = 20
+MIN_INDEXED_WORD = 3
+
+SearchIndex = namedtuple('SearchIndex', 'model fts_table trgm_index columns')
+
+BOOKING_SEARCH = SearchIndex(Booking, 'bookings_search', 'ix_bookings_search_trgm',
+                             ('reference', 'passenger_name', 'passenger_phone_normalized', 'passenger_id_number'))
+PARCEL_SEARCH = SearchIndex(Parcel, 'parcels_search', 'ix_parcels_search_trgm',
+                            ('ref_code', 'sender_name', 'receiver_name',
+                             'sender_phone_normalized', 'receiver_phone_normalized'))
+
+
+def search_expression(index, prefix=''):
+    """The lower-cased text the Postgres trigram index is built on (index and queries must match)"""
+    return 'lower(' + " || ' ' || ".join(f"coalesce({prefix}{name}, '')" for name in index.columns) + ')'
+
+
+def search_words(term):
+    """Lower-cased words to match; a phone number becomes its digits after any 0 / 254 prefix"""
+    term = (term or '').strip().lower()
+    if re.fullmatch(r'\+?\d[\d\s-]{4,}', term):
+        digits = re.sub(r'\D', '', term)
+        if digits.startswith('254') and len(digits) > 5:
+            digits = digits[3:]
+        elif digits.startswith('0'):
+            digits = digits[1:]
+        return [digits]
+    return term.split()
+
+
+def _like_all(expression, words):
+    escaped = [w.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') for w in words]
+    return and_(*[expression.like(f'%{w}%', escape='\\') for w in escaped])
+
+
+def _fts_match(words):
+    """FTS5 query: every indexable word as a quoted substring"""
+    return ' '.join('"' + w.replace('"', '""') + '"' for w in words if len(w) >= MIN_INDEXED_WORD)
+
+
+def _dialect():
+    return db.session.get_bind().dialect.name
+
+
+def filter_matching(query, index, term):
+    """Narrow an ORM query on `index.model` to rows matching `term` (no ordering)"""
+    words = search_words(term)
+    if not words:
+        return query
+    model = index.model
+    expression = literal_column(search_expression(index, prefix=f'{model.__tablename__}.'))
+    match = _fts_match(words)
+    if _dialect() == 'sqlite' and match:
+        fts = table(index.fts_table, column('rowid'))
+        query = query.filter(model.id.in_(
+            select(fts.c.rowid).where(literal_column(index.fts_table).op('MATCH')(match))
+        ))
+        short = [w for w in words if len(w) < MIN_INDEXED_WORD]
+        return query.filter(_like_all(expression, short)) if short else query
+    return query.filter(_like_all(expression, words))
+
+
+def ranked(index, term, limit=SEARCH_LIMIT, options=()):
+    """Rows of `index.model` matching `term`, best match first"""
+    words = search_words(term)
+    if not words:
+        return []
+    model = index.model
+    expression = literal_column(search_expression(index, prefix=f'{model.__tablename__}.'))
+    query = model.query.options(*options)
+    match = _fts_match(words)
+    dialect = _dialect()
+    if dialect == 'sqlite' and match:
+        fts = table(index.fts_table, column('rowid'), column('rank'))
+        hits = select(fts.c.rowid, fts.c.rank).where(
+            literal_column(index.fts_table).op('MATCH')(match)
+        ).subquery()
+        query = query.join(hits, hits.c.rowid == model.id)
+        short = [w for w in words if len(w) < MIN_INDEXED_WORD]
+        if short:
+            query = query.filter(_like_all(expression, short))
+        query = query.order_by(hits.c.rank.asc(), model.id.desc())  # bm25: lower is better
+    else:
+        query = query.filter(_like_all(expression, words))
+        if dialect == 'postgresql':
+            query = query.order_by(func.word_similarity(' '.join(words), expression).desc(), model.id.desc())
+        else:
+            query = query.order_by(model.id.desc())
+    return query.limit(limit).all()
+
+
+def search(term, limit=SEARCH_LIMIT):
+    """Best bookings and parcels for a counter search"""
+    return {
+        'bookings': ranked(BOOKING_SEARCH, term, limit, options=(
+            joinedload(Booking.trip).joinedload(Trip.route).joinedload(Route.origin),
+            joinedload(Booking.trip).joinedload(Trip.route).joinedload(Route.destination),
+        )),
+        'parcels': ranked(PARCEL_SEARCH, term, limit),
+    }
+
+
+# Indexes follow the tables when they are created outside migrations (tests, init_db.py)
+
+def _sqlite_statements(index):
+    source = index.model.__tablename__
+    names = ', '.join(index.columns)
+    new = ', '.join(f'new.{name}' for name in index.columns)
+    old = ', '.join(f'old.{name}' for name in index.columns)
+    fts = index.fts_table
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({names}, content='{source}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {source} BEGIN "
+        f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {source} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {source} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new}); END",
+    ]
+
+
+def _postgresql_statements(index):
+    return [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        f"CREATE INDEX IF NOT EXISTS {index.trgm_index} ON {index.model.__tablename__} "
+        f"USING gin (({search_expression(index)}) gin_trgm_ops)",
+    ]
+
+
+for _index in (BOOKING_SEARCH, PARCEL_SEARCH):
+    _table = _index.model.__table__
+    for _statement in _sqlite_statements(_index):
+        event.listen(_table, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+    for _statement in _postgresql_statements(_index):
+        event.listen(_table, 'after_create', DDL(_statement).execute_if(dialect='postgresql'))
+    event.listen(_table, 'before_drop', DDL(f"DROP TABLE IF EXISTS {_index.fts_table}").execute_if(dialect='sqlite'))
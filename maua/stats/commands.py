@@ -0,0 +1,19 @@
+import time
+
+import click
+
+from maua.stats import stats_bp
+
+
+@stats_bp.cli.command('refresh')
+@click.option('--every', type=int, default=None, help='Keep running, refreshing every N seconds')
+def refresh_command(every):
+    """Recompute dashboard counters from their tables."""
+    from maua.stats.counters import refresh
+    
+    while True:
+        values = refresh()
+        click.echo(', '.join(f'{key}={value}' for key, value in values.items()))
+        if not every:
+            break
+        time.sleep(every)
@@ -0,0 +1,192 @@
+"""
+Dashboard counters for MAUA SHARK EXPRESS
+Staff and admin dashboards read a handful of totals (bookings, parcels, active
+trips, staff, routes, vehicles, depots). Counting those tables on every page
+load scans the largest tables in the system, so the totals are kept in
+`stat_counters` instead:
+
+- ORM inserts, deletes and relevant column changes are turned into deltas and
+  applied in the same transaction (one UPDATE per counter per flush).
+- Core bulk statements bypass the ORM hooks and call `adjust` themselves.
+- `refresh` recomputes everything from the tables; `flask stats refresh` runs
+  it (optionally on a timer) so any drift is corrected.
+
+Rows are seeded by the migration, or when the schema is created with
+`create_all`. Dashboards call `snapshot`, a single primary-key query that never
+writes: a missing row is counted from its table instead.
+"""
+
+import logging
+from collections import Counter, namedtuple
+from datetime import datetime
+
+from sqlalchemy import event, func, inspect, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session
+
+from maua.extensions import db
+from maua.auth.models import User
+from maua.booking.models import Booking
+from maua.catalog.models import Depot, Route, Trip, Vehicle
+from maua.parcels.models import Parcel
+from maua.stats.models import StatCounter
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_TRIP_STATUSES = ('scheduled', 'in_progress')
+
+# fields: attributes the predicate reads; criteria: the same predicate in SQL (None = every row)
+CounterDef = namedtuple('CounterDef', 'model fields criteria matches')
+
+COUNTERS = {
+    'bookings_total': CounterDef(Booking, (), None, lambda v: True),
+    'parcels_total': CounterDef(Parcel, (), None, lambda v: True),
+    'trips_active': CounterDef(Trip, ('status',), lambda: Trip.status.in_(ACTIVE_TRIP_STATUSES),
+                               lambda v: v['status'] in ACTIVE_TRIP_STATUSES),
+    'staff_users': CounterDef(User, ('is_staff', 'is_admin'),
+                              lambda: or_(User.is_staff.is_(True), User.is_admin.is_(True)),
+                              lambda v: bool(v['is_staff'] or v['is_admin'])),
+    'routes_active': CounterDef(Route, ('active',), lambda: Route.active.is_(True), lambda v: bool(v['active'])),
+    'vehicles_active': CounterDef(Vehicle, ('active',), lambda: Vehicle.active.is_(True), lambda v: bool(v['active'])),
+    'depots_total': CounterDef(Depot, (), None, lambda v: True),
+}
+
+
+def _count_query(key):
+    definition = COUNTERS[key]
+    query = select(func.count()).select_from(definition.model)
+    if definition.criteria is not None:
+        query = query.where(definition.criteria())
+    return query
+
+
+def count_from_table(key):
+    """The real COUNT(*) for a counter"""
+    return db.session.execute(_count_query(key)).scalar() or 0
+
+
+def refresh(keys=None):
+    """Recompute counters from their tables and store them; returns {key: value}"""
+    values = {key: count_from_table(key) for key in (keys or COUNTERS)}
+    now = datetime.utcnow()
+    for key, value in values.items():
+        updated = db.session.execute(
+            update(StatCounter).where(StatCounter.key == key)
+            .values(value=value, updated_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not updated:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(StatCounter).values(key=key, value=value, updated_at=now))
+            except IntegrityError:
+                pass  # another worker seeded it with the same count
+    db.session.commit()
+    logger.info(f"Refreshed stat counters: {values}")
+    return values
+
+
+def snapshot(*keys):
+    """Counter values for a dashboard in one query; missing rows are counted, not written"""
+    values = StatCounter.read(keys)
+    for key in keys:
+        if key not in values:
+            values[key] = count_from_table(key)
+    return {key: max(values[key] or 0, 0) for key in keys}
+
+
+def adjust(key, delta):
+    """Apply a delta from a bulk statement; runs in the caller's transaction"""
+    if delta:
+        _apply(db.session.connection(), {key: delta})
+
+
+def _apply(connection, deltas):
+    now = datetime.utcnow()
+    for key, delta in deltas.items():
+        if delta:
+            # A missing row is stored by `flask stats refresh`; until then snapshot counts the table
+            connection.execute(
+                update(StatCounter.__table__).where(StatCounter.__table__.c.key == key)
+                .values(value=StatCounter.__table__.c.value + delta, updated_at=now)
+            )
+
+
+def _values(target, previous=False):
+    state = inspect(target)
+    values = {}
+    for definition in COUNTERS.values():
+        if isinstance(target, definition.model):
+            for field in definition.fields:
+                value = getattr(target, field)
+                if previous:
+                    history = state.attrs[field].history
+                    if history.deleted:
+                        value = history.deleted[0]
+                values[field] = value
+    return values
+
+
+def _record(target, sign, previous=False):
+    session = object_session(target)
+    if session is None:
+        return
+    values = _values(target, previous)
+    deltas = session.info.setdefault('stat_deltas', Counter())
+    for key, definition in COUNTERS.items():
+        if isinstance(target, definition.model) and definition.matches(values):
+            deltas[key] += sign
+
+
+def _after_insert(mapper, connection, target):
+    _record(target, 1)
+
+
+def _after_delete(mapper, connection, target):
+    _record(target, -1)
+
+
+def _after_update(mapper, connection, target):
+    state = inspect(target)
+    fields = {f for d in COUNTERS.values() if isinstance(target, d.model) for f in d.fields}
+    if any(state.attrs[f].history.has_changes() for f in fields):
+        _record(target, -1, previous=True)
+        _record(target, 1)
+
+
+def _keep_previous(target, value, oldvalue, initiator):
+    return value
+
+
+for _model in {d.model for d in COUNTERS.values()}:
+    event.listen(_model, 'after_insert', _after_insert)
+    event.listen(_model, 'after_delete', _after_delete)
+    event.listen(_model, 'after_update', _after_update)
+for _definition in COUNTERS.values():
+    for _field in _definition.fields:
+        # Load the old value on assignment (even on an expired object) so updates know what changed
+        event.listen(getattr(_definition.model, _field), 'set', _keep_previous, active_history=True, retval=True)
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _seed_after_create(target, connection, **kw):
+    """Seed missing counter rows when the schema is created outside migrations (tests, init_db.py)"""
+    table = StatCounter.__table__
+    existing = set(connection.execute(select(table.c.key)).scalars())
+    now = datetime.utcnow()
+    rows = [{'key': key, 'value': connection.execute(_count_query(key)).scalar() or 0, 'updated_at': now}
+            for key in COUNTERS if key not in existing]
+    if rows:
+        connection.execute(insert(table), rows)
+
+
+@event.listens_for(Session, 'after_flush')
+def _flush_deltas(session, flush_context):
+    deltas = session.info.pop('stat_deltas', None)
+    if deltas:
+        _apply(session.connection(), deltas)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_deltas(session):
+    session.info.pop('stat_deltas', None)
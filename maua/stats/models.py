@@ -0,0 +1,21 @@
+from datetime import datetime
+from sqlalchemy import select
+from maua.extensions import db
+
+
+class StatCounter(db.Model):
+    """Materialized dashboard aggregates, one row per counter (see stats.counters)"""
+    __tablename__ = "stat_counters"
+    
+    key = db.Column(db.String(40), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<StatCounter {self.key}: {self.value}>'
+    
+    @classmethod
+    def read(cls, keys):
+        """Current values for `keys` in one query, as {key: value}; missing rows are left out"""
+        rows = db.session.execute(select(cls.key, cls.value).where(cls.key.in_(list(keys)))).all()
+        return {key: value for key, value in rows}
@@ -0,0 +1,90 @@
+"""
+Server-sent event streams for MAUA SHARK EXPRESS
+Shared by the bell notification streams and the live seat maps:
+
+- streams are opt-in (`EVENT_STREAMS_ENABLED`); while they are off the stream
+  endpoints return 503 and pages do not open them, relying on polling alone;
+- every open stream holds a gunicorn thread, so all streams in a process share
+  one cap (`EVENT_STREAM_MAX_SUBSCRIBERS`); clients over it get a 503 and keep
+  polling instead;
+- the queue is read with a timeout so idle streams send `: keepalive` comments
+  (and notice a closed connection), and each stream ends after
+  `EVENT_STREAM_LIFETIME` seconds so threads are recycled;
+- brokers are in-process, so events are hints: clients resync from a JSON
+  endpoint when a stream opens and on a timer.
+"""
+
+import queue
+import threading
+import time
+
+from flask import Response, current_app, jsonify
+
+
+class StreamSlots:
+    """Process-wide count of open event streams"""
+
+    def __init__(self):
+        self._open = 0
+        self._lock = threading.Lock()
+
+    @property
+    def open(self) -> int:
+        with self._lock:
+            return self._open
+
+    def acquire(self, limit: int) -> bool:
+        with self._lock:
+            if self._open >= limit:
+                return False
+            self._open += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self._open = max(self._open - 1, 0)
+
+
+slots = StreamSlots()
+
+
+def event_stream_response(subscribe, unsubscribe, event=None):
+    """Stream what `subscribe()`'s queue receives until the lifetime runs out.
+
+    `unsubscribe(q)` runs once when the response is closed, even if the
+    client went away before the first byte was sent. `event` names the SSE
+    event type (unnamed events reach `onmessage`).
+    """
+    config = current_app.config
+    if not config.get('EVENT_STREAMS_ENABLED'):
+        return jsonify({'error': 'Live updates are off, poll instead'}), 503
+    if not slots.acquire(config.get('EVENT_STREAM_MAX_SUBSCRIBERS', 2)):
+        return jsonify({'error': 'Stream capacity reached, poll instead'}), 503
+    lifetime = config.get('EVENT_STREAM_LIFETIME', 300)
+    keepalive = config.get('EVENT_STREAM_KEEPALIVE', 20)
+    prefix = f'event: {event}\n' if event else ''
+
+    q = subscribe()
+    closed = threading.Event()
+
+    def close():
+        if not closed.is_set():
+            closed.set()
+            unsubscribe(q)
+            slots.release()
+
+    def stream():
+        deadline = time.monotonic() + lifetime
+        yield 'retry: 5000\n: connected\n\n'
+        while time.monotonic() < deadline:
+            try:
+                data = q.get(timeout=min(keepalive, max(deadline - time.monotonic(), 0.01)))
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            yield f'{prefix}data: {data}\n\n'
+
+    response = Response(stream(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(close)
+    return response
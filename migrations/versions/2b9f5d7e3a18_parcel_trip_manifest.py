@@ -0,0 +1,36 @@
+"""Parcel trip assignment and vehicle cargo capacity
+
+Revision ID: 2b9f5d7e3a18
+Revises: e7a4c2985f16
+Create Date: 2026-02-23 09:33:27.140962
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2b9f5d7e3a18'
+down_revision = 'e7a4c2985f16'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('vehicles', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('cargo_capacity_kg', sa.Float(), nullable=False, server_default='300'))
+
+    with op.batch_alter_table('parcels', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('trip_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_parcels_trip_id'), ['trip_id'], unique=False)
+        batch_op.create_foreign_key('fk_parcels_trip_id_trips', 'trips', ['trip_id'], ['id'])
+
+
+def downgrade():
+    with op.batch_alter_table('parcels', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_parcels_trip_id_trips', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_parcels_trip_id'))
+        batch_op.drop_column('trip_id')
+
+    with op.batch_alter_table('vehicles', schema=None) as batch_op:
+        batch_op.drop_column('cargo_capacity_kg')
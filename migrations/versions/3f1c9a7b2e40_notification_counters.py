@@ -0,0 +1,51 @@
+"""Materialized unread notification counters
+
+Revision ID: 3f1c9a7b2e40
+Revises: d2ae8adfa42a
+Create Date: 2026-01-12 09:14:22.418530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a7b2e40'
+down_revision = 'd2ae8adfa42a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('notification_counters',
+    sa.Column('key', sa.String(length=40), nullable=False),
+    sa.Column('unread_count', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('key')
+    )
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.create_index('ix_notifications_user_audience_read_created',
+                              ['user_id', 'audience', 'is_read', 'created_at'], unique=False)
+
+    # Seed a counter for every user (and staff) so polls are a lookup from the start
+    op.execute("""
+        INSERT INTO notification_counters (key, unread_count, updated_at)
+        SELECT 'customer:' || u.id, COUNT(n.id), CURRENT_TIMESTAMP
+        FROM "user" u
+        LEFT JOIN notifications n
+            ON n.user_id = u.id AND n.audience = 'customer' AND n.is_read = false
+        GROUP BY u.id
+    """)
+    op.execute("""
+        INSERT INTO notification_counters (key, unread_count, updated_at)
+        SELECT 'staff', COUNT(*), CURRENT_TIMESTAMP
+        FROM notifications
+        WHERE audience = 'staff' AND is_read = false
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.drop_index('ix_notifications_user_audience_read_created')
+
+    op.drop_table('notification_counters')
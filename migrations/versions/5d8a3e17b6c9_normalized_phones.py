@@ -0,0 +1,95 @@
+"""Normalized phone columns for parcel and booking lookups
+
+Revision ID: 5d8a3e17b6c9
+Revises: c41e7f9a0d25
+Create Date: 2026-02-02 10:27:51.630418
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d8a3e17b6c9'
+down_revision = 'c41e7f9a0d25'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+
+
+def normalize_phone(phone):
+    """Frozen copy of maua.notifications.sms.normalize_phone as of this revision.
+
+    Migrations must not import app code: later changes to the helper would
+    silently change what this backfill writes.
+    """
+    p = phone.replace(' ', '').replace('-', '')
+    if p.startswith('+'):
+        return p
+    if p.startswith('0') and len(p) == 10:
+        return '+254' + p[1:]
+    if p.startswith('254') and len(p) == 12:
+        return '+' + p
+    return p
+
+
+def _normalized(value):
+    if not value or value == 'N/A':
+        return None
+    return normalize_phone(value.strip())
+
+
+def _backfill(table, columns):
+    """Fill <column>_normalized for every row, walking the table by id in batches"""
+    conn = op.get_bind()
+    source = sa.table(table, sa.column('id', sa.Integer), *[sa.column(c, sa.String) for c in columns])
+    target = sa.table(table, sa.column('id', sa.Integer), *[sa.column(f'{c}_normalized', sa.String) for c in columns])
+    update = target.update().where(target.c.id == sa.bindparam('_id')).values(
+        {f'{c}_normalized': sa.bindparam(f'_{c}') for c in columns}
+    )
+
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(source).where(source.c.id > last_id).order_by(source.c.id).limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        conn.execute(update, [
+            dict({'_id': row.id}, **{f'_{c}': _normalized(getattr(row, c)) for c in columns})
+            for row in rows
+        ])
+        last_id = rows[-1].id
+
+
+def upgrade():
+    with op.batch_alter_table('parcels', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sender_phone_normalized', sa.String(length=30), nullable=True))
+        batch_op.add_column(sa.Column('receiver_phone_normalized', sa.String(length=30), nullable=True))
+
+    with op.batch_alter_table('bookings', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('passenger_phone_normalized', sa.String(length=30), nullable=True))
+
+    _backfill('parcels', ['sender_phone', 'receiver_phone'])
+    _backfill('bookings', ['passenger_phone'])
+
+    # Build the indexes after the backfill so it does not pay for index maintenance
+    with op.batch_alter_table('parcels', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_parcels_sender_phone_normalized'), ['sender_phone_normalized'], unique=False)
+        batch_op.create_index(batch_op.f('ix_parcels_receiver_phone_normalized'), ['receiver_phone_normalized'], unique=False)
+
+    with op.batch_alter_table('bookings', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_bookings_passenger_phone_normalized'), ['passenger_phone_normalized'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('bookings', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_bookings_passenger_phone_normalized'))
+        batch_op.drop_column('passenger_phone_normalized')
+
+    with op.batch_alter_table('parcels', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_parcels_receiver_phone_normalized'))
+        batch_op.drop_index(batch_op.f('ix_parcels_sender_phone_normalized'))
+        batch_op.drop_column('receiver_phone_normalized')
+        batch_op.drop_column('sender_phone_normalized')
@@ -0,0 +1,81 @@
+"""Archive tables for exported completed trips
+
+Revision ID: 5e2a9c7d1b84
+Revises: b7e1f04c9a26
+Create Date: 2026-03-16 10:22:51.204677
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e2a9c7d1b84'
+down_revision = 'b7e1f04c9a26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('trips_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('route_id', sa.Integer(), nullable=True),
+    sa.Column('vehicle_id', sa.Integer(), nullable=True),
+    sa.Column('route_code', sa.String(length=20), nullable=True),
+    sa.Column('origin_town', sa.String(length=120), nullable=True),
+    sa.Column('destination_town', sa.String(length=120), nullable=True),
+    sa.Column('vehicle_plate', sa.String(length=20), nullable=True),
+    sa.Column('depart_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('arrive_eta', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('base_fare', sa.Numeric(precision=10, scale=2), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('is_full', sa.Boolean(), nullable=True),
+    sa.Column('driver_name', sa.String(length=120), nullable=True),
+    sa.Column('driver_phone', sa.String(length=30), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('trips_archive', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_trips_archive_depart_at'), ['depart_at'], unique=False)
+
+    op.create_table('bookings_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('trip_id', sa.Integer(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('seat_number', sa.String(length=5), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('fare', sa.Numeric(precision=10, scale=2), nullable=True),
+    sa.Column('reference', sa.String(length=30), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('passenger_name', sa.String(length=100), nullable=True),
+    sa.Column('passenger_sex', sa.String(length=10), nullable=True),
+    sa.Column('passenger_age', sa.Integer(), nullable=True),
+    sa.Column('passenger_phone', sa.String(length=20), nullable=True),
+    sa.Column('passenger_phone_normalized', sa.String(length=30), nullable=True),
+    sa.Column('passenger_id_number', sa.String(length=30), nullable=True),
+    sa.Column('pickup_location', sa.String(length=255), nullable=True),
+    sa.Column('payment_id', sa.Integer(), nullable=True),
+    sa.Column('ticket_status', sa.String(length=20), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('bookings_archive', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_bookings_archive_trip_id'), ['trip_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_bookings_archive_reference'), ['reference'], unique=False)
+        batch_op.create_index(batch_op.f('ix_bookings_archive_passenger_phone_normalized'), ['passenger_phone_normalized'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('bookings_archive', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_bookings_archive_passenger_phone_normalized'))
+        batch_op.drop_index(batch_op.f('ix_bookings_archive_reference'))
+        batch_op.drop_index(batch_op.f('ix_bookings_archive_trip_id'))
+
+    op.drop_table('bookings_archive')
+
+    with op.batch_alter_table('trips_archive', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_trips_archive_depart_at'))
+
+    op.drop_table('trips_archive')
@@ -0,0 +1,28 @@
+"""Parcel last-change timestamp for cacheable tracking pages
+
+Revision ID: 6c3e8f1a4d72
+Revises: 2b9f5d7e3a18
+Create Date: 2026-03-02 11:18:45.309214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c3e8f1a4d72'
+down_revision = '2b9f5d7e3a18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('parcels', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    op.execute("UPDATE parcels SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)")
+
+
+def downgrade():
+    with op.batch_alter_table('parcels', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
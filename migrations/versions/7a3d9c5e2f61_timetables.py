@@ -0,0 +1,57 @@
+"""Recurring timetables and the trips generated from them
+
+Revision ID: 7a3d9c5e2f61
+Revises: 5e2a9c7d1b84
+Create Date: 2026-03-18 09:41:07.552310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a3d9c5e2f61'
+down_revision = '5e2a9c7d1b84'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('timetables',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('route_id', sa.Integer(), nullable=False),
+    sa.Column('vehicle_id', sa.Integer(), nullable=False),
+    sa.Column('departure_times', sa.JSON(), nullable=False),
+    sa.Column('days_of_week', sa.JSON(), nullable=False),
+    sa.Column('base_fare', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.Column('driver_name', sa.String(length=120), nullable=True),
+    sa.Column('driver_phone', sa.String(length=30), nullable=True),
+    sa.Column('valid_from', sa.Date(), nullable=True),
+    sa.Column('valid_until', sa.Date(), nullable=True),
+    sa.Column('active', sa.Boolean(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['route_id'], ['routes.id'], ),
+    sa.ForeignKeyConstraint(['vehicle_id'], ['vehicles.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('timetables', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_timetables_active'), ['active'], unique=False)
+
+    with op.batch_alter_table('trips', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('timetable_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_trips_timetable_id'), ['timetable_id'], unique=False)
+        batch_op.create_foreign_key('fk_trips_timetable_id_timetables', 'timetables', ['timetable_id'], ['id'])
+        batch_op.create_unique_constraint('uq_timetable_departure', ['timetable_id', 'depart_at'])
+
+
+def downgrade():
+    with op.batch_alter_table('trips', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_timetable_departure', type_='unique')
+        batch_op.drop_constraint('fk_trips_timetable_id_timetables', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_trips_timetable_id'))
+        batch_op.drop_column('timetable_id')
+
+    with op.batch_alter_table('timetables', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_timetables_active'))
+
+    op.drop_table('timetables')
@@ -0,0 +1,53 @@
+"""Notification archive table for retention
+
+Revision ID: 8b5d2c61f0a3
+Revises: 3f1c9a7b2e40
+Create Date: 2026-01-19 16:02:47.903114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b5d2c61f0a3'
+down_revision = '3f1c9a7b2e40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('notifications_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('notification_type', sa.String(length=30), nullable=False),
+    sa.Column('audience', sa.String(length=20), nullable=True),
+    sa.Column('title', sa.String(length=200), nullable=False),
+    sa.Column('message', sa.Text(), nullable=False),
+    sa.Column('icon', sa.String(length=50), nullable=True),
+    sa.Column('color', sa.String(length=20), nullable=True),
+    sa.Column('link', sa.String(length=255), nullable=True),
+    sa.Column('booking_id', sa.Integer(), nullable=True),
+    sa.Column('trip_id', sa.Integer(), nullable=True),
+    sa.Column('parcel_id', sa.Integer(), nullable=True),
+    sa.Column('is_read', sa.Boolean(), nullable=True),
+    sa.Column('read_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('notifications_archive', schema=None) as batch_op:
+        batch_op.create_index('ix_notifications_archive_audience_created', ['audience', 'created_at'], unique=False)
+
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_notifications_created_at'), ['created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_notifications_created_at'))
+
+    with op.batch_alter_table('notifications_archive', schema=None) as batch_op:
+        batch_op.drop_index('ix_notifications_archive_audience_created')
+
+    op.drop_table('notifications_archive')
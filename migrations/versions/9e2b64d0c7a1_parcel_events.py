@@ -0,0 +1,54 @@
+"""Append-only parcel event log
+
+Revision ID: 9e2b64d0c7a1
+Revises: 5d8a3e17b6c9
+Create Date: 2026-02-09 14:05:38.772190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e2b64d0c7a1'
+down_revision = '5d8a3e17b6c9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The initial migration created parcel_events as an id-only placeholder that
+    # nothing wrote to, so it is replaced rather than altered.
+    op.drop_table('parcel_events')
+    op.create_table('parcel_events',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('parcel_id', sa.Integer(), nullable=False),
+    sa.Column('event_type', sa.String(length=30), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('payload', sa.JSON(), nullable=True),
+    sa.Column('actor_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['actor_id'], ['user.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['parcel_id'], ['parcels.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('parcel_events', schema=None) as batch_op:
+        batch_op.create_index('ix_parcel_events_parcel_created', ['parcel_id', 'created_at'], unique=False)
+
+    # Give existing parcels a starting point so their timelines are not empty
+    op.execute("""
+        INSERT INTO parcel_events (parcel_id, event_type, actor_id, created_at)
+        SELECT id, 'created', created_by, COALESCE(created_at, CURRENT_TIMESTAMP)
+        FROM parcels
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('parcel_events', schema=None) as batch_op:
+        batch_op.drop_index('ix_parcel_events_parcel_created')
+
+    op.drop_table('parcel_events')
+    op.create_table('parcel_events',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
@@ -0,0 +1,47 @@
+"""Materialized dashboard counters
+
+Revision ID: a4d9e2c7f318
+Revises: 6c3e8f1a4d72
+Create Date: 2026-03-09 10:02:51.664107
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d9e2c7f318'
+down_revision = '6c3e8f1a4d72'
+branch_labels = None
+depends_on = None
+
+
+COUNTS = {
+    'bookings_total': "SELECT COUNT(*) FROM bookings",
+    'parcels_total': "SELECT COUNT(*) FROM parcels",
+    'trips_active': "SELECT COUNT(*) FROM trips WHERE status IN ('scheduled', 'in_progress')",
+    'staff_users': 'SELECT COUNT(*) FROM "user" WHERE is_staff = true OR is_admin = true',
+    'routes_active': "SELECT COUNT(*) FROM routes WHERE active = true",
+    'vehicles_active': "SELECT COUNT(*) FROM vehicles WHERE active = true",
+    'depots_total': "SELECT COUNT(*) FROM depots",
+}
+
+
+def upgrade():
+    op.create_table('stat_counters',
+    sa.Column('key', sa.String(length=40), nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+    # Seed from the current tables so the first dashboard load is already a lookup
+    for key, count_sql in COUNTS.items():
+        op.execute(f"""
+            INSERT INTO stat_counters (key, value, updated_at)
+            SELECT '{key}', ({count_sql}), CURRENT_TIMESTAMP
+        """)
+
+
+def downgrade():
+    op.drop_table('stat_counters')
@@ -0,0 +1,26 @@
+"""Index for passenger profile aggregation
+
+Revision ID: b7e1f04c9a26
+Revises: a4d9e2c7f318
+Create Date: 2026-03-12 16:40:09.518832
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e1f04c9a26'
+down_revision = 'a4d9e2c7f318'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('bookings', schema=None) as batch_op:
+        batch_op.create_index('ix_bookings_passenger_profile',
+                              ['passenger_phone_normalized', 'passenger_name', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('bookings', schema=None) as batch_op:
+        batch_op.drop_index('ix_bookings_passenger_profile')
@@ -0,0 +1,26 @@
+"""Trip reminder marker
+
+Revision ID: c41e7f9a0d25
+Revises: 8b5d2c61f0a3
+Create Date: 2026-01-26 08:41:09.215774
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41e7f9a0d25'
+down_revision = '8b5d2c61f0a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('bookings', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('reminder_sent_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('bookings', schema=None) as batch_op:
+        batch_op.drop_column('reminder_sent_at')
@@ -0,0 +1,41 @@
+"""Composite indexes for keyset paging of staff lists
+
+Revision ID: c8f2a6d4e913
+Revises: 7a3d9c5e2f61
+Create Date: 2026-03-20 14:05:33.918402
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8f2a6d4e913'
+down_revision = '7a3d9c5e2f61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('bookings', schema=None) as batch_op:
+        batch_op.create_index('ix_bookings_trip_created', ['trip_id', 'created_at', 'id'], unique=False)
+
+    with op.batch_alter_table('parcels', schema=None) as batch_op:
+        batch_op.create_index('ix_parcels_created', ['created_at', 'id'], unique=False)
+        batch_op.create_index('ix_parcels_status_created', ['status', 'created_at', 'id'], unique=False)
+
+    with op.batch_alter_table('trips', schema=None) as batch_op:
+        batch_op.create_index('ix_trips_status_depart', ['status', 'depart_at', 'id'], unique=False)
+        batch_op.create_index('ix_trips_route_depart', ['route_id', 'depart_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('trips', schema=None) as batch_op:
+        batch_op.drop_index('ix_trips_route_depart')
+        batch_op.drop_index('ix_trips_status_depart')
+
+    with op.batch_alter_table('parcels', schema=None) as batch_op:
+        batch_op.drop_index('ix_parcels_status_created')
+        batch_op.drop_index('ix_parcels_created')
+
+    with op.batch_alter_table('bookings', schema=None) as batch_op:
+        batch_op.drop_index('ix_bookings_trip_created')
@@ -0,0 +1,61 @@
+"""Search indexes for bookings and parcels (pg_trgm on Postgres, FTS5 on SQLite)
+
+Revision ID: e3b7d15a9c40
+Revises: c8f2a6d4e913
+Create Date: 2026-03-23 16:12:48.027731
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3b7d15a9c40'
+down_revision = 'c8f2a6d4e913'
+branch_labels = None
+depends_on = None
+
+# (source table, FTS5 table / trigram index stem, columns); must match maua/staff/search.py
+SEARCHES = (
+    ('bookings', 'bookings_search',
+     ('reference', 'passenger_name', 'passenger_phone_normalized', 'passenger_id_number')),
+    ('parcels', 'parcels_search',
+     ('ref_code', 'sender_name', 'receiver_name', 'sender_phone_normalized', 'receiver_phone_normalized')),
+)
+
+
+def _expression(columns):
+    return 'lower(' + " || ' ' || ".join(f"coalesce({name}, '')" for name in columns) + ')'
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for source, name, columns in SEARCHES:
+            op.execute(f"CREATE INDEX IF NOT EXISTS ix_{name}_trgm ON {source} USING gin (({_expression(columns)}) gin_trgm_ops)")
+    elif dialect == 'sqlite':
+        for source, fts, columns in SEARCHES:
+            names = ', '.join(columns)
+            new = ', '.join(f'new.{c}' for c in columns)
+            old = ', '.join(f'old.{c}' for c in columns)
+            op.execute(f"CREATE VIRTUAL TABLE {fts} USING fts5({names}, content='{source}', content_rowid='id', tokenize='trigram')")
+            op.execute(f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {source} BEGIN "
+                       f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new}); END")
+            op.execute(f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {source} BEGIN "
+                       f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old}); END")
+            op.execute(f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {source} BEGIN "
+                       f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old}); "
+                       f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new}); END")
+            op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for source, name, columns in SEARCHES:
+            op.execute(f"DROP INDEX IF EXISTS ix_{name}_trgm")
+    elif dialect == 'sqlite':
+        for source, fts, columns in SEARCHES:
+            for suffix in ('ai', 'ad', 'au'):
+                op.execute(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+            op.execute(f"DROP TABLE IF EXISTS {fts}")
@@ -0,0 +1,28 @@
+"""Block-allocated reference code sequences
+
+Revision ID: e7a4c2985f16
+Revises: 9e2b64d0c7a1
+Create Date: 2026-02-16 11:48:03.517262
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a4c2985f16'
+down_revision = '9e2b64d0c7a1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ref_code_sequences',
+    sa.Column('name', sa.String(length=30), nullable=False),
+    sa.Column('next_value', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('ref_code_sequences')
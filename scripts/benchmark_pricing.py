@@ -0,0 +1,45 @@
+import argparse
+import random
+import time
+
+from maua import create_app
+from maua.parcels import pricing
+
+
+def benchmark(count: int, config: str, seed: int) -> None:
+    app = create_app(config) if config else create_app()
+    with app.app_context():
+        started = time.perf_counter()
+        pricing.invalidate()
+        table = pricing.get_table()
+        build_ms = (time.perf_counter() - started) * 1000
+        if not table.lanes:
+            print("No priced routes (set distance_km on active routes first)")
+            return
+
+        rng = random.Random(seed)
+        lanes = list(table.lanes)
+        top = table.limits[-1] * 1.2
+        parcels = [(*rng.choice(lanes), round(rng.uniform(0, top), 1)) for _ in range(count)]
+
+        started = time.perf_counter()
+        total = sum(table.quote(origin, destination, weight) for origin, destination, weight in parcels)
+        elapsed = time.perf_counter() - started
+
+        print(f"Tariff table: {len(table.lanes)} lanes x {len(table.limits)} bands, built in {build_ms:.1f} ms")
+        print(f"Priced {count} parcels in {elapsed * 1000:.1f} ms "
+              f"({elapsed / count * 1e6:.2f} us/parcel), total KES {total:,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parcel tariff lookups against the configured database")
+    parser.add_argument("--count", type=int, default=100000, help="Number of parcels to price")
+    parser.add_argument("--config", default=None, help="Config class, e.g. config.ProductionConfig")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the parcel mix")
+    args = parser.parse_args()
+
+    benchmark(args.count, args.config, args.seed)
+
+
+if __name__ == "__main__":
+    main()
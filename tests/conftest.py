@@ -0,0 +1,55 @@
+from datetime import datetime
+
+import pytest
+
+from config import TestingConfig
+from maua import create_app
+from maua.extensions import db
+
+
+@pytest.fixture
+def app_config():
+    """Config class the `app` fixture is built from; a test module can override it"""
+    return TestingConfig
+
+
+@pytest.fixture
+def app(app_config):
+    app = create_app(app_config)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def staff_client(app):
+    """A test client logged in as a new staff user"""
+    from maua.auth.models import User
+
+    staff = User(username='desk', email='desk@example.com', phone='0711000000', password_hash='x', is_staff=True)
+    db.session.add(staff)
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(staff.id)
+    return client
+
+
+def make_trip(**fields):
+    """A trip on a new Nairobi -> Meru route with vehicle KAA 001A (flushed, not committed)"""
+    from maua.catalog.models import Depot, Route, Trip, Vehicle
+
+    nairobi, meru = Depot(name='CBD', town='Nairobi'), Depot(name='Stage', town='Meru')
+    vehicle = Vehicle(plate_no='KAA 001A')
+    db.session.add_all([nairobi, meru, vehicle])
+    db.session.flush()
+    route = Route(code='NRB-MRU', origin_depot_id=nairobi.id, destination_depot_id=meru.id)
+    db.session.add(route)
+    db.session.flush()
+    values = dict(depart_at=datetime.utcnow(), base_fare=500)
+    values.update(fields)
+    trip = Trip(route_id=route.id, vehicle_id=vehicle.id, **values)
+    db.session.add(trip)
+    db.session.flush()
+    return trip
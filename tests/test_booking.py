@@ -0,0 +1,647 @@
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from conftest import make_trip, staff_client
+from maua.extensions import db
+
+
+def test_passenger_profiles_page_through_every_passenger(app):
+    from maua.booking.models import Booking
+
+    trip = make_trip()
+    start = datetime(2026, 1, 1)
+    expected = defaultdict(lambda: [0, None])
+    for n in range(130):
+        name = f'Passenger {n % 37}'
+        # Same number in two formats must count as one passenger
+        phone = f'07{n % 37:08d}' if n % 2 else f'+2547{n % 37:08d}'
+        created = start + timedelta(minutes=n * 7 % 97)
+        db.session.add(Booking(trip_id=trip.id, seat_number=str(n), fare=500, reference=f'B{n}',
+                               passenger_name=name, passenger_phone=phone, created_at=created))
+        entry = expected[name]
+        entry[0] += 1
+        entry[1] = max(entry[1] or created, created)
+    db.session.commit()
+
+    seen, after = [], None
+    while True:
+        page = Booking.passenger_profiles(after=after, limit=10)
+        seen.extend(page)
+        if len(page) < 10:
+            break
+        after = (page[-1].last_booking_at, page[-1].name, page[-1].phone_key)
+
+    assert {row.name: [row.num_bookings, row.last_booking_at] for row in seen} == dict(expected)
+    assert len(seen) == 37
+    assert [r.last_booking_at for r in seen] == sorted((r.last_booking_at for r in seen), reverse=True)
+
+    by_phone = Booking.passenger_profiles(search='+254 700 000 005')
+    assert [(r.name, r.num_bookings) for r in by_phone] == [('Passenger 5', expected['Passenger 5'][0])]
+    assert {r.name for r in Booking.passenger_profiles(search='passenger 3')} == {
+        'Passenger 3', *(f'Passenger {n}' for n in range(30, 37))}
+
+
+def test_export_archives_completed_trips_with_their_bookings(app):
+    import csv
+    import os
+
+    from maua.auth.models import User
+    from maua.booking.models import Booking, BookingArchive, Ticket
+    from maua.catalog.archive import archive_trips, export_completed_trips
+    from maua.catalog.models import Trip, TripArchive
+    from maua.payment.models import Payment
+
+    done = make_trip()
+    done.status = 'completed'
+    upcoming = Trip(route_id=done.route_id, vehicle_id=done.vehicle_id, depart_at=datetime.utcnow(), base_fare=500)
+    user = User(username='pax', email='pax@example.com', phone='0700000000', password_hash='x')
+    db.session.add_all([upcoming, user])
+    db.session.flush()
+    bookings = [Booking(trip_id=trip.id, seat_number=str(n), fare=500, reference=f'B{trip.id}-{n}')
+                for trip in (done, upcoming) for n in range(3)]
+    db.session.add_all(bookings)
+    db.session.flush()
+    db.session.add_all([Ticket(booking_id=bookings[0].id, status='used'),
+                        Payment(amount=500, payment_method='mpesa', booking_id=bookings[0].id, user_id=user.id)])
+    db.session.commit()
+    done_id, upcoming_id, paid_id = done.id, upcoming.id, bookings[0].id
+
+    path, trip_ids = export_completed_trips('csv')
+    try:
+        with open(path, newline='') as f:
+            rows = list(csv.DictReader(f))
+    finally:
+        os.remove(path)
+    assert [int(r['trip_id']) for r in rows] == list(trip_ids) == [done_id]
+    assert rows[0]['route'] == 'NRB-MRU' and rows[0]['vehicle'] == 'KAA 001A'
+
+    assert archive_trips(trip_ids, batch_size=1) == (1, 3)
+    assert [t.id for t in Trip.query.all()] == [upcoming_id]
+    assert Booking.query.filter_by(trip_id=done_id).count() == 0
+    assert Ticket.query.count() == 0
+    assert Payment.query.one().booking_id is None
+
+    archived = db.session.get(TripArchive, done_id)
+    assert (archived.route_code, archived.origin_town, archived.vehicle_plate) == ('NRB-MRU', 'Nairobi', 'KAA 001A')
+    paid = db.session.get(BookingArchive, paid_id)
+    assert (paid.trip_id, paid.payment_id, paid.ticket_status) == (done_id, Payment.query.one().id, 'used')
+    assert BookingArchive.query.count() == 3
+
+
+def test_completed_trips_download_as_pdf_and_are_archived(app):
+    from maua.catalog.models import Trip, TripArchive
+
+    done = make_trip()
+    done.status = 'completed'
+    db.session.commit()
+    done_id = done.id
+    client = staff_client(app)
+
+    with app.app_context():
+        response = client.post('/staff/trips/completed/export_pdf', data={'format': 'pdf'})
+        body = response.get_data()
+    assert response.status_code == 200 and response.mimetype == 'application/pdf'
+    assert body.startswith(b'%PDF')
+    assert db.session.get(Trip, done_id) is None and db.session.get(TripArchive, done_id) is not None
+
+
+def _add_trips(route_id, count, start):
+    from maua.booking.models import Booking
+    from maua.catalog.models import Trip, Vehicle
+
+    layout = [{'seat': str(n), 'label': str(n)} for n in range(1, 15)]
+    for i in range(start, start + count):
+        vehicle = Vehicle(plate_no=f'KBB {i:03d}B', seat_layout=layout)
+        db.session.add(vehicle)
+        db.session.flush()
+        trip = Trip(route_id=route_id, vehicle_id=vehicle.id, status='scheduled',
+                    depart_at=datetime.utcnow() + timedelta(hours=2 + i), base_fare=500)
+        db.session.add(trip)
+        db.session.flush()
+        for seat, status in enumerate(['confirmed', 'checked_in', 'reserved', 'cancelled'], start=1):
+            db.session.add(Booking(trip_id=trip.id, seat_number=str(seat), fare=500,
+                                   reference=f'Q{trip.id}-{seat}', status=status))
+    db.session.commit()
+
+
+def _add_vehicle(plate):
+    from maua.catalog.models import Vehicle
+
+    vehicle = Vehicle(plate_no=plate)
+    db.session.add(vehicle)
+    db.session.flush()
+    return vehicle.id
+
+
+def _count_queries(app, client, url):
+    from sqlalchemy import event
+
+    statements = []
+    record = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        with app.app_context():  # fresh g, so the logged-in user is loaded every time
+            response = client.get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert response.status_code == 200
+    return len(statements), response
+
+
+def test_trip_occupancy_counts_seats_in_one_query(app):
+    from maua.booking.models import Booking
+    from maua.catalog.models import Trip
+
+    base = make_trip()
+    _add_trips(base.route_id, 3, start=1)
+    trips = Trip.query.filter(Trip.id != base.id).all()
+    # confirmed, checked_in and reserved hold seats; cancelled does not
+    assert {tuple(o) for o in Booking.occupancy(trips).values()} == {(14, 3, 1, 11)}
+    assert Booking.occupancy([base]) == {base.id: (0, 0, 0, 0)}
+    assert Booking.occupancy([]) == {}
+
+
+def test_staff_trip_pages_use_a_constant_number_of_queries(app):
+    route_id = make_trip().route_id
+    client = staff_client(app)
+    pages = ['/staff/bookings/quick', '/staff/trips', f'/staff/bookings/routes/{route_id}/trips', '/staff/']
+
+    _add_trips(route_id, 2, start=1)
+    for url in pages:
+        client.get(url)  # first visit seeds the dashboard counters
+    few = {url: _count_queries(app, client, url)[0] for url in pages}
+    _add_trips(route_id, 10, start=3)
+    many = {url: _count_queries(app, client, url) for url in pages}
+
+    assert {url: count for url, (count, _) in many.items()} == few
+    assert b'3/14' in many['/staff/bookings/quick'][1].data
+
+
+def test_mark_full_fills_free_seats_in_one_insert(app):
+    from maua.booking.models import Booking
+    from maua.booking.services import broker
+    from maua.catalog.models import Trip
+    from maua.stats.counters import count_from_table, snapshot
+
+    route_id = make_trip().route_id
+    _add_trips(route_id, 1, start=1)
+    trip = Trip.query.filter(Trip.vehicle.has(plate_no='KBB 001B')).one()
+    client = staff_client(app)
+    snapshot('bookings_total')
+    events = broker.subscribe(trip.id)
+    try:
+        with app.app_context():
+            inserts = []
+            record = lambda *args: inserts.append(args[2]) if args[2].startswith('INSERT INTO bookings') else None
+            from sqlalchemy import event
+            event.listen(db.engine, 'before_cursor_execute', record)
+            try:
+                response = client.post(f'/staff/trips/{trip.id}/mark-full')
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', record)
+        assert response.status_code == 302
+        assert len(inserts) == 1
+        published = [events.get_nowait() for _ in range(events.qsize())]
+    finally:
+        broker.unsubscribe(trip.id, events)
+
+    db.session.expire_all()
+    walk_ins = Booking.query.filter(Booking.trip_id == trip.id, Booking.reference.like('WI-%')).all()
+    # 14 seats, 3 held by bookings; the cancelled booking on seat 4 became a walk-in
+    assert sorted(int(b.seat_number) for b in walk_ins) == list(range(4, 15))
+    assert {b.status for b in walk_ins} == {'checked_in'}
+    assert Booking.occupancy([trip])[trip.id].free == 0
+    assert db.session.get(Trip, trip.id).is_full
+    assert len(published) == 1 and sorted(map(int, json.loads(published[0])['seats'])) == list(range(4, 15))
+    assert snapshot('bookings_total') == {'bookings_total': count_from_table('bookings_total')}
+
+
+def test_close_out_completes_departed_trips_in_bulk(app, monkeypatch):
+    from maua.booking.models import Booking
+    from maua.booking.services import broker
+    from maua.catalog import lifecycle
+    from maua.catalog.models import Trip
+    from maua.stats.counters import count_from_table, snapshot
+
+    now = datetime(2026, 5, 4, 18, 0)
+    base = make_trip()
+    base.depart_at = now + timedelta(hours=1)
+    _add_trips(base.route_id, 3, start=1)
+    trips = Trip.query.filter(Trip.id != base.id).order_by(Trip.id).all()
+    for trip, depart_at in zip(trips, [now.replace(hour=6), now - timedelta(minutes=5), now + timedelta(hours=2)]):
+        trip.depart_at = depart_at
+    db.session.commit()
+    departed_ids = {trips[0].id, trips[1].id}
+    snapshot('trips_active')
+
+    queued = []
+    monkeypatch.setattr(lifecycle, 'queue_status_messages', lambda ids, status: queued.append((ids, status)))
+    streams = {trip_id: broker.subscribe(trip_id) for trip_id in departed_ids}
+    try:
+        result = lifecycle.close_out_day(now)
+    finally:
+        for trip_id, q in streams.items():
+            broker.unsubscribe(trip_id, q)
+
+    db.session.expire_all()
+    assert result == {'trips': 2, 'bookings': 4, 'parcels': 0}
+    assert {t.id for t in Trip.query.filter_by(status='completed')} == departed_ids
+    # confirmed and checked-in bookings complete; reserved and cancelled are left alone
+    assert sorted(b.status for b in Booking.query.filter(Booking.trip_id.in_(departed_ids))) == [
+        'cancelled', 'cancelled', 'completed', 'completed', 'completed', 'completed', 'reserved', 'reserved']
+    assert len(queued) == 1 and len(queued[0][0]) == 4 and queued[0][1] == 'completed'
+    # The bulk UPDATE publishes its own seat events to open seat maps
+    for q in streams.values():
+        events = sorted((json.loads(q.get_nowait()) for _ in range(q.qsize())), key=lambda e: e['seat'])
+        assert events == [{'type': 'seat_completed', 'seat': seat, 'status': 'taken'} for seat in ('1', '2')]
+    assert snapshot('trips_active') == {'trips_active': count_from_table('trips_active')}
+    assert lifecycle.close_out_day(now) == {'trips': 0, 'bookings': 0, 'parcels': 0}
+
+
+def test_trip_status_messages_go_out_as_one_batch(app, monkeypatch):
+    from maua.auth.models import User
+    from maua.booking.models import Booking
+    from maua.notifications import sms
+    from maua.notifications.models import Notification
+    from maua.notifications.notification_service import NotificationService
+
+    base = make_trip()
+    _add_trips(base.route_id, 1, start=1)
+    customer = User(username='rider', email='rider@example.com', phone='0712000000', password_hash='x')
+    db.session.add(customer)
+    db.session.flush()
+    bookings = Booking.query.filter(Booking.trip_id != base.id, Booking.status != 'cancelled').all()
+    for booking in bookings:
+        booking.user_id = customer.id
+        booking.passenger_phone = f'07120000{booking.seat_number:0>2}'
+    db.session.commit()
+
+    sent = []
+    monkeypatch.setattr(sms, '_twilio_client_or_none', lambda: object())
+    monkeypatch.setattr(sms, '_send_twilio_async', lambda app, client, phone, *args: sent.append(phone))
+    result = NotificationService.notify_trip_status_bulk(bookings, 'cancelled')
+
+    assert result == {'notifications_sent': 3, 'sms_sent': 3}
+    assert len(set(sent)) == 3
+    assert Notification.query.filter_by(user_id=customer.id).count() == 3
+    assert Notification.get_unread_count_for_customer(customer.id) == 3
+
+
+def test_seat_changes_are_published_after_commit(app):
+    from maua.booking.models import Booking
+    from maua.booking.services import broker
+    from maua.catalog.models import Trip
+
+    _add_trips(make_trip().route_id, 1, start=1)
+    trip = Trip.query.filter(Trip.vehicle.has(plate_no='KBB 001B')).one()
+    client = staff_client(app)
+    events = broker.subscribe(trip.id)
+    drain = lambda: [json.loads(events.get_nowait()) for _ in range(events.qsize())]
+    try:
+        db.session.add(Booking(trip_id=trip.id, seat_number='9', fare=500, reference='LIVE-9', status='confirmed'))
+        db.session.flush()
+        assert drain() == []  # nothing before the commit
+        db.session.rollback()
+        assert drain() == []  # nor for a rolled-back booking
+
+        db.session.add(Booking(trip_id=trip.id, seat_number='9', fare=500, reference='LIVE-9', status='confirmed',
+                               passenger_name='Wanjiru'))
+        db.session.commit()
+        assert drain() == [{'type': 'seat_confirmed', 'seat': '9', 'status': 'taken'}]
+
+        with app.app_context():
+            response = client.post(f'/staff/trips/{trip.id}/seats/9/checkin', headers={'Accept': 'application/json'})
+        assert response.status_code == 200
+        assert response.get_json() == {'success': True, 'seat': '9', 'status': 'checked_in', 'passenger_name': 'Wanjiru'}
+        assert drain() == [{'type': 'seat_checked_in', 'seat': '9', 'status': 'taken'}]
+
+        with app.app_context():
+            response = client.post(f'/staff/trips/{trip.id}/seats/4/checkin', headers={'Accept': 'application/json'})
+        assert response.status_code == 404  # seat 4's booking is cancelled
+        assert drain() == []
+    finally:
+        broker.unsubscribe(trip.id, events)
+
+
+def test_timetable_generates_each_day_in_one_insert_and_is_idempotent(app):
+    from datetime import date
+    from sqlalchemy import event
+    from maua.catalog.models import Timetable, Trip
+    from maua.catalog.timetable import generate_trips
+    from maua.stats.counters import count_from_table, snapshot
+
+    base = make_trip()
+    db.session.commit()
+    start = date(2030, 1, 7)  # a Monday
+    db.session.add_all([
+        Timetable(route_id=base.route_id, vehicle_id=base.vehicle_id, departure_times=['06:00', '14:30'],
+                  days_of_week=[0, 1, 2, 3, 4], base_fare=600),
+        Timetable(route_id=base.route_id, vehicle_id=base.vehicle_id, departure_times=['09:00'],
+                  days_of_week=[5, 6], base_fare=700, active=False),
+        # Keyed in by hand already: Tuesday 06:00 must not be duplicated
+        Trip(route_id=base.route_id, vehicle_id=base.vehicle_id, depart_at=datetime(2030, 1, 8, 6, 0), base_fare=600),
+    ])
+    db.session.commit()
+    snapshot('trips_active')
+
+    inserts = []
+    record = lambda *args: inserts.append(args[2]) if args[2].startswith('INSERT INTO trips') else None
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        first = generate_trips(days=7, start=start)
+        second = generate_trips(days=7, start=start)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+    assert first == {'days': 7, 'trips': 9, 'conflicts': 0}  # 5 weekdays x 2 departures, less the manual one
+    assert second == {'days': 7, 'trips': 0, 'conflicts': 0}
+    assert len(inserts) == 5  # one per weekday on the first run; the rerun finds nothing to insert
+    generated = Trip.query.filter(Trip.timetable_id.isnot(None)).order_by(Trip.depart_at).all()
+    assert generated[0].depart_at == datetime(2030, 1, 7, 6, 0)
+    assert {t.depart_at.weekday() for t in generated} == {0, 1, 2, 3, 4}
+    assert Trip.query.filter(Trip.depart_at == datetime(2030, 1, 8, 6, 0)).count() == 1
+    assert snapshot('trips_active') == {'trips_active': count_from_table('trips_active')}
+
+
+def test_double_allocation_is_rejected_and_reported(app):
+    from datetime import date
+    from maua.catalog.allocation import AllocationIndex, find_conflicts
+    from maua.catalog.models import Timetable, Trip
+    from maua.catalog.timetable import generate_trips
+
+    base = make_trip()
+    base.route.estimated_duration = timedelta(hours=3)
+    base.depart_at = datetime(2030, 1, 7, 8, 0)
+    base.driver_phone = '0722000111'
+    db.session.commit()
+    client = staff_client(app)
+    form = dict(route_id=base.route_id, vehicle_id=base.vehicle_id, base_fare='500')
+
+    with app.app_context():
+        # 10:00 overlaps 08:00-11:00 on the same vehicle; 11:00 starts as it arrives
+        refused = client.post('/staff/trips/create', data=dict(form, depart_at='2030-01-07T10:00'))
+        created = client.post('/staff/trips/create', data=dict(form, depart_at='2030-01-07T11:00'))
+    assert refused.status_code == 200 and f'trip #{base.id}' in refused.get_data(as_text=True)
+    assert created.status_code == 302
+    later = Trip.query.filter(Trip.depart_at == datetime(2030, 1, 7, 11, 0)).one()
+    assert later.arrive_eta == datetime(2030, 1, 7, 14, 0)
+
+    # Same driver (by phone, however it is written) on another vehicle clashes too
+    other_vehicle = _add_vehicle('KCC 100C')
+    db.session.add(Timetable(route_id=base.route_id, vehicle_id=other_vehicle, departure_times=['09:00', '15:00'],
+                             days_of_week=[0], base_fare=500, driver_phone='+254 722 000111'))
+    db.session.commit()
+    assert generate_trips(days=1, start=date(2030, 1, 7)) == {'days': 1, 'trips': 1, 'conflicts': 1}
+
+    # Legacy overlap slipped in before the checks existed
+    db.session.add(Trip(route_id=base.route_id, vehicle_id=base.vehicle_id, depart_at=datetime(2030, 1, 7, 12, 0), base_fare=500))
+    db.session.commit()
+    conflicts = find_conflicts(start=datetime(2030, 1, 7), days=1)
+    assert [(c.resource[0], c.trip_id) for c in conflicts] == [('vehicle', later.id)]
+
+    index = AllocationIndex()
+    for trip_id, (start, end) in enumerate([(1, 9), (2, 3), (4, 5), (10, 12)]):
+        index.add(trip_id, 1, None, None, start, end)
+    assert sorted(c.other_trip_id for c in index.conflicts(1, None, None, 4, 6)) == [0, 2]
+    assert index.conflicts(1, None, None, 9, 10) == []
+
+
+def test_every_allocation_path_checks_under_the_allocation_lock(app, monkeypatch):
+    from datetime import date
+    from maua.catalog import allocation, lifecycle, timetable
+    from maua.catalog.models import Timetable, Trip
+
+    locks = []
+    for module in (allocation, lifecycle, timetable):
+        monkeypatch.setattr(module, 'lock_allocations', lambda: locks.append('lock'), raising=False)
+    monkeypatch.setattr('maua.staff.routes.lock_allocations', lambda: locks.append('lock'))
+    monkeypatch.setattr(lifecycle, 'queue_status_messages', lambda ids, status: None)
+
+    base = make_trip()
+    base.route.estimated_duration = timedelta(hours=3)
+    base.depart_at = datetime(2030, 1, 7, 8, 0)
+    base.driver_name = 'Kamau'
+    db.session.commit()
+    client = staff_client(app)
+    other_vehicle = _add_vehicle('KCC 100C')
+
+    # Same driver on a different vehicle is refused at the desk
+    form = dict(route_id=base.route_id, vehicle_id=other_vehicle, base_fare='500', driver_name=' kamau ')
+    with app.app_context():
+        refused = client.post('/staff/trips/create', data=dict(form, depart_at='2030-01-07T09:00'))
+    assert 'driver on trip #' in refused.get_data(as_text=True) and locks == ['lock']
+
+    # Cancel the trip, take its slot with another one, then try to reopen it
+    with app.app_context():
+        client.post(f'/staff/trips/{base.id}/status', data={'status': 'cancelled'})
+        client.post('/staff/trips/create', data=dict(form, depart_at='2030-01-07T09:00'))
+        reopened = client.post(f'/staff/trips/{base.id}/status', data={'status': 'scheduled'},
+                               follow_redirects=True)
+    db.session.expire_all()
+    assert 'Not reopened: overlaps driver on trip #' in reopened.get_data(as_text=True)
+    assert db.session.get(Trip, base.id).status == 'cancelled'
+    assert len(locks) == 3  # create, create, reopen (cancelling takes no allocation)
+
+    db.session.add(Timetable(route_id=base.route_id, vehicle_id=base.vehicle_id, departure_times=['10:00'],
+                             days_of_week=[0], base_fare=500, driver_name='Kamau'))
+    db.session.commit()
+    assert timetable.generate_trips(days=1, start=date(2030, 1, 7))['conflicts'] == 1
+    assert len(locks) == 4
+
+
+def test_keyset_pages_walk_every_trip_once_in_both_directions(app):
+    from maua.catalog.models import Trip
+    from maua.staff.pagination import keyset_page
+
+    base = make_trip()
+    start = datetime(2030, 1, 1, 6, 0)
+    # Three departures share each time slot, so the id tie-break matters
+    db.session.add_all([Trip(route_id=base.route_id, vehicle_id=base.vehicle_id, status='scheduled',
+                             depart_at=start + timedelta(hours=i // 3), base_fare=500) for i in range(120)])
+    db.session.commit()
+    query = Trip.query.filter(Trip.depart_at >= start)
+    expected = [t.id for t in query.order_by(Trip.depart_at.desc(), Trip.id.desc())]
+
+    pages, cursor = [], None
+    while True:
+        page = keyset_page(query, Trip.depart_at, Trip.id, after=cursor, page_size=50)
+        pages.append([t.id for t in page.items])
+        cursor = page.older
+        if not cursor:
+            break
+    assert [len(p) for p in pages] == [50, 50, 20]
+    assert sum(pages, []) == expected
+
+    back = keyset_page(query, Trip.depart_at, Trip.id, before=page.newer, page_size=50)
+    assert [t.id for t in back.items] == pages[1]
+    first = keyset_page(query, Trip.depart_at, Trip.id, before=back.newer, page_size=50)
+    assert [t.id for t in first.items] == pages[0] and first.newer is None
+
+    client = staff_client(app)
+    with app.app_context():
+        response = client.get(f'/staff/trips?route_id={base.route_id}&after={back.older}')
+    html = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert 'Newer' in html and 'Older' not in html
+
+
+def test_counter_search_finds_bookings_and_parcels_by_any_part(app):
+    from maua.booking.models import Booking
+    from maua.parcels.models import Parcel
+    from maua.staff.search import BOOKING_SEARCH, filter_matching, search
+
+    trip = make_trip()
+    wanjiru = Booking(trip_id=trip.id, seat_number='1', fare=500, reference='MS-AB12CD', status='confirmed',
+                      passenger_name='Wanjiru Kamau', passenger_phone='0712 345 678', passenger_id_number='29876543')
+    otieno = Booking(trip_id=trip.id, seat_number='2', fare=500, reference='MS-ZX98QW', status='confirmed',
+                     passenger_name='Kamau Otieno', passenger_phone='+254722111222', passenger_id_number='31234567')
+    parcel = Parcel(ref_code='PWNJ001', sender_name='Achieng Wanjiru', sender_phone='0733000111', receiver_name='Baraka',
+                    receiver_phone='0744000222', origin_name='Nairobi', destination_name='Meru', price=200)
+    njeri = Booking(trip_id=trip.id, seat_number='40', fare=500, reference='MS-NJ77RT', status='confirmed',
+                    passenger_name='Njeri', passenger_phone='0799000111')
+    db.session.add_all([wanjiru, otieno, njeri, parcel])
+    db.session.commit()
+
+    found = lambda term: ([b.reference for b in search(term)['bookings']], [p.ref_code for p in search(term)['parcels']])
+    assert found('wanj') == (['MS-AB12CD'], ['PWNJ001'])
+    assert found('0712 345') == (['MS-AB12CD'], [])  # typed with the leading 0
+    assert found('254722111') == (['MS-ZX98QW'], [])
+    assert found('kamau otieno') == (['MS-ZX98QW'], [])
+    assert found('9876') == (['MS-AB12CD'], [])  # ID number
+    assert found('zx98') == (['MS-ZX98QW'], [])
+    assert sorted(found('kamau')[0]) == ['MS-AB12CD', 'MS-ZX98QW']
+    assert found('nobody') == ([], [])
+
+    otieno.passenger_name = 'Otieno Mwangi'
+    db.session.commit()
+    assert found('kamau') == (['MS-AB12CD'], [])
+    assert filter_matching(Booking.query, BOOKING_SEARCH, 'mwangi').one().id == otieno.id
+
+    client = staff_client(app)
+    with app.app_context():
+        response = client.get('/staff/search?q=wanjiru', headers={'Accept': 'application/json'})
+        listed = client.get(f'/staff/bookings?trip_id={trip.id}&q=otieno')
+        by_seat = client.get(f'/staff/bookings?trip_id={trip.id}&q=40').get_data(as_text=True)
+    data = response.get_json()
+    assert [b['reference'] for b in data['bookings']] == ['MS-AB12CD']
+    assert [p['ref_code'] for p in data['parcels']] == ['PWNJ001']
+    assert 'MS-ZX98QW' in listed.get_data(as_text=True) and 'MS-AB12CD' not in listed.get_data(as_text=True)
+    # The trip's booking list still finds a passenger by seat number
+    assert 'MS-NJ77RT' in by_seat and 'MS-AB12CD' not in by_seat and 'MS-ZX98QW' not in by_seat
+
+
+def test_accounting_exports_stream_filtered_rows(app):
+    import csv
+    import gzip
+    import io
+    from maua.auth.models import User
+    from maua.booking.models import Booking
+    from maua.catalog.models import Route, Trip
+    from maua.payment.models import Payment
+
+    base = make_trip()
+    _add_trips(base.route_id, 1, start=1)
+    other_route = Route(code='NRB-EMB', origin_depot_id=base.route.origin_depot_id,
+                        destination_depot_id=base.route.destination_depot_id)
+    db.session.add(other_route)
+    db.session.flush()
+    elsewhere = Trip(route_id=other_route.id, vehicle_id=base.vehicle_id, depart_at=datetime(2030, 1, 1), base_fare=900)
+    db.session.add(elsewhere)
+    db.session.flush()
+    db.session.add(Booking(trip_id=elsewhere.id, seat_number='1', fare=900, reference='EMB-1', status='confirmed'))
+    payer = User(username='payer', email='payer@example.com', phone='0713000000', password_hash='x')
+    db.session.add(payer)
+    db.session.flush()
+    for booking in Booking.query.filter(Booking.status == 'confirmed'):
+        db.session.add(Payment(amount=booking.fare, payment_method='mpesa', status='completed', booking_id=booking.id,
+                               user_id=payer.id, transaction_id=f'TX-{booking.reference}'))
+    Booking.query.filter_by(reference='Q2-2').one().created_at = datetime(2025, 12, 31, 23, 0)
+    db.session.commit()
+    client = staff_client(app)
+
+    with app.app_context():
+        response = client.get(f'/staff/exports/bookings?route_id={base.route_id}&from=2026-01-01')
+        assert response.is_streamed
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        assert sorted(r['reference'] for r in rows) == ['Q2-1', 'Q2-3', 'Q2-4']  # Q2-2 is before `from`
+        assert {r['route_code'] for r in rows} == {'NRB-MRU'}
+
+        response = client.get('/staff/exports/payments?format=jsonl&gzip=1&status=completed')
+        assert response.headers['Content-Type'] == 'application/gzip'
+        lines = gzip.decompress(response.get_data()).decode().splitlines()
+        payments = sorted((json.loads(line) for line in lines), key=lambda p: p['booking_reference'])
+        assert [(p['booking_reference'], p['route_code'], p['amount']) for p in payments] == [
+            ('EMB-1', 'NRB-EMB', '900.00'), ('Q2-1', 'NRB-MRU', '500.00')]
+
+        assert client.get('/staff/exports/users').status_code == 404
+        assert client.get('/staff/exports/parcels?to=yesterday').status_code == 400
+        assert client.get('/staff/exports/parcels?format=jsonl').get_data() == b''
+
+
+def test_exports_read_from_a_server_side_cursor(app, monkeypatch):
+    from maua.staff import exports
+
+    _add_trips(make_trip().route_id, 3, start=1)
+    chunks = list(exports.iter_export('bookings', chunk_size=5))
+    # header + 12 rows in partitions of 5 -> three chunks, each written as it is fetched
+    assert len(chunks) == 3
+    assert b''.join(chunks).decode().count('\n') == 13
+
+    captured = []
+    execute = db.session.execute
+    monkeypatch.setattr(db.session, 'execute', lambda statement, *a, **kw: captured.append(statement) or execute(statement, *a, **kw))
+    list(exports.iter_export('parcels'))
+    assert captured[0].get_execution_options()['stream_results'] is True
+
+
+def test_event_streams_share_a_cap_send_keepalives_and_expire(app):
+    from maua.booking.services import broker
+    from maua.streams import slots
+
+    trip = make_trip()
+    db.session.commit()
+    client = staff_client(app)
+
+    # Streams are opt-in; while off, pages rely on polling and no thread is held
+    assert client.get(f'/booking/stream/{trip.id}').status_code == 503
+    assert client.get('/notifications/stream/staff').status_code == 503
+    assert slots.open == 0
+    with app.app_context():
+        page = client.get(f'/staff/trips/{trip.id}/seats').get_data(as_text=True)
+    assert 'if (false && window.EventSource)' in page and 'setInterval(resyncSeats, 10000)' in page
+
+    app.config.update(EVENT_STREAMS_ENABLED=True, EVENT_STREAM_MAX_SUBSCRIBERS=1,
+                      EVENT_STREAM_KEEPALIVE=0.05, EVENT_STREAM_LIFETIME=0.3)
+
+    seats = client.get(f'/booking/stream/{trip.id}', buffered=False)
+    assert seats.status_code == 200 and slots.open == 1
+    # One slot per process, whichever kind of stream holds it
+    assert client.get('/notifications/stream/staff').status_code == 503
+    seats.close()
+    assert slots.open == 0 and not broker._trip_to_queues
+
+    bell = client.get('/notifications/stream/staff', buffered=False)
+    assert bell.status_code == 200
+    body = bell.get_data(as_text=True)  # ends on its own once the lifetime is over
+    assert body.startswith('retry: 5000\n: connected\n\n') and ': keepalive\n\n' in body
+    bell.close()
+    assert slots.open == 0
+
+
+def test_seat_maps_resync_from_seats_json(app):
+    from maua.booking.models import Booking
+
+    trip = make_trip()
+    for seat, status in (('1', 'confirmed'), ('2', 'checked_in'), ('3', 'cancelled'), ('4', 'pending_payment')):
+        db.session.add(Booking(trip_id=trip.id, seat_number=seat, passenger_name=f'Passenger {seat}',
+                               passenger_phone='0722000001', reference=f'S{seat}', status=status, fare=500))
+    db.session.commit()
+    client = staff_client(app)
+
+    assert client.get(f'/booking/trips/{trip.id}/seats.json').get_json() == {'trip_id': trip.id, 'taken': ['1', '2', '4']}
+    assert client.get(f'/staff/trips/{trip.id}/seats.json').get_json()['seats'] == {
+        '1': {'state': 'booked', 'passenger_name': 'Passenger 1'},
+        '2': {'state': 'checked_in', 'passenger_name': 'Passenger 2'},
+        '4': {'state': 'booked', 'passenger_name': 'Passenger 4'},
+    }
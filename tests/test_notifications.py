@@ -0,0 +1,261 @@
+import json
+
+import pytest
+
+from conftest import make_trip, staff_client
+from maua.extensions import db
+
+
+def _customer(username='amina', phone='0722000001'):
+    from maua.auth.models import User
+
+    user = User(username=username, email=f'{username}@example.com', phone=phone, password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    return user
+
+
+def _stored(key):
+    from maua.notifications.models import NotificationCounter
+
+    return NotificationCounter._read(key)
+
+
+def test_unread_counters_are_written_through(app):
+    from maua.notifications.models import Notification, NotificationCounter
+
+    user = _customer()
+    key = NotificationCounter.key_for('customer', user.id)
+
+    # Reads never seed: no row, and nothing left behind for the next poll
+    assert Notification.get_unread_count_for_customer(user.id) == 0
+    assert _stored(key) is None
+
+    first = Notification.create_for_customer(user.id, 'booking', 'Booked', 'Seat 4')
+    Notification.create_for_customer(user.id, 'payment', 'Paid', 'KES 1,200')
+    Notification.create_for_staff('booking', 'New booking', 'Seat 4')
+    db.session.commit()
+    assert _stored(key) == 2 and _stored('staff') == 1
+
+    first.mark_as_read()
+    first.mark_as_read()  # already read: no second decrement
+    db.session.commit()
+    assert Notification.get_unread_count_for_customer(user.id) == 1
+
+    Notification.mark_all_read_for_customer(user.id)
+    Notification.mark_all_read_for_staff()
+    db.session.commit()
+    assert _stored(key) == 0 and _stored('staff') == 0
+
+    Notification.create_for_customers([
+        {'user_id': user.id, 'notification_type': 'trip', 'title': 'Boarding', 'message': 'Gate 2'},
+        {'user_id': user.id, 'notification_type': 'trip', 'title': 'Delayed', 'message': '20 min'},
+    ])
+    db.session.commit()
+    assert Notification.get_unread_count_for_customer(user.id) == 2
+
+    Notification.clear_for_customer(user.id)
+    Notification.clear_for_staff()
+    db.session.commit()
+    assert _stored(key) == 0 and Notification.get_unread_count_for_staff() == 0
+    assert Notification.query.count() == 0
+
+
+def test_a_lost_seeding_race_keeps_the_transaction(app, monkeypatch):
+    from maua.notifications.models import Notification, NotificationCounter
+
+    user = _customer()
+    key = NotificationCounter.key_for('customer', user.id)
+    db.session.add(NotificationCounter(key=key, unread_count=0))
+    db.session.commit()
+
+    # Another worker creates the row between our UPDATE (no match) and INSERT
+    real_update = NotificationCounter._update
+    calls = []
+
+    def racing_update(key, value):
+        calls.append(key)
+        return 0 if len(calls) == 1 else real_update(key, value)
+
+    monkeypatch.setattr(NotificationCounter, '_update', racing_update)
+    notification = Notification.create_for_customer(user.id, 'booking', 'Booked', 'Seat 9')
+    db.session.commit()
+
+    # The duplicate INSERT only rolled back its savepoint; the notification was kept
+    assert db.session.get(Notification, notification.id) is not None
+    # The other worker's count could not see our notification, so it was added on top
+    assert _stored(key) == 1
+
+
+def test_delta_returns_only_notifications_after_the_cursor(app):
+    from maua.notifications.models import Notification
+
+    client = staff_client(app)
+    Notification.create_for_staff('booking', 'New booking', 'Seat 1')
+    db.session.commit()
+    listing = client.get('/notifications/api/staff/list').get_json()
+    cursor = listing['cursor']
+    assert len(listing['notifications']) == 1 and listing['unread_count'] == 1
+
+    Notification.create_for_staff('parcel', 'New parcel', 'MSX-1')
+    Notification.create_for_staff('booking', 'New booking', 'Seat 2')
+    db.session.commit()
+    delta = client.get(f'/notifications/api/staff/delta?cursor={cursor}').get_json()
+    assert [n['title'] for n in delta['notifications']] == ['New parcel', 'New booking']
+    assert delta['cursor'] > cursor and delta['unread_count'] == 3
+
+    # Nothing new: empty delta, cursor unchanged
+    again = client.get(f"/notifications/api/staff/delta?cursor={delta['cursor']}").get_json()
+    assert again['notifications'] == [] and again['cursor'] == delta['cursor']
+
+
+def test_notifications_are_pushed_only_after_commit(app):
+    from maua.notifications.broker import broker
+    from maua.notifications.models import Notification
+
+    q = broker.subscribe('staff')
+    try:
+        Notification.create_for_staff('booking', 'Rolled back', 'Seat 3')
+        db.session.flush()
+        assert q.empty()
+        db.session.rollback()
+        assert q.empty()
+
+        with db.session.begin_nested():
+            Notification.create_for_staff('booking', 'Kept', 'Seat 4')
+        assert q.empty()  # releasing a savepoint is not the commit
+        db.session.commit()
+        event = json.loads(q.get_nowait())
+        assert event['type'] == 'notification' and event['notification']['title'] == 'Kept'
+        assert q.empty()
+    finally:
+        broker.unsubscribe('staff', q)
+
+
+def test_archive_batches_move_expired_rows_and_fix_unread_counters(app):
+    from datetime import datetime, timedelta
+    from maua.notifications.models import Notification, NotificationArchive, NotificationCounter
+    from maua.notifications.retention import archive_expired
+
+    user = _customer()
+    now = datetime.utcnow()
+    ages = {'old read': (40, True), 'ancient unread': (100, False), 'old unread': (40, False),
+            'new read': (5, True), 'ancient staff': (120, False)}
+    for title, (days, is_read) in ages.items():
+        if title.endswith('staff'):
+            n = Notification.create_for_staff('booking', title, 'x')
+        else:
+            n = Notification.create_for_customer(user.id, 'booking', title, 'x')
+        n.created_at = now - timedelta(days=days)
+        if is_read:
+            n.mark_as_read()
+    db.session.commit()
+    assert Notification.get_unread_count_for_customer(user.id) == 2
+    assert Notification.get_unread_count_for_staff() == 1
+
+    # Read rows over 30 days and anything over 90 days go, two rows per batch
+    assert archive_expired(read_days=30, unread_days=90, batch_size=2) == 3
+    db.session.expire_all()
+    assert sorted(n.title for n in Notification.query) == ['new read', 'old unread']
+    assert sorted(a.title for a in NotificationArchive.query) == ['ancient staff', 'ancient unread', 'old read']
+
+    # Archived unread rows came off the materialized counters
+    assert NotificationCounter._read(NotificationCounter.key_for('customer', user.id)) == 1
+    assert NotificationCounter._read('staff') == 0
+    assert archive_expired(read_days=30, unread_days=90, batch_size=2) == 0
+
+
+def test_reminders_reach_bookings_confirmed_long_after_creation(app, monkeypatch):
+    from datetime import datetime, timedelta
+    from maua.booking.models import Booking
+    from maua.notifications.notification_service import NotificationService
+    from maua.notifications.reminders import dispatch_reminders
+
+    sent = []
+    monkeypatch.setattr(NotificationService, 'notify_trip_reminder', classmethod(lambda cls, b: sent.append(b.id)))
+
+    now = datetime.utcnow()
+    trip = make_trip(depart_at=now + timedelta(hours=6))
+    early, late = (
+        Booking(trip_id=trip.id, seat_number=str(seat), passenger_name=f'P{seat}', passenger_phone='0722000001',
+                reference=f'R{seat}', status=status, fare=500, created_at=now - timedelta(hours=5))
+        for seat, status in ((1, 'confirmed'), (2, 'pending_payment'))
+    )
+    db.session.add_all([early, late])
+    db.session.commit()
+
+    assert dispatch_reminders(now=now - timedelta(hours=4)) == {'buckets': 1, 'sent': 1}
+    assert sent == [early.id]
+
+    # Confirmed four hours after it was created, after the trip was already scanned
+    late.status = 'confirmed'
+    db.session.commit()
+    assert dispatch_reminders(now=now - timedelta(hours=1))['sent'] == 1
+    assert dispatch_reminders(now=now)['sent'] == 0
+    assert sent == [early.id, late.id]
+
+
+@pytest.fixture
+def coalescer(app, monkeypatch):
+    from maua.notifications.coalesce import SmsCoalescer
+
+    monkeypatch.setattr(SmsCoalescer, '_sent', {})
+    monkeypatch.setattr(SmsCoalescer, '_pending', {})
+    app.config.update(SMS_DEDUP_WINDOW=300, SMS_COALESCE_WINDOW=0.05, SMS_COALESCE_MAX_CHARS=459)
+    return SmsCoalescer
+
+
+def test_sms_dedup_and_coalescing(app, coalescer):
+    import threading
+
+    delivered = []
+    done = threading.Event()
+
+    def deliver(phone, message, user_email):
+        delivered.append((phone, message, user_email))
+        done.set()
+
+    phone = '254722000001'
+    assert coalescer.submit(app, phone, 'Trip KAA 001A at 08:00', deliver, template='trip', entity='T1')
+    # Same text under the same key within the window is suppressed
+    assert not coalescer.submit(app, phone, 'Trip KAA 001A at 08:00', deliver, template='trip', entity='T1')
+    # Edited text under the same key supersedes the buffered one
+    assert coalescer.submit(app, phone, 'Trip KAB 002B at 08:00', deliver, template='trip', entity='T1')
+    assert coalescer.submit(app, phone, 'Loyalty: 3 trips to go', deliver, user_email='a@example.com')
+    assert delivered == []
+
+    # Flushed by the timer as one message
+    assert done.wait(2)
+    assert delivered == [(phone, 'Trip KAB 002B at 08:00\n\nLoyalty: 3 trips to go', 'a@example.com')]
+    assert coalescer._pending == {}
+
+
+def test_send_sms_reports_suppressed_duplicates(app, coalescer, monkeypatch):
+    from maua.notifications import sms
+
+    delivered = []
+    monkeypatch.setattr(sms, '_deliver_sms', lambda phone, message, user_email=None: delivered.append(message))
+
+    assert sms.send_sms('0722000001', 'Booking Q1 confirmed', template='booking_confirmed', entity='Q1')
+    assert not sms.send_sms('+254722000001', 'Booking Q1 confirmed', template='booking_confirmed', entity='Q1')
+    coalescer.flush_all()
+    assert delivered == ['Booking Q1 confirmed']
+
+
+def test_buffered_sms_are_sent_when_a_worker_exits(app, coalescer):
+    import os
+    import runpy
+
+    delivered = []
+    app.config['SMS_COALESCE_WINDOW'] = 60
+    assert coalescer.submit(app, '254722000001', 'Parcel MSX-1 arrived', lambda *args: delivered.append(args))
+    assert delivered == []
+
+    hooks = runpy.run_path(os.path.join(os.path.dirname(__file__), '..', 'gunicorn.conf.py'))
+    hooks['worker_exit'](None, None)
+    assert delivered == [('254722000001', 'Parcel MSX-1 arrived', None)]
+    assert coalescer._pending == {}
+
+    # The atexit flush that runs later finds nothing left to send
+    coalescer.flush_all()
+    assert len(delivered) == 1
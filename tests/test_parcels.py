@@ -0,0 +1,352 @@
+import threading
+
+import pytest
+
+from config import TestingConfig
+from conftest import staff_client
+from maua.extensions import db
+from maua.parcels import pricing
+from maua.parcels.refcodes import ALPHABET, CODE_LENGTH, RefCodeAllocator, encode
+
+
+@pytest.fixture
+def app_config(tmp_path):
+    class FileDBConfig(TestingConfig):
+        # A file database so worker threads each get their own connection
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'test.db'}"
+        SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': 30}}
+        PARCEL_REF_BLOCK_SIZE = 7
+
+    return FileDBConfig
+
+
+def _parcel(ref_code, **fields):
+    from maua.parcels.models import Parcel
+
+    values = dict(sender_name='A', sender_phone='0711000000', receiver_name='B', receiver_phone='0722000000',
+                  origin_name='Nairobi', destination_name='Meru', price=200, status='pending')
+    values.update(fields)
+    return Parcel(ref_code=ref_code, **values)
+
+
+def test_encode_is_short_and_unique():
+    codes = [encode(n) for n in range(1, 20001)]
+    assert len(set(codes)) == len(codes)
+    assert all(len(c) == CODE_LENGTH and set(c) <= set(ALPHABET) for c in codes)
+
+
+def test_concurrent_workers_never_issue_duplicate_refs(app):
+    workers = [RefCodeAllocator('parcel', 'P') for _ in range(4)]  # one per simulated process
+    per_thread = 250
+    issued = []
+    errors = []
+    lock = threading.Lock()
+
+    def issue(allocator):
+        try:
+            with app.app_context():
+                codes = [allocator.next_code() for _ in range(per_thread)]
+            with lock:
+                issued.extend(codes)
+        except Exception as exc:  # surfaced below; a thread exception would be swallowed
+            errors.append(exc)
+
+    threads = [threading.Thread(target=issue, args=(workers[i % len(workers)],)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    assert len(issued) == 8 * per_thread
+    assert len(set(issued)) == len(issued)
+    assert all(code.startswith('P') and len(code) == 1 + CODE_LENGTH for code in issued)
+
+
+def test_tariff_bands_and_invalidation_on_route_edit(app):
+    from maua.catalog.models import Depot, Route
+
+    nairobi = Depot(name='CBD', town='Nairobi')
+    meru = Depot(name='Town Center', town='Meru')
+    db.session.add_all([nairobi, meru])
+    db.session.flush()
+    route = Route(code='NRB-MRU', origin_depot_id=nairobi.id, destination_depot_id=meru.id, distance_km=200)
+    db.session.add(route)
+    db.session.commit()
+
+    # base 100 + 0.5/km * 200km * multiplier, rounded up to 10
+    assert pricing.quote('Nairobi', 'Meru', 1) == 200
+    assert pricing.quote('nairobi - cbd', 'TOWN CENTER', 2) == 200
+    assert pricing.quote('Nairobi', 'Meru', 2.1) == 250
+    assert pricing.quote('Nairobi', 'Meru', 60) == 550 + 10 * 20
+    assert pricing.quote('Meru', 'Nairobi', 1) is None
+
+    route.distance_km = 300
+    db.session.commit()
+    assert pricing.quote('Nairobi', 'Meru', 1) == 250
+
+
+def test_status_page_revalidates_and_rate_limits(app):
+    from maua.parcels.models import ParcelEvent
+    from maua.parcels.tracking import public_lookups
+
+    app.config.update(PUBLIC_TRACKING_RATE_LIMIT=True, PUBLIC_TRACKING_BURST=3, PUBLIC_TRACKING_RATE=0.01)
+    public_lookups.reset()
+    parcel = _parcel('PTEST01')
+    db.session.add(parcel)
+    ParcelEvent.record(parcel, 'created')
+    db.session.commit()
+    client = app.test_client()
+
+    first = client.get('/parcels/status/PTEST01')
+    assert first.status_code == 200 and first.headers['ETag']
+    assert client.get('/parcels/status/PTEST01', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    parcel.status = 'in_transit'
+    ParcelEvent.record(parcel, 'status_changed', {'to': 'in_transit'})
+    db.session.commit()
+    changed = client.get('/parcels/status/PTEST01', headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200 and b'In Transit' in changed.data
+
+    limited = client.get('/parcels/status/PNOPE99')
+    assert limited.status_code == 429 and limited.headers['Retry-After']
+    public_lookups.reset()
+
+
+def test_phones_are_normalized_on_write_and_found_in_any_format(app):
+    from maua.booking.models import Booking
+    from maua.parcels.models import Parcel
+
+    sent = _parcel('PPHONE1', sender_phone='0712 345-678', receiver_phone='254733000111')
+    received = _parcel('PPHONE2', sender_phone='+254700000001', receiver_phone=' +254712345678 ')
+    other = _parcel('PPHONE3', sender_phone='0799999999', receiver_phone='0788888888')
+    db.session.add_all([sent, received, other])
+    db.session.commit()
+    assert (sent.sender_phone_normalized, sent.receiver_phone_normalized) == ('+254712345678', '+254733000111')
+    assert received.receiver_phone_normalized == '+254712345678'
+
+    for typed in ('0712345678', '+254712345678', '254712345678', '0712 345 678'):
+        assert {p.ref_code for p in Parcel.find_by_phone(typed)} == {'PPHONE1', 'PPHONE2'}
+    assert Parcel.find_by_phone('') == []
+
+    # Edits re-normalize; a booking's placeholder phone has no normalized form
+    sent.sender_phone = '0799999999'
+    db.session.commit()
+    assert {p.ref_code for p in Parcel.find_by_phone('254799999999')} == {'PPHONE1', 'PPHONE3'}
+    booking = Booking(passenger_phone='0712345678')
+    assert booking.passenger_phone_normalized == '+254712345678'
+    booking.passenger_phone = 'N/A'
+    assert booking.passenger_phone_normalized is None
+
+
+def test_parcel_events_cannot_be_updated_or_deleted(app):
+    from maua.parcels.models import ParcelEvent
+
+    parcel = _parcel('PEVENT1')
+    db.session.add(parcel)
+    event = ParcelEvent.record(parcel, 'created')
+    db.session.commit()
+
+    event.status = 'delivered'
+    with pytest.raises(ValueError, match='append-only'):
+        db.session.commit()
+    db.session.rollback()
+
+    db.session.delete(event)
+    with pytest.raises(ValueError, match='append-only'):
+        db.session.commit()
+    db.session.rollback()
+
+    assert [(e.event_type, e.status) for e in ParcelEvent.timeline(parcel.id)] == [('created', 'pending')]
+
+
+def test_photo_uploads_must_really_be_images(app, tmp_path, monkeypatch):
+    import io
+    import os
+    from PIL import Image
+    from werkzeug.datastructures import FileStorage
+    from maua.parcels import photos
+
+    directory = tmp_path / 'photos'
+    queued = []
+    monkeypatch.setattr(photos, 'photo_dir', lambda: str(directory))
+    monkeypatch.setattr(photos, 'schedule_variants', queued.append)
+
+    def upload(name, data):
+        return photos.store_upload(FileStorage(stream=io.BytesIO(data), filename=name))
+
+    png = io.BytesIO()
+    Image.new('RGB', (1600, 900), 'orange').save(png, 'PNG')
+
+    # Named .jpg but really a PNG: stored under the detected format
+    stored = upload('parcel.JPG', png.getvalue())
+    assert stored.endswith('.png') and queued == [str(directory / stored)]
+    assert upload('again.png', png.getvalue()) == stored  # same content, same file
+
+    assert upload('invoice.jpg', b'%PDF-1.4 not an image') is None
+    assert upload('truncated.png', png.getvalue()[:200]) is None
+    assert upload('notes.txt', png.getvalue()) is None
+    assert sorted(os.listdir(directory)) == [stored]  # rejected uploads leave nothing behind
+
+    photos.render_variants(str(directory / stored), {'thumb': 240, 'web': 1280})
+    with Image.open(directory / photos.variant_filename(stored, 'thumb')) as thumb:
+        assert thumb.format == 'JPEG' and thumb.size == (240, 135)
+    with Image.open(directory / photos.variant_filename(stored, 'web')) as web:
+        assert web.size == (1280, 720)
+
+
+BULK_ROW = dict(sender_name='Wanjiru', sender_phone='0712000001', receiver_name='Otieno',
+                receiver_phone='0733000002', origin_name='Nairobi', destination_name='Meru', price='350')
+
+
+def test_bulk_rows_are_parsed_as_a_stream_in_every_format():
+    import io
+    import json
+    from maua.parcels.intake import _iter_json_array, iter_rows
+
+    rows = [dict(BULK_ROW, sender_name=f'Sender {i}', note='a, "quoted" ] value') for i in range(5)]
+    document = json.dumps(rows, indent=2)
+    # Tiny reads split objects, strings and separators across chunk boundaries
+    assert list(_iter_json_array(io.StringIO(document), chunk_size=7)) == rows
+    with pytest.raises(ValueError, match='end of JSON array'):
+        list(_iter_json_array(io.StringIO(document[:-3]), chunk_size=7))
+    with pytest.raises(ValueError, match='Expected a JSON array'):
+        list(_iter_json_array(io.StringIO('{"a": 1}')))
+
+    jsonl = '\n'.join(json.dumps(row) for row in rows[:2]) + '\n\n'
+    assert list(iter_rows(io.BytesIO(jsonl.encode()), 'jsonl')) == rows[:2]
+
+    csv_text = '\ufeff sender_name ,sender_phone\r\nAmina,0712000003\r\n'
+    assert list(iter_rows(io.BytesIO(csv_text.encode('utf-8')), 'csv')) == [
+        {'sender_name': 'Amina', 'sender_phone': '0712000003'}
+    ]
+
+
+def test_bulk_intake_route_reports_bad_rows_and_saves_good_batches(app, monkeypatch):
+    import io
+    import json
+    from maua.parcels import intake
+    from maua.parcels.models import Parcel, ParcelEvent
+
+    queued = []
+    monkeypatch.setattr(intake, 'queue_batch_notifications', queued.extend)
+    client = staff_client(app)
+
+    bad = [BULK_ROW, dict(BULK_ROW, receiver_phone=''), dict(BULK_ROW, sender_name='x' * 121, price='abc')]
+    response = client.post('/staff/parcels/bulk', json=bad)
+    assert response.status_code == 400
+    assert response.get_json()['errors'] == [
+        {'row': 2, 'message': 'receiver_phone is required'},
+        {'row': 3, 'message': 'sender_name must be at most 120 characters'},
+        {'row': 3, 'message': 'price must be a number'},
+    ]
+    assert Parcel.query.count() == 0  # one bad row rejects the whole batch
+
+    response = client.post('/staff/parcels/bulk?payment_method=cash',
+                           data='\n'.join(json.dumps(dict(BULK_ROW, sender_name=f'S{i}')) for i in range(3)),
+                           content_type='application/x-ndjson', headers={'Accept': 'application/json'})
+    assert response.status_code == 201
+    body = response.get_json()
+    assert body['count'] == 3 and body['total'] == 1050.0
+    parcels = Parcel.query.order_by(Parcel.id).all()
+    assert [p.sender_name for p in parcels] == ['S0', 'S1', 'S2']
+    assert {p.status for p in parcels} == {'pending'}
+    assert parcels[0].sender_phone_normalized == '+254712000001'
+    assert ParcelEvent.query.count() == 3 and queued == [p.id for p in parcels]
+
+    csv_file = 'sender_name,sender_phone,receiver_name,receiver_phone,origin_name,destination_name,price\n' \
+               'Amina,0712000003,Baraka,0733000004,Nairobi,Meru,500\n'
+    response = client.post('/staff/parcels/bulk', data={
+        'payment_method': 'mpesa', 'batch_file': (io.BytesIO(csv_file.encode()), 'dropoff.csv'),
+    }, content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert Parcel.query.filter_by(sender_name='Amina').one().status == 'pending_payment'
+
+
+def _dispatch_trips(day):
+    """Two Nairobi-Meru trips (80 kg then 50 kg of cargo room) and one Nairobi-Nyeri trip (30 kg)"""
+    from datetime import datetime, time
+    from maua.catalog.models import Depot, Route, Trip, Vehicle
+
+    nairobi, meru, nyeri = Depot(name='CBD', town='Nairobi'), Depot(name='Stage', town='Meru'), \
+        Depot(name='Kimathi', town='Nyeri')
+    vehicles = [Vehicle(plate_no=plate, cargo_capacity_kg=kg) for plate, kg in
+                (('KAA 001A', 80), ('KAA 002A', 50), ('KAA 003A', 30))]
+    db.session.add_all([nairobi, meru, nyeri] + vehicles)
+    db.session.flush()
+    to_meru = Route(code='NRB-MRU', origin_depot_id=nairobi.id, destination_depot_id=meru.id)
+    to_nyeri = Route(code='NRB-NYR', origin_depot_id=nairobi.id, destination_depot_id=nyeri.id)
+    db.session.add_all([to_meru, to_nyeri])
+    db.session.flush()
+    trips = [Trip(route_id=route.id, vehicle_id=vehicle.id, depart_at=datetime.combine(day, time(hour)),
+                  base_fare=500, driver_name='Kamau')
+             for route, vehicle, hour in ((to_meru, vehicles[0], 7), (to_meru, vehicles[1], 9),
+                                          (to_nyeri, vehicles[2], 8))]
+    db.session.add_all(trips)
+    db.session.commit()
+    return trips
+
+
+def test_dispatch_packs_heaviest_first_per_lane_and_applies_once(app):
+    from datetime import date, datetime, timedelta
+    from maua.parcels.manifest import apply_dispatch, plan_dispatch
+    from maua.parcels.models import Parcel, ParcelEvent
+
+    day = date.today() + timedelta(days=1)
+    early, late, nyeri = _dispatch_trips(day)
+    weights = {'M1': 30, 'M2': 60, 'M3': 40, 'M4': None, 'M5': 200, 'N1': 25, 'N2': 10, 'K1': 5}
+    for code, kg in weights.items():
+        destination = {'M': 'meru', 'N': 'Kimathi', 'K': 'Kisumu'}[code[0]]
+        db.session.add(_parcel(f'P{code}', weight_kg=kg, destination_name=destination))
+    db.session.add(_parcel('PPAID', weight_kg=1, status='pending_payment'))
+    db.session.commit()
+
+    plan = plan_dispatch(day, now=datetime.combine(day, datetime.min.time()))
+    loads = {entry['trip'].id: [p.ref_code for p in entry['parcels']] for entry in plan['trips']}
+    # Heaviest first onto the earliest trip with room: 200 kg fits no vehicle, 60 takes the
+    # first trip, 40 the second, 30 then fits neither and the 1 kg default tops up the first
+    assert loads == {early.id: ['PM2', 'PM4'], late.id: ['PM3'], nyeri.id: ['PN1']}
+    assert sorted((p.ref_code, reason) for p, reason in plan['unassigned']) == [
+        ('PK1', 'No trip on this route'), ('PM1', 'No capacity left'),
+        ('PM5', 'Heavier than any vehicle'), ('PN2', 'No capacity left'),
+    ]
+
+    assert apply_dispatch(plan) == 4
+    assert apply_dispatch(plan) == 0  # already on their trips: nothing is written twice
+    assigned = Parcel.query.filter(Parcel.trip_id.isnot(None)).all()
+    assert {p.ref_code: p.vehicle_plate for p in assigned} == {
+        'PM2': 'KAA 001A', 'PM4': 'KAA 001A', 'PM3': 'KAA 002A', 'PN1': 'KAA 003A'}
+    assert ParcelEvent.query.filter_by(event_type='assigned').count() == 4
+
+    # Loads already on the trips count against capacity on the next plan
+    replan = plan_dispatch(day, now=datetime.combine(day, datetime.min.time()))
+    assert all(not entry['parcels'] for entry in replan['trips'])
+
+
+def test_cancelling_a_trip_returns_its_parcels_to_dispatch(app, monkeypatch):
+    from datetime import date, timedelta
+    from maua.catalog import lifecycle
+    from maua.parcels.models import Parcel, ParcelEvent
+
+    monkeypatch.setattr(lifecycle, 'queue_status_messages', lambda ids, status: None)
+    early, late, _ = _dispatch_trips(date.today() + timedelta(days=1))
+    on_trip = {
+        'PWAIT': ('pending', early), 'PMOVE': ('in_transit', early),
+        'PDONE': ('delivered', early), 'POTHER': ('pending', late),
+    }
+    for code, (status, trip) in on_trip.items():
+        db.session.add(_parcel(code, status=status, trip_id=trip.id, vehicle_plate='KAA 001A', driver_name='Kamau'))
+    db.session.commit()
+
+    assert lifecycle.change_trip_status([early.id], 'cancelled', actor_id=None)['parcels'] == 2
+    db.session.expire_all()
+    parcels = {p.ref_code: p for p in Parcel.query}
+    for code in ('PWAIT', 'PMOVE'):
+        assert (parcels[code].trip_id, parcels[code].status, parcels[code].vehicle_plate) == (None, 'pending', None)
+    assert parcels['PDONE'].trip_id == early.id and parcels['PDONE'].status == 'delivered'
+    assert parcels['POTHER'].trip_id == late.id
+
+    events = ParcelEvent.query.filter_by(event_type='unassigned').all()
+    assert sorted((e.parcel.ref_code, e.payload['from']) for e in events) == [('PMOVE', 'in_transit'),
+                                                                               ('PWAIT', 'pending')]
+    assert all(e.payload == dict(e.payload, trip_id=early.id, reason='trip_cancelled') for e in events)
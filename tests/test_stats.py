@@ -0,0 +1,58 @@
+from maua.extensions import db
+from maua.stats import counters
+
+
+def test_counters_follow_inserts_status_changes_and_deletes(app):
+    from datetime import datetime, timedelta
+    from maua.auth.models import User
+    from maua.booking.models import Booking
+    from maua.catalog.models import Depot, Route, Trip, Vehicle
+
+    from maua.stats.models import StatCounter
+
+    # Seeded when the schema was created, like the migration does
+    assert StatCounter.read(counters.COUNTERS) == {key: 0 for key in counters.COUNTERS}
+    assert counters.snapshot(*counters.COUNTERS) == {key: 0 for key in counters.COUNTERS}
+
+    staff = User(username='desk', email='desk@example.com', phone='0700000001', password_hash='x', is_staff=True)
+    nairobi, meru = Depot(name='CBD', town='Nairobi'), Depot(name='Stage', town='Meru')
+    db.session.add_all([staff, nairobi, meru, Vehicle(plate_no='KAA 001A')])
+    db.session.flush()
+    route = Route(code='NRB-MRU', origin_depot_id=nairobi.id, destination_depot_id=meru.id)
+    db.session.add(route)
+    db.session.flush()
+    trips = [Trip(route_id=route.id, vehicle_id=1, depart_at=datetime.utcnow() + timedelta(hours=h), base_fare=500)
+             for h in (1, 2, 3)]
+    db.session.add_all(trips)
+    db.session.flush()
+    db.session.add_all([Booking(trip_id=trips[0].id, seat_number=str(n), fare=500, reference=f'B{n}')
+                        for n in range(1, 5)])
+    db.session.commit()
+
+    trips[0].status = 'completed'
+    trips[1].status = 'in_progress'
+    route.active = False
+    db.session.delete(db.session.get(Booking, 1))
+    db.session.commit()
+
+    db.session.add(Depot(name='Town', town='Embu'))
+    db.session.rollback()  # rolled-back changes never reach the counters
+
+    expected = {key: counters.count_from_table(key) for key in counters.COUNTERS}
+    assert expected['trips_active'] == 2 and expected['bookings_total'] == 3
+    assert counters.snapshot(*counters.COUNTERS) == expected
+
+
+def test_snapshot_counts_missing_rows_without_writing(app):
+    from maua.catalog.models import Depot
+    from maua.stats.models import StatCounter
+
+    StatCounter.query.delete()
+    db.session.add_all([Depot(name='CBD', town='Nairobi'), Depot(name='Stage', town='Meru')])
+    db.session.commit()
+
+    assert counters.snapshot('depots_total', 'routes_active') == {'depots_total': 2, 'routes_active': 0}
+    assert StatCounter.query.count() == 0
+
+    counters.refresh()
+    assert StatCounter.read(['depots_total']) == {'depots_total': 2}